@@ -0,0 +1,986 @@
+"""Stand-in for the vboxmanage executable used by the benchmarks.
+
+Machines are kept in a JSON registry in ``$VBOX_USER_HOME``, and every change
+is also written to ``VirtualBox.xml`` and the machines' ``.vbox`` files the
+same way VirtualBox does, so drifter can read settings without calling
+vboxmanage. Only the subcommands and options drifter uses are emulated.
+
+The stand-in is configured through environment variables:
+
+    VBOX_USER_HOME          Folder holding the registry and settings files.
+    FAKE_VBOX_LATENCY       Seconds each call takes, e.g. ``0.05``. Per
+                            subcommand values can be given as well, e.g.
+                            ``0.05,startvm=1,clonemedium=0.5``.
+    FAKE_VBOX_LOG           File each call is appended to, as a JSON line.
+    FAKE_VBOX_ACPI_DELAY    Seconds a machine keeps running after an ACPI
+                            shutdown is requested.
+    FAKE_VBOX_BOOT_DELAY    Seconds a started machine takes to boot, before
+                            its SSH port sends a banner.
+    FAKE_VBOX_NO_SETTINGS   Don't write settings files, so drifter has to
+                            ask vboxmanage for everything.
+
+Like VirtualBox, every started machine gets a process of its own, named
+VBoxHeadless and given the machine's UUID, which exits once the machine is
+stopped. The process listens on the machine's forwarded SSH port, accepting
+connections right away but only sending an SSH banner once the machine has
+booted, and guest property "/VirtualBox/GuestInfo/Net/0/Status" turns "Up"
+at the same time.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from xml.sax.saxutils import quoteattr
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+REGISTRY_FILE = 'fake-registry.json'
+LOCK_FILE = 'fake-registry.lock'
+GLOBAL_SETTINGS_FILE = 'VirtualBox.xml'
+MACHINES_DIR = 'Machines'
+SESSIONS_DIR = 'fake-sessions'
+
+# Machine states that show up in `list runningvms`
+RUNNING_STATES = ['running', 'paused']
+
+PROTOCOLS = {'tcp': '1', 'udp': '0'}
+
+# Boot devices, as named in settings files
+BOOT_DEVICES = {'none': 'None', 'floppy': 'Floppy', 'dvd': 'DVD', 'disk': 'HardDisk', 'net': 'Network'}
+
+# Runs as a machine's process until its session file is removed or the time
+# written in it has passed, answering on the SSH port once it's booted
+SESSION_SCRIPT = '''
+import socket, sys, time
+port, ready_at, path = int(sys.argv[-3]), float(sys.argv[-2]), sys.argv[-1]
+server = None
+if port:
+    try:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', port))
+        server.listen(5)
+        server.settimeout(0.02)
+    except (IOError, OSError):
+        server = None
+while True:
+    try:
+        with open(path) as handle:
+            stop_at = float(handle.read() or 0)
+    except (IOError, OSError, ValueError):
+        break
+    if stop_at and time.time() >= stop_at:
+        break
+    if not server:
+        time.sleep(0.02)
+        continue
+    try:
+        conn = server.accept()[0]
+    except (IOError, OSError):
+        continue
+    try:
+        if time.time() >= ready_at:
+            conn.sendall(b'SSH-2.0-FakeVBox\\r\\n')
+    except (IOError, OSError):
+        pass
+    conn.close()
+'''
+
+
+class VBoxError(Exception):
+    """Exception to represent a failed vboxmanage command."""
+
+    pass
+
+
+def main(args):
+    """Respond to a vboxmanage command."""
+    started = time.time()
+    time.sleep(get_latency(args[0] if args else ''))
+
+    code = 0
+    try:
+        home = get_home()
+        with _lock(home):
+            registry = load_registry(home)
+            before = json.dumps(registry, sort_keys=True)
+
+            output = run(home, registry, args)
+
+            if json.dumps(registry, sort_keys=True) != before:
+                save_registry(home, registry)
+        for line in output:
+            print(line)
+    except VBoxError as e:
+        print('VBoxManage: error: {0}'.format(e))
+        code = 1
+
+    _log(args, started, code)
+
+    return code
+
+
+def run(home, registry, args):
+    """Run a command against the registry and return its output lines."""
+    if not args or args[0] not in COMMANDS:
+        raise VBoxError('Unsupported command: {0}'.format(' '.join(args)))
+
+    _update_states(home, registry)
+
+    return COMMANDS[args[0]](home, registry, args[1:]) or []
+
+
+def get_home():
+    """Get the folder holding the registry and settings files."""
+    home = os.environ.get('VBOX_USER_HOME', None)
+    if not home:
+        raise VBoxError('VBOX_USER_HOME must be set.')
+
+    return home
+
+
+def get_latency(command):
+    """Get how long a subcommand should take, in seconds."""
+    latency = 0.0
+    for part in os.environ.get('FAKE_VBOX_LATENCY', '').split(','):
+        if not part:
+            continue
+        if '=' not in part:
+            latency = float(part)
+            continue
+
+        name, value = part.split('=', 1)
+        if name == command:
+            return float(value)
+
+    return latency
+
+
+def load_registry(home):
+    """Load the registry, or an empty one if there isn't one yet."""
+    try:
+        with io.open(os.path.join(home, REGISTRY_FILE), 'r', encoding='utf-8') as handle:
+            return json.load(handle)
+    except (IOError, OSError):
+        return {'machines': {}, 'media': {}, 'parents': {}}
+
+
+def save_registry(home, registry, settings=None):
+    """Save the registry and write the settings files to match it."""
+    if not os.path.isdir(home):
+        os.makedirs(home)
+
+    _write(os.path.join(home, REGISTRY_FILE), json.dumps(registry, sort_keys=True, indent=4))
+
+    if settings is None:
+        settings = not os.environ.get('FAKE_VBOX_NO_SETTINGS', None)
+    if not settings:
+        return
+
+    for machine in registry['machines'].values():
+        _write(machine['cfgfile'], _render_machine(machine, registry['media']))
+
+    _write(os.path.join(home, GLOBAL_SETTINGS_FILE), _render_registry(home, registry))
+
+
+def add_machine(home, name, os_type='Ubuntu_64', state='poweroff', forwards=None, settings=True):
+    """Register a machine directly, e.g. to set up a benchmark."""
+    registry = load_registry(home)
+    run(home, registry, ['createvm', '--name', name, '--ostype', os_type, '--register'])
+
+    machine = registry['machines'][name]
+    machine['nics']['1'] = {'type': 'nat', 'mac': _random_mac()}
+    machine['forwards']['1'] = list(forwards or [])
+    machine['state'] = state
+
+    save_registry(home, registry, settings)
+
+    return machine
+
+
+def make_base(folder, os_type='Ubuntu_64', disks=1):
+    """Create a base machine folder like the ones drifter imports from."""
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    media = []
+    for index in range(disks):
+        path = os.path.join(folder, 'disk{0}.vmdk'.format(index + 1))
+        _write(path, 'fake disk {0}\n'.format(index + 1))
+        media.append('<HardDisk uuid="{{{0}}}" location={1} format="VMDK" type="Normal"/>'.format(
+            uuid.uuid4(), quoteattr(os.path.basename(path)),
+        ))
+
+    _write(os.path.join(folder, 'base.vbox'), '\n'.join([
+        '<?xml version="1.0"?>',
+        '<VirtualBox xmlns="http://www.virtualbox.org/" version="1.16-linux">',
+        '  <Machine uuid="{{{0}}}" name="base" OSType={1}>'.format(uuid.uuid4(), quoteattr(os_type)),
+        '    <MediaRegistry>',
+        '      <HardDisks>',
+    ] + ['        ' + disk for disk in media] + [
+        '      </HardDisks>',
+        '    </MediaRegistry>',
+        '  </Machine>',
+        '</VirtualBox>',
+        '',
+    ]))
+
+
+# Commands
+
+
+def _list(unused_home, registry, args):
+    if args[:1] == ['vms']:
+        names = sorted(registry['machines'])
+    elif args[:1] == ['runningvms']:
+        names = sorted(name for name, machine in registry['machines'].items()
+                       if machine['state'] in RUNNING_STATES)
+    elif args[:1] == ['hdds']:
+        return ['UUID: {0}\nLocation: {1}\n'.format(medium, path)
+                for path, medium in sorted(registry['media'].items())]
+    else:
+        raise VBoxError('Unknown list type: {0}'.format(' '.join(args)))
+
+    return ['"{0}" {{{1}}}'.format(name, registry['machines'][name]['uuid']) for name in names]
+
+
+def _showvminfo(unused_home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    if '--machinereadable' not in args:
+        raise VBoxError('Only --machinereadable output is supported.')
+
+    lines = [
+        'name="{0}"'.format(machine['name']),
+        'ostype="{0}"'.format(machine['ostype']),
+        'UUID="{0}"'.format(machine['uuid']),
+        'CfgFile="{0}"'.format(machine['cfgfile']),
+        'memory={0}'.format(machine['memory']),
+    ]
+    for index, device in enumerate(machine['boot']):
+        lines.append('boot{0}="{1}"'.format(index + 1, device))
+
+    forwards = 0
+    for slot in range(1, 9):
+        nic = machine['nics'].get(str(slot), None)
+        lines.append('nic{0}="{1}"'.format(slot, nic['type'] if nic else 'none'))
+        if not nic:
+            continue
+
+        lines.append('macaddress{0}="{1}"'.format(slot, nic['mac']))
+        for rule in machine['forwards'].get(str(slot), []):
+            lines.append('Forwarding({0})="{1}"'.format(forwards, rule))
+            forwards += 1
+
+    for index, (controller, details) in enumerate(sorted(machine['controllers'].items())):
+        lines.append('storagecontrollername{0}="{1}"'.format(index, controller))
+        lines.append('storagecontrollerportcount{0}="{1}"'.format(index, details['ports']))
+    for device, path in sorted(machine['attachments'].items()):
+        lines.append('"{0}"="{1}"'.format(device, path))
+        lines.append('"{0}-ImageUUID"="{1}"'.format(device, registry['media'].get(path, '')))
+
+    for key, snapshot in _get_snapshot_keys(machine):
+        lines.append('{0}="{1}"'.format(key, snapshot['name']))
+        lines.append('{0}="{1}"'.format(key.replace('Name', 'UUID'), snapshot['uuid']))
+        if snapshot['uuid'] == machine['current_snapshot']:
+            lines.append('CurrentSnapshotName="{0}"'.format(snapshot['name']))
+            lines.append('CurrentSnapshotUUID="{0}"'.format(snapshot['uuid']))
+            lines.append('CurrentSnapshotNode="{0}"'.format(key))
+
+    lines.append('VMState="{0}"'.format(machine['state']))
+
+    return lines
+
+
+def _createvm(home, registry, args):
+    options = _parse_options(args)
+    machine = _new_machine(home, registry, options)
+    machine['ostype'] = options.get('--ostype', 'Other')
+
+    return [
+        'Virtual machine \'{0}\' is created and registered.'.format(machine['name']),
+        'UUID: {0}'.format(machine['uuid']),
+        'Settings file: \'{0}\''.format(machine['cfgfile']),
+    ]
+
+
+def _clonevm(home, registry, args):
+    source = _find_machine(registry, args[0] if args else None)
+    options = _parse_options(args[1:])
+    link = options.get('--options', None) == 'link'
+
+    snapshot = None
+    if '--snapshot' in options:
+        snapshot = _find_snapshot(source, options['--snapshot'])
+    elif link:
+        raise VBoxError('Linked clones can only be created from a snapshot.')
+
+    machine = _new_machine(home, registry, options)
+    for key in ['ostype', 'memory', 'boot', 'forwards', 'controllers', 'extra']:
+        machine[key] = json.loads(json.dumps(source[key]))
+    for slot, nic in source['nics'].items():
+        machine['nics'][slot] = {'type': nic['type'], 'mac': _random_mac()}
+
+    folder = os.path.dirname(machine['cfgfile'])
+    for device, path in (snapshot or source)['attachments'].items():
+        if link:
+            machine['attachments'][device] = _differencing(registry, path, folder)
+            continue
+
+        target = os.path.join(folder, os.path.basename(path))
+        _copy_medium(registry, path, target)
+        machine['attachments'][device] = target
+
+    return ['Machine has been successfully cloned as "{0}"'.format(machine['name'])]
+
+
+def _snapshot(unused_home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    action = args[1] if len(args) > 1 else None
+    if action not in ('take', 'restore', 'delete') or len(args) < 3:
+        raise VBoxError('Unsupported snapshot command: {0}'.format(' '.join(args[1:])))
+
+    if action == 'restore':
+        return _restore_snapshot(registry, machine, _find_snapshot(machine, args[2]))
+    if action == 'delete':
+        return _delete_snapshot(machine, _find_snapshot(machine, args[2]))
+
+    name = args[2]
+    snapshot = {
+        'name': name,
+        'uuid': str(uuid.uuid4()),
+        'parent': machine['current_snapshot'],
+        'state': machine['state'],
+        'attachments': dict(machine['attachments']),
+    }
+    machine['snapshots'].append(snapshot)
+    machine['current_snapshot'] = snapshot['uuid']
+
+    # Like VirtualBox, keep the snapshot's disks as they are and write any
+    # later changes to new differencing disks
+    folder = os.path.join(os.path.dirname(machine['cfgfile']), 'Snapshots')
+    for device, path in machine['attachments'].items():
+        machine['attachments'][device] = _differencing(registry, path, folder)
+
+    return ['Snapshot taken. UUID: {0}'.format(snapshot['uuid'])]
+
+
+def _modifyvm(unused_home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    _require_unlocked(machine)
+    if machine['state'] == 'saved':
+        raise VBoxError('The machine is not mutable (state is Saved)')
+
+    args = [str(arg) for arg in args[1:]]
+    while args:
+        option = args.pop(0)
+        if not option.startswith('--') or not args:
+            raise VBoxError('Invalid option: {0}'.format(option))
+
+        value = args.pop(0)
+        if option == '--memory':
+            machine['memory'] = int(value)
+        elif option.startswith('--boot'):
+            machine['boot'][int(option[6:]) - 1] = value
+        elif option.startswith('--nic'):
+            slot = option[5:]
+            if value == 'none':
+                machine['nics'].pop(slot, None)
+            else:
+                machine['nics'].setdefault(slot, {'mac': _random_mac()})['type'] = value
+        elif option.startswith('--macaddress'):
+            slot = option[12:]
+            nic = machine['nics'].setdefault(slot, {'type': 'nat'})
+            nic['mac'] = _random_mac() if value == 'auto' else value.replace(':', '').upper()
+        elif option.startswith('--natpf'):
+            _natpf(machine, option[7:], value, args)
+        else:
+            machine['extra'][option[2:]] = value
+
+
+def _natpf(machine, slot, value, args):
+    rules = machine['forwards'].setdefault(slot, [])
+    if value == 'delete':
+        if not args:
+            raise VBoxError('Missing rule name to delete.')
+        name = args.pop(0)
+        remaining = [rule for rule in rules if rule.split(',')[0] != name]
+        if len(remaining) == len(rules):
+            raise VBoxError('Port forwarding rule "{0}" not found.'.format(name))
+        machine['forwards'][slot] = remaining
+        return
+
+    parts = value.split(',')
+    if len(parts) != 6 or parts[1] not in PROTOCOLS:
+        raise VBoxError('Invalid port forwarding rule: {0}'.format(value))
+    if any(rule.split(',')[0] == parts[0] for rule in rules):
+        raise VBoxError('A port forwarding rule named "{0}" already exists.'.format(parts[0]))
+    rules.append(value)
+
+
+def _storagectl(unused_home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    _require_unlocked(machine)
+
+    options = _parse_options(args[1:])
+    name = options.get('--name', None)
+    if not name:
+        raise VBoxError('A controller name is required.')
+
+    if '--remove' in options:
+        machine['controllers'].pop(name, None)
+        for device in list(machine['attachments']):
+            if device.startswith(name + '-'):
+                del machine['attachments'][device]
+        return
+
+    if name in machine['controllers']:
+        raise VBoxError('Storage controller "{0}" already exists.'.format(name))
+
+    machine['controllers'][name] = {
+        'type': options.get('--add', 'sata'),
+        'ports': int(options.get('--portcount', 1)),
+    }
+
+
+def _clonemedium(unused_home, registry, args):
+    if len(args) < 3 or args[0] != 'disk':
+        raise VBoxError('Usage: clonemedium disk <source> <target>')
+
+    source, target = args[1], args[2]
+    if not os.path.isfile(source):
+        raise VBoxError('Could not find file for the medium "{0}".'.format(source))
+    medium = _copy_medium(registry, source, target)
+
+    return ['Clone medium created in format \'VMDK\'. UUID: {0}'.format(medium)]
+
+
+def _closemedium(unused_home, registry, args):
+    if len(args) < 2 or args[0] != 'disk':
+        raise VBoxError('Usage: closemedium disk <path> [--delete]')
+
+    path = args[1]
+    for machine in registry['machines'].values():
+        if path in _get_media(machine):
+            raise VBoxError('Medium "{0}" is attached to "{1}".'.format(path, machine['name']))
+    _require_no_children(registry, [path])
+
+    if registry['media'].pop(path, None) is None and not os.path.exists(path):
+        raise VBoxError('Could not find file for the medium "{0}".'.format(path))
+
+    if '--delete' in args and os.path.exists(path):
+        os.remove(path)
+
+
+def _storageattach(unused_home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    _require_unlocked(machine)
+
+    options = _parse_options(args[1:])
+    controller = machine['controllers'].get(options.get('--storagectl', None), None)
+    if not controller:
+        raise VBoxError('Could not find a controller named "{0}".'.format(options.get('--storagectl', '')))
+
+    port = int(options.get('--port', 0))
+    if port >= controller['ports']:
+        raise VBoxError('Port {0} is out of range.'.format(port))
+
+    device = '{0}-{1}-{2}'.format(options['--storagectl'], port, options.get('--device', 0))
+    medium = options.get('--medium', 'none')
+    if medium == 'none':
+        machine['attachments'].pop(device, None)
+        return
+
+    if not os.path.isfile(medium):
+        raise VBoxError('Could not find file for the medium "{0}".'.format(medium))
+
+    registry['media'].setdefault(medium, str(uuid.uuid4()))
+    machine['attachments'][device] = medium
+
+
+def _startvm(home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    if machine['state'] in RUNNING_STATES:
+        raise VBoxError('The machine "{0}" is already locked by a session.'.format(machine['name']))
+
+    # Saved machines continue where they left off instead of booting
+    delay = 0 if machine['state'] == 'saved' else float(os.environ.get('FAKE_VBOX_BOOT_DELAY', 0) or 0)
+    machine['ready_at'] = time.time() + delay
+
+    machine['state'] = 'running'
+    machine['stop_at'] = None
+    _start_session(home, machine)
+
+    return ['VM "{0}" has been successfully started.'.format(machine['name'])]
+
+
+def _controlvm(home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    action = args[1] if len(args) > 1 else None
+    if machine['state'] not in RUNNING_STATES:
+        raise VBoxError('Machine "{0}" is not currently running.'.format(machine['name']))
+
+    if action == 'acpipowerbutton':
+        delay = float(os.environ.get('FAKE_VBOX_ACPI_DELAY', 0) or 0)
+        if delay <= 0:
+            machine['state'] = 'poweroff'
+        elif not machine['stop_at']:
+            machine['stop_at'] = time.time() + delay
+            _write(_get_session_path(home, machine), str(machine['stop_at']))
+    elif action == 'poweroff':
+        machine['state'] = 'poweroff'
+    elif action == 'savestate':
+        machine['state'] = 'saved'
+    elif action == 'pause':
+        machine['state'] = 'paused'
+    elif action == 'resume':
+        machine['state'] = 'running'
+    else:
+        raise VBoxError('Unsupported action: {0}'.format(action))
+
+    if machine['state'] not in RUNNING_STATES:
+        machine['stop_at'] = None
+        _end_session(home, machine)
+
+
+def _unregistervm(unused_home, registry, args):
+    machine = _find_machine(registry, args[0] if args else None)
+    _require_unlocked(machine)
+
+    media = _get_media(machine)
+    if '--delete' in args:
+        _require_no_children(registry, media)
+
+    del registry['machines'][machine['name']]
+
+    if '--delete' not in args:
+        return
+
+    for path in media:
+        registry['media'].pop(path, None)
+        registry['parents'].pop(path, None)
+        if os.path.exists(path):
+            os.remove(path)
+
+    folder = os.path.dirname(machine['cfgfile'])
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+
+
+def _guestproperty(home, registry, args):
+    if args[:1] != ['get'] or len(args) < 3:
+        raise VBoxError('Unsupported guestproperty command: {0}'.format(' '.join(args)))
+
+    machine = _find_machine(registry, args[1])
+    if args[2] != '/VirtualBox/GuestInfo/Net/0/Status' or machine['state'] not in RUNNING_STATES:
+        return ['No value set!']
+
+    return ['Value: {0}'.format('Up' if time.time() >= machine.get('ready_at', 0) else 'Down')]
+
+
+COMMANDS = {
+    'list': _list,
+    'showvminfo': _showvminfo,
+    'createvm': _createvm,
+    'clonevm': _clonevm,
+    'snapshot': _snapshot,
+    'modifyvm': _modifyvm,
+    'storagectl': _storagectl,
+    'clonemedium': _clonemedium,
+    'closemedium': _closemedium,
+    'storageattach': _storageattach,
+    'startvm': _startvm,
+    'controlvm': _controlvm,
+    'guestproperty': _guestproperty,
+    'unregistervm': _unregistervm,
+}
+
+
+# Helpers
+
+
+def _find_machine(registry, name):
+    if name in registry['machines']:
+        return registry['machines'][name]
+
+    for machine in registry['machines'].values():
+        if machine['uuid'] == (name or '').strip('{}'):
+            return machine
+
+    raise VBoxError('Could not find a registered machine named \'{0}\''.format(name))
+
+
+def _new_machine(home, registry, options):
+    name = options.get('--name', None)
+    if not name:
+        raise VBoxError('A name is required.')
+    if name in registry['machines']:
+        raise VBoxError('Machine settings file for "{0}" already exists.'.format(name))
+    if '--register' not in options:
+        raise VBoxError('Only registered machines are supported.')
+
+    folder = os.path.join(home, MACHINES_DIR, name)
+    machine = {
+        'name': name,
+        'uuid': str(uuid.uuid4()),
+        'ostype': 'Other',
+        'cfgfile': os.path.join(folder, name + '.vbox'),
+        'state': 'poweroff',
+        'stop_at': None,
+        'memory': 128,
+        'boot': ['floppy', 'dvd', 'disk', 'none'],
+        'nics': {},
+        'forwards': {},
+        'controllers': {},
+        'attachments': {},
+        'snapshots': [],
+        'current_snapshot': None,
+        'extra': {},
+    }
+    registry['machines'][name] = machine
+
+    return machine
+
+
+def _restore_snapshot(registry, machine, snapshot):
+    _require_unlocked(machine)
+
+    # The current disks are thrown away and new differencing disks made on
+    # top of the snapshot's
+    kept = set()
+    for other in machine['snapshots']:
+        kept.update(other['attachments'].values())
+    for path in machine['attachments'].values():
+        if path not in kept:
+            registry['media'].pop(path, None)
+            registry['parents'].pop(path, None)
+            if os.path.exists(path):
+                os.remove(path)
+
+    folder = os.path.join(os.path.dirname(machine['cfgfile']), 'Snapshots')
+    machine['attachments'] = dict(
+        (device, _differencing(registry, path, folder)) for device, path in snapshot['attachments'].items()
+    )
+    machine['current_snapshot'] = snapshot['uuid']
+    # Snapshots of running machines include their memory, so they're restored as saved
+    machine['state'] = 'saved' if snapshot['state'] in RUNNING_STATES + ['saved'] else 'poweroff'
+
+    return ['Restoring snapshot \'{0}\' ({1})'.format(snapshot['name'], snapshot['uuid'])]
+
+
+def _delete_snapshot(machine, snapshot):
+    for other in machine['snapshots']:
+        if other['parent'] == snapshot['uuid']:
+            other['parent'] = snapshot['parent']
+    if machine['current_snapshot'] == snapshot['uuid']:
+        machine['current_snapshot'] = snapshot['parent']
+    machine['snapshots'].remove(snapshot)
+
+    return ['Deleting snapshot \'{0}\' ({1})'.format(snapshot['name'], snapshot['uuid'])]
+
+
+def _get_snapshot_keys(machine):
+    """Get the keys showvminfo lists snapshots under, by snapshot."""
+    keys = []
+
+    def _add(parent, prefix):
+        children = [snapshot for snapshot in machine['snapshots'] if snapshot['parent'] == parent]
+        for index, snapshot in enumerate(children):
+            key = prefix if parent is None else '{0}-{1}'.format(prefix, index + 1)
+            keys.append((key, snapshot))
+            _add(snapshot['uuid'], key)
+
+    _add(None, 'SnapshotName')
+
+    return keys
+
+
+def _find_snapshot(machine, name):
+    for snapshot in machine['snapshots']:
+        if name in (snapshot['name'], snapshot['uuid']):
+            return snapshot
+
+    raise VBoxError('Could not find a snapshot named \'{0}\''.format(name))
+
+
+def _get_media(machine):
+    """Get every disk a machine uses, including those of its snapshots."""
+    media = set(machine['attachments'].values())
+    for snapshot in machine['snapshots']:
+        media.update(snapshot['attachments'].values())
+
+    return sorted(media)
+
+
+def _copy_medium(registry, source, target):
+    if os.path.exists(target) or target in registry['media']:
+        raise VBoxError('Cannot register the hard disk "{0}" because it already exists.'.format(target))
+
+    folder = os.path.dirname(target)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    shutil.copyfile(source, target)
+
+    medium = str(uuid.uuid4())
+    registry['media'][target] = medium
+
+    return medium
+
+
+def _differencing(registry, parent, folder):
+    """Create a differencing disk on top of another disk."""
+    medium = str(uuid.uuid4())
+    path = os.path.join(folder, '{{{0}}}.vdi'.format(medium))
+    _write(path, 'differencing disk of {0}\n'.format(parent))
+
+    registry['media'][path] = medium
+    registry['parents'][path] = parent
+
+    return path
+
+
+def _require_no_children(registry, media):
+    for path, parent in registry['parents'].items():
+        if parent in media and path not in media:
+            raise VBoxError('Cannot delete the medium \'{0}\' because it has differencing child hard disks'.format(
+                parent,
+            ))
+
+
+def _require_unlocked(machine):
+    if machine['state'] in RUNNING_STATES:
+        raise VBoxError('The machine \'{0}\' is already locked for a session (or being unlocked)'.format(
+            machine['name'],
+        ))
+
+
+def _update_states(home, registry):
+    """Finish ACPI shutdowns whose delay has passed."""
+    now = time.time()
+    for machine in registry['machines'].values():
+        if machine.get('stop_at', None) and machine['stop_at'] <= now:
+            machine['state'] = 'poweroff'
+            machine['stop_at'] = None
+            _end_session(home, machine)
+
+
+def _get_session_path(home, machine):
+    return os.path.join(home, SESSIONS_DIR, machine['uuid'])
+
+
+def _start_session(home, machine):
+    """Start a process for a machine, like VirtualBox does."""
+    path = _get_session_path(home, machine)
+    _write(path, '0')
+
+    ssh_port = 0
+    for rule in machine['forwards'].get('1', []):
+        parts = rule.split(',')
+        if parts[5] == '22':
+            ssh_port = int(parts[3])
+
+    with open(os.devnull, 'r+b') as devnull:
+        subprocess.Popen(
+            ['VBoxHeadless', '-c', SESSION_SCRIPT, '--comment', machine['name'], '--startvm', machine['uuid'],
+             str(ssh_port), str(machine.get('ready_at', 0)), path],
+            executable=sys.executable, stdin=devnull, stdout=devnull, stderr=devnull, close_fds=True,
+        )
+
+
+def _end_session(home, machine):
+    """Make a machine's process exit."""
+    try:
+        os.remove(_get_session_path(home, machine))
+    except OSError:
+        pass
+
+
+def _parse_options(args):
+    options = {}
+    args = [str(arg) for arg in args]
+    while args:
+        option = args.pop(0)
+        if args and not args[0].startswith('--'):
+            options[option] = args.pop(0)
+        else:
+            options[option] = True
+
+    return options
+
+
+def _random_mac():
+    return '080027{0:06X}'.format(random.randint(0, 0xFFFFFF))
+
+
+def _render_registry(home, registry):
+    entries = []
+    for name, machine in sorted(registry['machines'].items()):
+        entries.append('      <MachineEntry uuid="{{{0}}}" src={1}/>'.format(
+            machine['uuid'], quoteattr(os.path.relpath(machine['cfgfile'], home)),
+        ))
+
+    return '\n'.join([
+        '<?xml version="1.0"?>',
+        '<VirtualBox xmlns="http://www.virtualbox.org/" version="1.16-linux">',
+        '  <Global>',
+        '    <MachineRegistry>',
+    ] + entries + [
+        '    </MachineRegistry>',
+        '  </Global>',
+        '</VirtualBox>',
+        '',
+    ])
+
+
+def _render_machine(machine, media):
+    disks = []
+    for path in _get_media(machine):
+        disks.append('        <HardDisk uuid="{{{0}}}" location={1} format="VMDK" type="Normal"/>'.format(
+            media.get(path, ''), quoteattr(path),
+        ))
+
+    adapters = []
+    for slot in range(8):
+        nic = machine['nics'].get(str(slot + 1), None)
+        if not nic:
+            adapters.append('        <Adapter slot="{0}" enabled="false"/>'.format(slot))
+            continue
+
+        adapters.append('        <Adapter slot="{0}" enabled="true" MACAddress="{1}" type="82540EM">'.format(
+            slot, nic['mac'],
+        ))
+        if nic['type'] != 'nat':
+            adapters.append('        </Adapter>')
+            continue
+
+        adapters.append('          <NAT>')
+        for rule in machine['forwards'].get(str(slot + 1), []):
+            parts = rule.split(',')
+            attrs = [('name', parts[0]), ('proto', PROTOCOLS[parts[1]]), ('hostip', parts[2]),
+                     ('hostport', parts[3]), ('guestip', parts[4]), ('guestport', parts[5])]
+            adapters.append('            <Forwarding {0}/>'.format(
+                ' '.join('{0}={1}'.format(key, quoteattr(value)) for key, value in attrs if value),
+            ))
+        adapters.append('          </NAT>')
+        adapters.append('        </Adapter>')
+
+    controllers = []
+    for name, details in sorted(machine['controllers'].items()):
+        controllers.append('      <StorageController name={0} type="AHCI" PortCount="{1}">'.format(
+            quoteattr(name), details['ports'],
+        ))
+        for device, path in sorted(machine['attachments'].items()):
+            if not device.startswith(name + '-'):
+                continue
+            port, number = device[len(name) + 1:].split('-')
+            controllers.append('        <AttachedDevice type="HardDisk" port="{0}" device="{1}">'.format(port, number))
+            controllers.append('          <Image uuid="{{{0}}}"/>'.format(media.get(path, '')))
+            controllers.append('        </AttachedDevice>')
+        controllers.append('      </StorageController>')
+
+    return '\n'.join([
+        '<?xml version="1.0"?>',
+        '<VirtualBox xmlns="http://www.virtualbox.org/" version="1.16-linux">',
+        '  <Machine uuid="{{{0}}}" name={1} OSType={2}{3}{4}>'.format(
+            machine['uuid'], quoteattr(machine['name']), quoteattr(machine['ostype']),
+            ' currentSnapshot="{{{0}}}"'.format(machine['current_snapshot']) if machine['current_snapshot'] else '',
+            # Saved machines point to the file holding their memory
+            ' stateFile="Snapshots/{0}.sav"'.format(machine['uuid']) if machine['state'] == 'saved' else '',
+        ),
+        '    <MediaRegistry>',
+        '      <HardDisks>',
+    ] + disks + [
+        '      </HardDisks>',
+        '    </MediaRegistry>',
+    ] + _render_snapshots(machine, None, '    ') + [
+        '    <Hardware>',
+        '      <Memory RAMSize="{0}"/>'.format(machine['memory']),
+        '      <Boot>',
+    ] + [
+        '        <Order position="{0}" device="{1}"/>'.format(index + 1, BOOT_DEVICES[device])
+        for index, device in enumerate(machine['boot'])
+    ] + [
+        '      </Boot>',
+        '      <Network>',
+    ] + adapters + [
+        '      </Network>',
+        '    </Hardware>',
+        '    <StorageControllers>',
+    ] + controllers + [
+        '    </StorageControllers>',
+        '  </Machine>',
+        '</VirtualBox>',
+        '',
+    ])
+
+
+def _render_snapshots(machine, parent, indent):
+    lines = []
+    for snapshot in machine['snapshots']:
+        if snapshot['parent'] != parent:
+            continue
+
+        lines.append('{0}<Snapshot uuid="{{{1}}}" name={2}>'.format(
+            indent, snapshot['uuid'], quoteattr(snapshot['name']),
+        ))
+        children = _render_snapshots(machine, snapshot['uuid'], indent + '    ')
+        if children:
+            lines += ['{0}  <Snapshots>'.format(indent)] + children + ['{0}  </Snapshots>'.format(indent)]
+        lines.append('{0}</Snapshot>'.format(indent))
+
+    return lines
+
+
+def _write(path, data):
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+
+    temp = '{0}.{1}.tmp'.format(path, os.getpid())
+    with io.open(temp, 'w', encoding='utf-8') as handle:
+        handle.write(u'{0}'.format(data))
+    os.rename(temp, path)
+
+
+@contextmanager
+def _lock(home):
+    if not os.path.isdir(home):
+        os.makedirs(home)
+
+    with open(os.path.join(home, LOCK_FILE), 'a') as handle:
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def _log(args, started, code):
+    path = os.environ.get('FAKE_VBOX_LOG', None)
+    if not path:
+        return
+
+    line = json.dumps({
+        'program': 'vboxmanage',
+        'args': args,
+        'pid': os.getpid(),
+        'start': started,
+        'end': time.time(),
+        'code': code,
+    }) + '\n'
+    # Appends this small are atomic, so concurrent calls don't mix
+    with io.open(path, 'a', encoding='utf-8') as handle:
+        handle.write(u'{0}'.format(line))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+"""Check that commands don't import modules they don't need.
+
+Runs each benchmark scenario and fails if a module it should not need, like
+watchdog or the XML parser, ended up in ``sys.modules``.
+
+    python benchmarks/imports.py
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from startup import SCENARIOS, make_project
+
+
+# Modules that must not be imported by any of the scenarios
+ALWAYS_FORBIDDEN = [
+    'defusedxml',
+    'pkg_resources',
+    'watchdog',
+    'xml.dom',
+    # drifter.yaml is only parsed when it changes
+    'yaml',
+]
+
+# Additional modules each scenario must not import
+FORBIDDEN = {
+    'help': ['configparser', 'difflib', 'subprocess'],
+    'list': ['configparser', 'difflib', 'subprocess'],
+    'status': [],
+    'ssh': [],
+    'rsync': [],
+}
+
+RUNNER = '''
+import atexit, json, os, sys
+
+def dump():
+    with open(os.environ['DRIFTER_MODULES_FILE'], 'w') as handle:
+        json.dump(sorted(sys.modules), handle)
+
+atexit.register(dump)
+sys.argv = ['drifter'] + sys.argv[1:]
+
+from drifter.cli import main
+main()
+'''
+
+
+def get_modules(args, project, env):
+    """Run drifter and return the modules it imported."""
+    handle, path = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+    try:
+        env = dict(env, DRIFTER_MODULES_FILE=path)
+        process = subprocess.Popen([sys.executable, '-c', RUNNER] + args, cwd=project, env=env,
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        out = process.communicate()[0]
+        if process.returncode != 0:
+            raise RuntimeError('"drifter {0}" failed:\n{1}'.format(' '.join(args), out.decode('utf-8')))
+
+        with io.open(path, 'r', encoding='utf-8') as modules:
+            return json.load(modules)
+    finally:
+        os.remove(path)
+
+
+def is_forbidden(module, forbidden):
+    """Check if a module or its parent package is forbidden."""
+    for name in forbidden:
+        if module == name or module.startswith(name + '.'):
+            return True
+
+    return False
+
+
+def main():
+    """Check every scenario."""
+    root = tempfile.mkdtemp(prefix='drifter-imports-')
+    failed = False
+    try:
+        project, env = make_project(root)
+        for name, args in SCENARIOS:
+            forbidden = ALWAYS_FORBIDDEN + FORBIDDEN.get(name, [])
+            # The first run builds the caches, which loads every command
+            get_modules(args, project, env)
+            modules = get_modules(args, project, env)
+            found = [module for module in modules if is_forbidden(module, forbidden)]
+            if found:
+                failed = True
+                print('{0:<8} FAIL  imported {1}'.format(name, ', '.join(found)))
+            else:
+                print('{0:<8} ok    {1} modules'.format(name, len(modules)))
+    finally:
+        shutil.rmtree(root)
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""Benchmark how long drifter takes to run common commands.
+
+Each scenario runs ``python -m drifter.cli`` in a throwaway project that has
+one machine, with vboxmanage, ssh, and rsync replaced by stand-ins so only
+drifter's own overhead is measured. The best wall time of each scenario is
+compared against ``baseline.json`` and the script exits non-zero if any of
+them regressed by more than the tolerance.
+
+Times are compared relative to how long a bare ``python -c 'import click'``
+takes, measured in the same run, so the baseline holds on faster or slower
+machines than the one it was recorded on. Scenarios that look regressed are
+measured once more before failing, since a busy machine can slow down every
+run of a scenario. With ``--report-only``, regressions are shown but only a
+failing command fails the script, for machines too busy to time reliably.
+
+    python benchmarks/startup.py              # compare against the baseline
+    python benchmarks/startup.py --save       # record a new baseline
+    python benchmarks/startup.py --report-only # never fail on times
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import fake_vboxmanage
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE_FILE = os.path.join(HERE, 'baseline.json')
+MACHINE = 'bench'
+
+# Import times can only be broken down by module on Python 3.7 and newer;
+# older versions either reject -X importtime or silently ignore it
+HAS_IMPORTTIME = sys.version_info >= (3, 7)
+
+# Startup every scenario pays, timed to make results comparable across machines
+REFERENCE = ['-c', 'import click']
+
+SCENARIOS = [
+    ('help', ['help']),
+    ('list', ['list']),
+    ('status', ['status', MACHINE]),
+    ('ssh', ['ssh', MACHINE, '-c', 'true']),
+    ('rsync', ['rsync', MACHINE]),
+]
+
+
+def make_project(root, settings=True):
+    """Create a project with one running machine and stand-in executables."""
+    project = os.path.join(root, 'project')
+    bin_dir = os.path.join(root, 'bin')
+    vbox_home = os.path.join(root, 'vbox')
+    os.makedirs(os.path.join(project, '.drifter'))
+    os.makedirs(bin_dir)
+
+    fake_vboxmanage.add_machine(vbox_home, MACHINE, state='running',
+                                forwards=['2222:22:tcp,tcp,127.0.0.1,2222,,22'], settings=settings)
+
+    with io.open(os.path.join(project, '.drifter', 'state.json'), 'w', encoding='utf-8') as handle:
+        handle.write(u'{0}'.format(json.dumps({
+            'selected': MACHINE,
+            'machines': {
+                MACHINE: {'name': MACHINE, 'provider': 'virtualbox'},
+            },
+        }, sort_keys=True, indent=4)))
+
+    with io.open(os.path.join(project, 'drifter.yaml'), 'w', encoding='utf-8') as handle:
+        handle.write(u'rsync:\n    remote: /tmp/bench/\n')
+
+    scripts = {
+        'vboxmanage': 'exec "{0}" "{1}" "$@"'.format(
+            sys.executable, os.path.join(HERE, 'fake_vboxmanage.py'),
+        ),
+        'ssh': 'exit 0',
+        'rsync': 'exit 0',
+    }
+    for name, body in scripts.items():
+        path = os.path.join(bin_dir, name)
+        with io.open(path, 'w', encoding='utf-8') as handle:
+            handle.write(u'#!/bin/sh\n{0}\n'.format(body))
+        os.chmod(path, 0o755)
+
+    env = dict(os.environ)
+    env.update({
+        'PATH': bin_dir + os.pathsep + env.get('PATH', ''),
+        'PYTHONPATH': ROOT + os.pathsep + env.get('PYTHONPATH', ''),
+        'DRIFTER_HOME': os.path.join(root, 'home'),
+        'VBOX_USER_HOME': vbox_home,
+    })
+    for name in ['DRIFTER_NAME', 'DRIFTER_PROFILE', 'DRIFTER_PROVIDER']:
+        env.pop(name, None)
+
+    return project, env
+
+
+def run(args, project, env, importtime=False):
+    """Run drifter once and return the elapsed time and its stderr."""
+    command = [sys.executable]
+    if importtime:
+        command += ['-X', 'importtime']
+    command += ['-m', 'drifter.cli'] + args
+
+    start = time.time()
+    process = subprocess.Popen(command, cwd=project, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    elapsed = time.time() - start
+
+    if process.returncode != 0:
+        raise RuntimeError('"drifter {0}" failed:\n{1}{2}'.format(
+            ' '.join(args), out.decode('utf-8'), err.decode('utf-8'),
+        ))
+
+    return elapsed, err.decode('utf-8')
+
+
+def run_reference(env):
+    """Start Python and import click, returning the elapsed time."""
+    start = time.time()
+    subprocess.check_call([sys.executable] + REFERENCE, env=env)
+    return time.time() - start
+
+
+def parse_imports(output):
+    """Get the cumulative import time of each top-level import, in seconds."""
+    imports = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+
+        name = parts[2][1:]
+        if name.startswith(' '):
+            # Nested import; it's counted in its parent
+            continue
+
+        imports[name.strip()] = int(parts[1]) / 1000000.0
+
+    return imports
+
+
+def benchmark(runs, top, names=None):
+    """Run the given scenarios, or all, and return the best times, in milliseconds.
+
+    The fastest run is used since slower runs only measure noise from
+    whatever else the machine was doing. The reference is timed between the
+    runs of every scenario, so it sees the same load, and its best time is
+    included as "reference".
+    """
+    root = tempfile.mkdtemp(prefix='drifter-bench-')
+    results = {}
+    references = []
+    try:
+        project, env = make_project(root)
+        for name, args in SCENARIOS:
+            if names is not None and name not in names:
+                continue
+
+            # Warm up so the caches are built
+            run(args, project, env)
+            run_reference(env)
+
+            times = []
+            for _ in range(runs):
+                references.append(run_reference(env))
+                times.append(run(args, project, env)[0])
+            results[name] = round(min(times) * 1000, 1)
+
+            slowest = []
+            if top and HAS_IMPORTTIME:
+                imports = parse_imports(run(args, project, env, importtime=True)[1])
+                slowest = sorted(imports.items(), key=lambda item: -item[1])[:top]
+
+            print('{0:<8} {1:>8.1f} ms'.format(name, results[name]))
+            for module, elapsed in slowest:
+                print('    {0:>8.1f} ms  {1}'.format(elapsed * 1000, module))
+    finally:
+        shutil.rmtree(root)
+
+    results['reference'] = round(min(references) * 1000, 1)
+    print('{0:<8} {1:>8.1f} ms  (python {2})'.format('reference', results['reference'], ' '.join(REFERENCE)))
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Compare results to the baseline and return a list of regressions.
+
+    Each time is divided by the reference time of its own run first.
+    """
+    regressions = []
+    for name, elapsed in sorted(results.items()):
+        expected = baseline.get(name, None)
+        if not expected or name == 'reference':
+            continue
+
+        relative = elapsed / results['reference']
+        expected_relative = expected / baseline['reference']
+        change = (relative - expected_relative) / expected_relative * 100
+        status = 'ok'
+        if change > tolerance:
+            status = 'REGRESSED'
+            regressions.append(name)
+
+        print('{0:<8} {1:>8.1f} ms {2:>5.2f}x  baseline {3:>8.1f} ms {4:>5.2f}x  {5:+6.1f}%  {6}'.format(
+            name, elapsed, relative, expected, expected_relative, change, status,
+        ))
+
+    return regressions
+
+
+def main():
+    """Run the benchmarks."""
+    parser = argparse.ArgumentParser(description='Benchmark drifter startup time.')
+    parser.add_argument('--runs', type=int, default=5, help='Timed runs per scenario.')
+    parser.add_argument('--top', type=int, default=5,
+                        help='Slowest imports to show per scenario, on Python 3.7 and newer.')
+    parser.add_argument('--tolerance', type=float, default=25.0,
+                        help='Allowed slowdown against the baseline, in percent.')
+    parser.add_argument('--report-only', action='store_true', help='Show regressions without failing.')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file to use.')
+    parser.add_argument('--save', action='store_true', help='Save the results as the new baseline.')
+    options = parser.parse_args()
+
+    results = benchmark(options.runs, options.top)
+
+    if options.save:
+        with io.open(options.baseline, 'w', encoding='utf-8') as handle:
+            handle.write(json.dumps(results, sort_keys=True, indent=4) + u'\n')
+        print('Baseline saved to {0}'.format(options.baseline))
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print('No baseline found; run with --save to create one.')
+        return 0
+
+    with io.open(options.baseline, 'r', encoding='utf-8') as handle:
+        baseline = json.load(handle)
+    if 'reference' not in baseline:
+        print('The baseline has no reference time; run with --save to record a new one.')
+        return 1
+
+    print('')
+    regressions = compare(results, baseline, options.tolerance)
+    if regressions and options.report_only:
+        print('\nSlower than the baseline: {0}'.format(', '.join(regressions)))
+        return 0
+
+    if regressions:
+        print('\nMeasuring {0} again...'.format(', '.join(regressions)))
+        results = benchmark(options.runs, 0, regressions)
+        print('')
+        regressions = compare(results, baseline, options.tolerance)
+
+    if regressions:
+        print('\nRegressed: {0}'.format(', '.join(regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
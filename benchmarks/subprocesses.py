@@ -0,0 +1,200 @@
+"""Check how many subprocesses drifter spawns and how long commands take.
+
+Runs a machine through its life cycle (up, status, ssh, rsync, halt, up
+again, suspend, resume, destroy), then creates linked clones, against the vboxmanage stand-in, in a project whose
+VirtualBox also has other machines with forwarded ports. Every call to
+vboxmanage takes ``--latency`` seconds, like a real one would, so the time
+of each step mostly depends on how many calls it makes and whether they
+run at the same time.
+
+The number of calls and the wall time of each step are compared against
+``subprocesses.json``. More calls than the baseline always fail, while
+times may regress by up to the tolerance. With ``--calls-only``, times are
+shown but never fail, for machines too busy to time reliably.
+
+    python benchmarks/subprocesses.py              # compare against the baseline
+    python benchmarks/subprocesses.py --save       # record a new baseline
+    python benchmarks/subprocesses.py --calls-only # only fail on more calls
+    python benchmarks/subprocesses.py --no-settings --baseline other.json
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import collections
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+import fake_vboxmanage
+
+from startup import make_project, run
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, 'subprocesses.json')
+MACHINE = 'web'
+
+# Stand-ins that log their calls next to vboxmanage's
+LOGGED_SCRIPT = 'echo \'{{"program": "{0}"}}\' >> "$FAKE_VBOX_LOG"\nexit 0'
+
+
+def get_scenarios(base):
+    """Get the steps of the life cycle, in order."""
+    return [
+        ('up', ['up', MACHINE, '--base', base, '--no-provision']),
+        ('status', ['status', MACHINE]),
+        ('ssh', ['ssh', MACHINE, '-c', 'true']),
+        ('rsync', ['rsync', MACHINE]),
+        ('halt', ['halt', MACHINE]),
+        ('up-again', ['up', MACHINE, '--base', base, '--no-provision']),
+        ('suspend', ['suspend', MACHINE]),
+        ('up-resume', ['up', MACHINE, '--base', base, '--no-provision']),
+        ('destroy', ['destroy', MACHINE, '-f']),
+        # The first linked clone creates the master; the second reuses it
+        ('up-linked', ['up', 'linked1', '--base', base, '--no-provision', '--linked-clone']),
+        ('up-linked-2', ['up', 'linked2', '--base', base, '--no-provision', '--linked-clone']),
+        ('destroy-linked', ['destroy', 'linked1', '-f']),
+    ]
+
+
+def setup(root, machines, latency, settings):
+    """Create the project, the base machine, and the other machines."""
+    project, env = make_project(root, settings)
+    env.update({
+        'FAKE_VBOX_LATENCY': latency,
+        'FAKE_VBOX_LOG': os.path.join(root, 'calls.log'),
+        'DRIFTER_NO_DAEMON': '1',
+    })
+    if not settings:
+        env['FAKE_VBOX_NO_SETTINGS'] = '1'
+
+    for name in ['ssh', 'rsync']:
+        with io.open(os.path.join(root, 'bin', name), 'w', encoding='utf-8') as handle:
+            handle.write(u'#!/bin/sh\n{0}\n'.format(LOGGED_SCRIPT.format(name)))
+
+    for index in range(machines):
+        port = 2300 + index
+        fake_vboxmanage.add_machine(env['VBOX_USER_HOME'], 'other{0}'.format(index), state='running', forwards=[
+            '{0}:22:tcp,tcp,127.0.0.1,{0},,22'.format(port),
+        ], settings=settings)
+
+    base = os.path.join(root, 'base')
+    fake_vboxmanage.make_base(base, disks=3)
+
+    return project, env, base
+
+
+def read_calls(path):
+    """Read and clear the log of calls made to the stand-ins."""
+    if not os.path.exists(path):
+        return []
+
+    with io.open(path, 'r', encoding='utf-8') as handle:
+        calls = [json.loads(line) for line in handle if line.strip()]
+    os.remove(path)
+
+    return calls
+
+
+def describe(call):
+    """Get a short name for a call, e.g. "vboxmanage list runningvms"."""
+    args = call.get('args', [])
+    words = args[:2] if args[:1] in (['list'], ['controlvm']) else args[:1]
+    if args[:1] == ['controlvm'] and len(args) > 2:
+        words = [args[0], args[2]]
+
+    return ' '.join([call['program']] + words)
+
+
+def benchmark(machines, latency, settings):
+    """Run every step and return its calls and time, in milliseconds."""
+    root = tempfile.mkdtemp(prefix='drifter-subprocesses-')
+    results = {}
+    try:
+        project, env, base = setup(root, machines, latency, settings)
+        for name, args in get_scenarios(base):
+            elapsed = run(args, project, env)[0]
+            calls = read_calls(env['FAKE_VBOX_LOG'])
+
+            results[name] = {'calls': len(calls), 'time': round(elapsed * 1000, 1)}
+
+            print('{0:<14} {1:>3} calls {2:>8.1f} ms'.format(name, len(calls), results[name]['time']))
+            counts = collections.Counter(describe(call) for call in calls)
+            for call, count in sorted(counts.items()):
+                print('    {0:>3}  {1}'.format(count, call))
+    finally:
+        shutil.rmtree(root)
+
+    return results
+
+
+def compare(results, baseline, tolerance, calls_only=False):
+    """Compare results to the baseline and return a list of regressions."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name, None)
+        if not expected:
+            continue
+
+        change = (result['time'] - expected['time']) / expected['time'] * 100
+        status = 'ok'
+        if result['calls'] > expected['calls']:
+            status = 'MORE CALLS'
+            regressions.append(name)
+        elif change > tolerance and calls_only:
+            status = 'slower'
+        elif change > tolerance:
+            status = 'REGRESSED'
+            regressions.append(name)
+
+        print('{0:<14} {1:>3} calls (baseline {2:>3}) {3:>8.1f} ms  baseline {4:>8.1f} ms  {5:+6.1f}%  {6}'.format(
+            name, result['calls'], expected['calls'], result['time'], expected['time'], change, status,
+        ))
+
+    return regressions
+
+
+def main():
+    """Run the checks."""
+    parser = argparse.ArgumentParser(description='Check the subprocesses drifter spawns.')
+    parser.add_argument('--machines', type=int, default=10, help='Other machines registered with VirtualBox.')
+    parser.add_argument('--latency', default='0.05',
+                        help='Seconds each vboxmanage call takes, like FAKE_VBOX_LATENCY, e.g. "0.05,startvm=1".')
+    parser.add_argument('--no-settings', dest='settings', action='store_false',
+                        help='Don\'t write VirtualBox settings files, so everything goes through vboxmanage.')
+    parser.add_argument('--tolerance', type=float, default=25.0,
+                        help='Allowed slowdown against the baseline, in percent.')
+    parser.add_argument('--calls-only', action='store_true', help='Only fail if a step makes more calls.')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline file to use.')
+    parser.add_argument('--save', action='store_true', help='Save the results as the new baseline.')
+    options = parser.parse_args()
+
+    results = benchmark(options.machines, options.latency, options.settings)
+
+    if options.save:
+        with io.open(options.baseline, 'w', encoding='utf-8') as handle:
+            handle.write(json.dumps(results, sort_keys=True, indent=4) + u'\n')
+        print('Baseline saved to {0}'.format(options.baseline))
+        return 0
+
+    if not os.path.exists(options.baseline):
+        print('No baseline found; run with --save to create one.')
+        return 0
+
+    with io.open(options.baseline, 'r', encoding='utf-8') as handle:
+        baseline = json.load(handle)
+
+    print('')
+    regressions = compare(results, baseline, options.tolerance, options.calls_only)
+    if regressions:
+        print('\nRegressed: {0}'.format(', '.join(regressions)))
+        return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,6 @@
 """The drifter package."""
+import os
+
+if os.environ.get('DRIFTER_PROFILE'):
+    from drifter import profiler
+    profiler.start()
@@ -0,0 +1,272 @@
+"""Store base machines once for every project on the host.
+
+Bases are copied into ~/.drifter/bases under a hash of their contents, so a
+base used by many projects, even from different folders, is only stored
+once. What providers learn about a base, like which disks it has, is kept
+next to it so it's only worked out the first time.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import os
+import time
+
+from drifter import cache
+from drifter.exceptions import InvalidArgumentException
+from drifter.lazy import lazy_import
+from drifter.utils import ensure_dir, file_lock, write_atomic
+
+
+# pylint: disable=invalid-name
+hashlib = lazy_import('hashlib')
+shutil = lazy_import('shutil')
+
+BASES_DIR = 'bases'
+INDEX_FILE = 'index.json'
+LOCK_FILE = 'index.lock'
+
+# Bytes read at a time when hashing
+CHUNK_SIZE = 1024 * 1024
+
+# Characters of an ID shown to users
+SHORT_ID_LENGTH = 12
+
+# Fewest characters of an ID accepted in place of the whole ID
+MIN_ID_LENGTH = 6
+
+HEX_DIGITS = frozenset('0123456789abcdef')
+
+
+def get_store_dir():
+    """Get the folder bases are stored in."""
+    return os.path.join(cache.get_home_dir(), BASES_DIR)
+
+
+class BaseStore(object):
+    """Keep one copy of every base, addressed by its contents."""
+
+    def __init__(self, folder=None):
+        """Set up the store in the given folder."""
+        self.folder = folder or get_store_dir()
+
+    def add(self, path):
+        """Add the base in a folder to the store and return its ID.
+
+        Bases are only hashed again after one of their files changed, and only
+        copied if the store doesn't already have the same contents.
+        """
+        path = os.path.realpath(path)
+        if not os.path.isdir(path):
+            raise InvalidArgumentException('Base directory "{0}" does not exist.'.format(path))
+
+        signature = _get_signature(path)
+        known = self._read_index().get(path, None)
+        if known and known['signature'] == signature and os.path.isdir(self.get_path(known['id'])):
+            return known['id']
+
+        logging.debug('Hashing base "%s"...', path)
+        base_id = _hash_folder(path)
+
+        if not os.path.isdir(self.get_path(base_id)):
+            logging.info('==> Copying base "%s" to the store...', path)
+            self._copy(path, base_id)
+
+        def _update_index(index):
+            index[path] = {'id': base_id, 'signature': signature}
+
+        def _update_info(info):
+            if path not in info['sources']:
+                info['sources'].append(path)
+
+        self._update_index(_update_index)
+        self._update_info(base_id, _update_info)
+
+        return base_id
+
+    def resolve(self, name):
+        """Get the full ID of a stored base from its ID or the start of it.
+
+        Only hex strings of at least MIN_ID_LENGTH characters are looked up,
+        so a mistyped path can't match a base by chance.
+        """
+        if not name or len(name) < MIN_ID_LENGTH or not set(name) <= HEX_DIGITS:
+            return None
+
+        matches = [base_id for base_id in self._list_ids() if base_id.startswith(name)]
+        if len(matches) > 1:
+            raise InvalidArgumentException('Base ID "{0}" is ambiguous.'.format(name))
+
+        return matches[0] if matches else None
+
+    def find(self, path):
+        """Get the ID of the stored base a folder belongs to, if any."""
+        path = os.path.realpath(path)
+        parent, base_id = os.path.split(path.rstrip(os.sep))
+        if parent != os.path.realpath(self.folder) or base_id not in self._list_ids():
+            return None
+
+        return base_id
+
+    def get_path(self, base_id):
+        """Get the folder of a stored base."""
+        return os.path.join(self.folder, base_id)
+
+    def get_metadata(self, base_id, provider):
+        """Get what a provider saved about a base, or None."""
+        return self._read_info(base_id)['metadata'].get(provider, None)
+
+    def set_metadata(self, base_id, provider, metadata):
+        """Save what a provider learned about a base."""
+        def _update(info):
+            info['metadata'][provider] = metadata
+
+        self._update_info(base_id, _update)
+
+    def touch(self, base_id):
+        """Record that a base was just used."""
+        def _update(info):
+            info['used'] = time.time()
+
+        self._update_info(base_id, _update)
+
+    def list(self):
+        """Get the details of every stored base."""
+        bases = []
+        for base_id in sorted(self._list_ids()):
+            info = self._read_info(base_id)
+            info['id'] = base_id
+            info['path'] = self.get_path(base_id)
+            bases.append(info)
+
+        return bases
+
+    def remove(self, base_id):
+        """Remove a base from the store."""
+        logging.debug('Removing base "%s"...', base_id)
+
+        with file_lock(os.path.join(self.folder, LOCK_FILE)):
+            shutil.rmtree(self.get_path(base_id), ignore_errors=True)
+            try:
+                os.remove(self._get_info_path(base_id))
+            except (IOError, OSError):
+                pass
+
+            index = self._read_index()
+            for path in [path for path, known in index.items() if known['id'] == base_id]:
+                del index[path]
+            self._write(os.path.join(self.folder, INDEX_FILE), index)
+
+    def prune(self, days):
+        """Remove bases that haven't been used in the given number of days."""
+        cutoff = time.time() - days * 86400
+        removed = []
+        for info in self.list():
+            if (info['used'] or info['added']) <= cutoff:
+                self.remove(info['id'])
+                removed.append(info['id'])
+
+        return removed
+
+    def _copy(self, path, base_id):
+        ensure_dir(self.folder)
+
+        # Copy to a temporary folder first so a half-copied base is never used
+        temp = os.path.join(self.folder, '.{0}.{1}.tmp'.format(base_id, os.getpid()))
+        shutil.rmtree(temp, ignore_errors=True)
+        try:
+            shutil.copytree(path, temp)
+            os.rename(temp, self.get_path(base_id))
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+            if not os.path.isdir(self.get_path(base_id)):
+                raise
+
+        def _update(info):
+            info['size'] = _get_size(self.get_path(base_id))
+
+        self._update_info(base_id, _update)
+
+    def _list_ids(self):
+        try:
+            names = os.listdir(self.folder)
+        except (IOError, OSError):
+            return []
+
+        return [name for name in names
+                if not name.startswith('.') and os.path.isdir(os.path.join(self.folder, name))]
+
+    def _get_info_path(self, base_id):
+        return os.path.join(self.folder, base_id + '.json')
+
+    def _read_info(self, base_id):
+        info = _read_json(self._get_info_path(base_id))
+        for key, value in [('added', time.time()), ('used', None), ('size', 0), ('sources', []), ('metadata', {})]:
+            info.setdefault(key, value)
+
+        return info
+
+    def _update_info(self, base_id, func):
+        with file_lock(os.path.join(self.folder, LOCK_FILE)):
+            info = self._read_info(base_id)
+            func(info)
+            self._write(self._get_info_path(base_id), info)
+
+    def _read_index(self):
+        return _read_json(os.path.join(self.folder, INDEX_FILE))
+
+    def _update_index(self, func):
+        with file_lock(os.path.join(self.folder, LOCK_FILE)):
+            index = self._read_index()
+            func(index)
+            self._write(os.path.join(self.folder, INDEX_FILE), index)
+
+    def _write(self, path, data):
+        write_atomic(path, json.dumps(data, sort_keys=True, indent=4).encode('utf-8'))
+
+
+def _read_json(path):
+    try:
+        with io.open(path, 'r', encoding='utf-8') as handle:
+            data = json.load(handle)
+    except (IOError, OSError, ValueError):
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+def _list_files(path):
+    files = []
+    for root, _, names in os.walk(path):
+        for name in names:
+            files.append(os.path.relpath(os.path.join(root, name), path))
+
+    return sorted(files)
+
+
+def _get_signature(path):
+    """Get the name, size, and modification time of every file in a folder."""
+    signature = []
+    for name in _list_files(path):
+        stat = os.stat(os.path.join(path, name))
+        signature.append([name, stat.st_size, stat.st_mtime])
+
+    return signature
+
+
+def _hash_folder(path):
+    """Hash the names and contents of every file in a folder."""
+    digest = hashlib.sha256()
+    for name in _list_files(path):
+        full_path = os.path.join(path, name)
+        digest.update('{0}\0{1}\0'.format(name.replace(os.sep, '/'), os.path.getsize(full_path)).encode('utf-8'))
+        with open(full_path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _get_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in _list_files(path))
@@ -0,0 +1,166 @@
+"""Persist data between drifter invocations."""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import os
+import time
+
+from drifter.utils import file_lock, write_atomic
+
+
+def get_home_dir():
+    """Get the user-level drifter directory.
+
+    Defaults to ~/.drifter but can be overridden with DRIFTER_HOME.
+    """
+    return os.environ.get('DRIFTER_HOME') or os.path.join(os.path.expanduser('~'), '.drifter')
+
+
+def get_cache_path(*parts):
+    """Get the path to a file in the cache directory."""
+    return os.path.join(get_home_dir(), 'cache', *parts)
+
+
+def load_json(path, key):
+    """Load cached data, but only if it was saved with the given key."""
+    try:
+        with io.open(path, 'r', encoding='utf-8') as handle:
+            data = json.load(handle)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if not isinstance(data, dict) or data.get('key') != key:
+        return None
+
+    return data.get('data', None)
+
+
+def save_json(path, key, data):
+    """Save data to the cache under the given key.
+
+    Failing to write the cache is not an error; it will be rebuilt next time.
+    """
+    try:
+        write_atomic(path, json.dumps({'key': key, 'data': data}, sort_keys=True).encode('utf-8'))
+    except (IOError, OSError, TypeError, ValueError) as e:
+        logging.debug('Unable to write cache file "%s": %s', path, e)
+
+
+class SharedCache(object):
+    """Cache data in a file shared by every drifter process.
+
+    Entries expire after the time to live given when reading them. Each key
+    also has a generation, bumped whenever the key is invalidated, and values
+    fetched before an invalidation are never stored or served after it. The
+    file is only read again when another process has changed it.
+    """
+
+    def __init__(self, path):
+        """Set up the cache stored in the given file."""
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.data = None
+        self.stat = None
+
+    def get(self, key, ttl):
+        """Get the value of an entry, or None if it's missing or expired."""
+        data = self._load()
+        entry = data['entries'].get(key, None)
+        if entry is None or entry['generation'] != data['generations'].get(key, 0):
+            return None
+
+        if time.time() - entry['time'] > ttl:
+            return None
+
+        return entry['value']
+
+    def get_generation(self, key):
+        """Get the generation of a key, to pass to set() after fetching its value."""
+        return self._load()['generations'].get(key, 0)
+
+    def set(self, key, value, generation):
+        """Store the value of an entry.
+
+        The value is dropped if the key was invalidated after the given
+        generation, i.e. while the value was being fetched.
+        """
+        self.set_many({key: value}, {key: generation})
+
+    def set_many(self, values, generations):
+        """Store the values of several entries at once, like set()."""
+        def _update(data):
+            changed = False
+            for key, value in values.items():
+                generation = generations[key]
+                if data['generations'].get(key, 0) != generation:
+                    continue
+
+                data['entries'][key] = {'time': time.time(), 'generation': generation, 'value': value}
+                changed = True
+
+            return changed
+
+        self._update(_update)
+
+    def invalidate(self, keys=None):
+        """Expire the given keys, or every key if none are given."""
+        def _update(data):
+            for key in list(data['entries'].keys()) if keys is None else keys:
+                data['generations'][key] = data['generations'].get(key, 0) + 1
+                data['entries'].pop(key, None)
+            return True
+
+        self._update(_update)
+
+    def forget(self):
+        """Drop what was read from the file, so it's read again on next use."""
+        self.data = None
+        self.stat = None
+
+    def _load(self):
+        stat = self._stat()
+        if self.data is not None and stat == self.stat:
+            return self.data
+
+        self.data = self._read()
+        self.stat = stat
+
+        return self.data
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except (IOError, OSError):
+            return None
+
+        # The file is replaced on every write, so a new inode means new data
+        return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+    def _read(self):
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as handle:
+                data = json.load(handle)
+            if isinstance(data.get('entries', None), dict) and isinstance(data.get('generations', None), dict):
+                return data
+        except (IOError, OSError, ValueError, AttributeError):
+            pass
+
+        return {'entries': {}, 'generations': {}}
+
+    def _update(self, func):
+        try:
+            with file_lock(self.lock_path):
+                data = self._read()
+                if func(data):
+                    write_atomic(self.path, json.dumps(data, sort_keys=True).encode('utf-8'))
+                self.stat = self._stat()
+        except (IOError, OSError, TypeError, ValueError) as e:
+            # Keep the change for this process at least
+            logging.debug('Unable to write cache file "%s": %s', self.path, e)
+            data = self._load()
+            func(data)
+            return
+
+        self.data = data
@@ -5,11 +5,16 @@ import logging
 import os
 import sys
 
-import click
-
-from drifter.commands import CommandLoader
+from drifter import completion, daemon
 from drifter.config import Config
 from drifter.exceptions import DrifterException
+from drifter.lazy import lazy_import
+
+
+# Shell completion is answered without loading click or any of the commands
+# pylint: disable=invalid-name
+click = lazy_import('click')
+commands = lazy_import('drifter.commands')
 
 
 # load the version
@@ -19,23 +24,70 @@ exec(open(os.path.join(os.path.abspath(os.path.dirname(__file__)), 'version.py')
 
 def main():
     """Start running drifter."""
+    if completion.is_requested():
+        completion.complete()
+        return
+
+    if _wants_profile(sys.argv[1:]) and not os.environ.get('DRIFTER_PROFILE'):
+        # Restart so the profile includes everything drifter imports
+        env = dict(os.environ, DRIFTER_PROFILE='1')
+        os.execve(sys.executable, [sys.executable, '-m', 'drifter.cli'] + sys.argv[1:], env)
+
+    if not os.environ.get('DRIFTER_PROFILE'):
+        code = daemon.forward(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
+
+    try:
+        sys.exit(execute())
+    finally:
+        if 'drifter.profiler' in sys.modules:
+            sys.modules['drifter.profiler'].finish()
+
+
+def execute(args=None, config=None, obj=None, prog_name=None):
+    """Run a drifter command and return its exit code."""
     try:
-        run()
+        run(args, config, obj, prog_name)
     except KeyboardInterrupt as e:
         print()
     except DrifterException as e:
         message = str(e)
         logging.error(click.style('ERROR: %s', bold=True, fg='red'), message)
-        sys.exit(1)
+        return 1
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+
+    return 0
+
+
+def _wants_profile(args):
+    """Check if the --profile option was given before the command name."""
+    for arg in args:
+        if arg == '--profile':
+            return True
+        if arg == '--' or not arg.startswith('-'):
+            return False
+
+    return False
+
 
+def run(args=None, config=None, obj=None, prog_name=None):
+    """Run the drifter command.
 
-def run():
-    """Run the drifter command."""
+    Defaults to the command line arguments and the project in the current
+    directory.
+    """
     logging.basicConfig(format='%(message)s', level=logging.INFO)
-    config = Config()
-    config.load_state()
+    if config is None:
+        config = Config()
+        config.load_state()
 
-    args = sys.argv[1:]
+    if args is None:
+        args = sys.argv[1:]
     extra = []
     try:
         pos = args.index('--')
@@ -44,9 +96,12 @@ def run():
     except ValueError:
         pass
 
-    @click.group(invoke_without_command=True, cls=CommandLoader)
+    @click.group(invoke_without_command=True, cls=commands.CommandLoader)
     # pylint: disable=undefined-variable
     @click.version_option(version=__version__, prog_name='Drifter', message='%(prog)s %(version)s')  # noqa: F821
+    # Handled in main(); declared so it is accepted and shows up in the help
+    @click.option('--profile', is_flag=True, expose_value=False, allow_from_autoenv=False,
+                  help='Write profiling data for this command.')
     @click.pass_context
     def cli(ctx):
         """Create development machines with ease."""
@@ -73,13 +128,16 @@ def run():
             with help_ctx:
                 help_ctx.command.invoke(help_ctx)
 
-    # pylint: disable=unexpected-keyword-arg, no-value-for-parameter
-    cli(
-        args=args,
-        obj={'extra': extra},
-        auto_envvar_prefix='DRIFTER',
-        help_option_names=['-h', '--help'],
-    )
+    # Commands can change the state many times; save it once at the end
+    with config.transaction():
+        # pylint: disable=unexpected-keyword-arg, no-value-for-parameter
+        cli(
+            args=args,
+            obj=dict(obj or {}, extra=extra),
+            prog_name=prog_name,
+            auto_envvar_prefix='DRIFTER',
+            help_option_names=['-h', '--help'],
+        )
 
 
 if __name__ == '__main__':
@@ -1,17 +1,29 @@
 """Shared command functions."""
 from __future__ import absolute_import, division, print_function
 
-import difflib
 import logging
 import os
 import sys
+import threading
 from functools import update_wrapper
 
 import click
 
-from pkg_resources import iter_entry_points
+import six
 
+from drifter import parallel, scheduler
+from drifter.exceptions import DrifterException, GenericException
+from drifter.lazy import lazy_import
 from drifter.providers import get_providers
+from drifter.registry import CommandRegistry, get_entry_points
+
+
+difflib = lazy_import('difflib')  # pylint: disable=invalid-name
+
+REGISTRY = CommandRegistry(os.path.dirname(__file__))
+
+# Machines to bring up at once, unless set otherwise
+DEFAULT_PARALLEL = 4
 
 
 def validate_name(ctx, name):
@@ -139,6 +151,117 @@ def burst_limit_option(func):
                         default=0, type=click.INT)(func)
 
 
+def parallel_option(func):
+    """Add parallel and serial options."""
+    def _serial_callback(ctx, unused_param, value):
+        ctx.meta['drifter.serial'] = value
+        return value
+
+    def _callback(ctx, unused_param, value):
+        if ctx.meta.get('drifter.serial', False):
+            return 1
+        if value is None:
+            value = ctx.obj['config'].get_default('parallel', DEFAULT_PARALLEL)
+        return value
+
+    func = click.option('--parallel', metavar='N', help='Number of machines to work on at once.',
+                        type=click.IntRange(1), default=None, callback=_callback)(func)
+    # Eager so it's known when --parallel is handled
+    return click.option('--serial', help='Work on one machine at a time.', is_flag=True, is_eager=True,
+                        expose_value=False, callback=_serial_callback)(func)
+
+
+def run_machines(machines, func, workers, dependencies=None):
+    """Call a function for each machine, several machines at once.
+
+    Machines are only worked on once the machines they depend on are done,
+    and are skipped if any of them failed. While several machines are worked
+    on, their log messages are prefixed by their name. Every machine is
+    worked on even if some fail; afterwards the failures are listed and an
+    exception is raised for all of them.
+    """
+    # Only tell machines apart when their messages can be mixed
+    label = six.text_type if workers > 1 and len(machines) > 1 else None
+
+    try:
+        with parallel.labelled_logs():
+            results, errors = parallel.run_ordered(func, machines, dependencies or {}, workers, label)
+    except ValueError as e:
+        raise GenericException('{0}'.format(e))
+
+    if not errors:
+        return results
+
+    failed = [machine for machine in machines if machine in errors]
+    unexpected = [machine for machine in failed if not isinstance(errors[machine][1], DrifterException)]
+    if len(machines) == 1 or unexpected:
+        six.reraise(*errors[(unexpected or failed)[0]])
+
+    for machine in machines:
+        if machine in errors:
+            logging.error(click.style('Machine "%s" failed: %s', fg='red'), machine, errors[machine][1])
+        elif machine not in results:
+            logging.warning(click.style('Machine "%s" was skipped; a machine it depends on failed.', fg='yellow'),
+                            machine)
+
+    raise GenericException('{0} of {1} machines failed: {2}'.format(len(failed), len(machines), ', '.join(failed)))
+
+
+def echo_machines(machines, func, workers):
+    """Echo the text a function returns for each machine, in the order of the machines.
+
+    Machines are worked on like run_machines(). Each machine's text is echoed
+    once it and every machine before it are done, so the output doesn't
+    depend on which machine finished first.
+    """
+    pending = list(machines)
+    texts = {}
+    lock = threading.Lock()
+
+    def _work(machine):
+        text = None
+        try:
+            text = func(machine)
+        finally:
+            with lock:
+                texts[machine] = text
+                while pending and pending[0] in texts:
+                    ready = texts.pop(pending.pop(0))
+                    if ready is not None:
+                        click.echo(ready)
+
+    return run_machines(machines, _work, workers)
+
+
+def up_machines(config, machines, func, workers):
+    """Call a function for each machine, after the machines it depends on.
+
+    Machines list the ones they depend on in their `depends_on` setting, and
+    ones with a higher `priority` are started first. While several machines
+    come up at once, they take turns booting so the host isn't overloaded.
+    """
+    dependencies = {}
+    priorities = {}
+    for machine in machines:
+        depends_on = config.get_machine_default(machine, 'depends_on', [])
+        if isinstance(depends_on, six.string_types):
+            depends_on = [depends_on]
+        dependencies[machine] = depends_on
+        priorities[machine] = int(config.get_machine_default(machine, 'priority', 0) or 0)
+
+    machines = sorted(machines, key=lambda machine: -priorities[machine])
+    if workers <= 1 or len(machines) <= 1:
+        return run_machines(machines, func, workers, dependencies)
+
+    boot_scheduler = scheduler.BootScheduler(
+        priorities,
+        config.get_default('boot.reserve_memory', scheduler.DEFAULT_RESERVE_MEMORY),
+        config.get_default('boot.max_load', scheduler.DEFAULT_MAX_LOAD),
+    )
+    with scheduler.scheduling(boot_scheduler):
+        return run_machines(machines, func, workers, dependencies)
+
+
 def confirm_destroy(name, abort=True):
     """Confirm the user wants to destroy the machine."""
     return click.confirm('Are you sure you want to destroy the "{0}" machine?'.format(name), abort=abort)
@@ -156,23 +279,12 @@ def pass_config(func):
 
 def get_commands():
     """Get available commands."""
-    commands = []
-    for filename in os.listdir(os.path.dirname(__file__)):
-        if filename.endswith('.py') and not filename.startswith('__'):
-            commands.append(filename[:-3].replace('_', '-'))
-
-    commands.sort()
-
-    return commands
+    return REGISTRY.names()
 
 
 def get_plugins():
     """Get available plugins."""
-    plugins = {}
-    for entry_point in iter_entry_points('drifter.plugins'):
-        plugins[entry_point.name] = entry_point
-
-    return plugins
+    return get_entry_points('drifter.plugins')
 
 
 class CommandLoader(click.MultiCommand):
@@ -180,7 +292,7 @@ class CommandLoader(click.MultiCommand):
 
     def list_commands(self, ctx):
         """Display available commands."""
-        return sorted(get_commands() + get_providers().keys() + get_plugins().keys())
+        return sorted(get_commands() + list(get_providers().keys()) + list(get_plugins().keys()))
 
     def get_command(self, ctx, cmd_name):
         """Get a command to execute."""
@@ -195,26 +307,7 @@ class CommandLoader(click.MultiCommand):
         return command
 
     def _get_command(self, cmd):
-        namespace = {}
-
-        folder = os.path.dirname(__file__)
-        filename = os.path.join(folder, cmd + '.py')
-        if not os.path.exists(filename):
-            return None
-
-        with open(filename) as handle:
-            code = compile(handle.read(), filename, 'exec')
-            # pylint: disable=eval-used
-            eval(code, namespace, namespace)
-
-        if cmd in namespace:
-            return namespace[cmd]
-
-        cmd = cmd + '_command'
-        if cmd in namespace:
-            return namespace[cmd]
-
-        return None
+        return REGISTRY.load(cmd)
 
     def _get_provider(self, cmd, cmd_name):
         providers = get_providers()
@@ -260,8 +353,8 @@ class CommandLoader(click.MultiCommand):
     def format_commands(self, ctx, formatter):
         """Format the commands into different output groups."""
         commands = []
-        for subcommand in sorted(get_commands() + get_plugins().keys()):
-            cmd = self.get_command(ctx, subcommand)
+        for subcommand in sorted(get_commands() + list(get_plugins().keys())):
+            cmd = REGISTRY.get_info(subcommand) or self.get_command(ctx, subcommand)
             if cmd is None:
                 continue
             if cmd.hidden:
@@ -0,0 +1,101 @@
+"""Manage the bases stored for every project."""
+from __future__ import absolute_import, division, print_function
+
+import logging
+import time
+
+import click
+
+import drifter.commands
+from drifter.bases import BaseStore, SHORT_ID_LENGTH
+from drifter.exceptions import InvalidArgumentException
+
+
+@click.group(name='base', invoke_without_command=True)
+@click.pass_context
+def base_command(ctx):
+    """Manage stored base machines."""
+    if not ctx.invoked_subcommand:
+        click.echo(ctx.get_help())
+
+
+@base_command.command(name='list')
+@drifter.commands.verbosity_options
+def list_command():
+    """List stored bases."""
+    bases = BaseStore().list()
+    if not bases:
+        logging.info('No bases stored. Run `drifter base add` to add one.')
+        return
+
+    output = [['ID', 'Size', 'Last used', 'Sources']]
+    for base in bases:
+        output.append([
+            base['id'][:SHORT_ID_LENGTH],
+            _format_size(base['size']),
+            _format_time(base['used']),
+            ', '.join(base['sources']),
+        ])
+
+    click.echo('')
+
+    widths = [max(len(row[column]) for row in output) for column in range(3)]
+    for row in output:
+        click.echo('  {0:{4}}  {1:>{5}}  {2:{6}}  {3}'.format(*(row + widths)))
+
+    click.echo('')
+
+
+@base_command.command()
+@click.argument('path', type=click.Path(exists=True, file_okay=False, dir_okay=True, resolve_path=True))
+@drifter.commands.verbosity_options
+def add(path):
+    """Add a base to the store."""
+    base_id = BaseStore().add(path)
+
+    logging.info('Stored base "%s" as %s.', path, base_id[:SHORT_ID_LENGTH])
+
+
+@base_command.command()
+@click.argument('base_id', metavar='ID')
+@drifter.commands.verbosity_options
+def remove(base_id):
+    """Remove a base from the store."""
+    store = BaseStore()
+    full_id = store.resolve(base_id)
+    if not full_id:
+        raise InvalidArgumentException('No stored base found for "{0}".'.format(base_id))
+
+    store.remove(full_id)
+
+    logging.info('Removed base %s.', full_id[:SHORT_ID_LENGTH])
+
+
+@base_command.command()
+@click.option('--days', help='Remove bases not used for this many days.', type=click.INT, default=30,
+              show_default=True)
+@drifter.commands.verbosity_options
+def prune(days):
+    """Remove bases that haven't been used lately."""
+    removed = BaseStore().prune(days)
+    for base_id in removed:
+        logging.info('Removed base %s.', base_id[:SHORT_ID_LENGTH])
+
+    if not removed:
+        logging.info('No bases to remove.')
+
+
+def _format_size(size):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if size < 1024:
+            return '{0:.0f} {1}'.format(size, unit)
+        size /= 1024.0
+
+    return '{0:.1f} TB'.format(size)
+
+
+def _format_time(timestamp):
+    if not timestamp:
+        return 'Never'
+
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
@@ -0,0 +1,106 @@
+"""Manage the background daemon for a project."""
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+from time import sleep
+
+import click
+
+import drifter.commands
+import drifter.daemon
+from drifter.exceptions import GenericException
+
+
+@click.group(name='daemon', invoke_without_command=True)
+@click.pass_context
+def daemon_command(ctx):
+    """Manage the background daemon."""
+    if not ctx.invoked_subcommand:
+        click.echo(ctx.get_help())
+
+
+@daemon_command.command()
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+def start(config):
+    """Start the daemon for this project."""
+    if not drifter.daemon.is_supported():
+        raise GenericException('The daemon is not supported on this platform.')
+
+    reply = drifter.daemon.request(_get_socket_path(config), 'status')
+    if reply:
+        logging.info('Daemon is already running (pid %s).', reply['pid'])
+        return
+
+    logging.info(click.style('Starting daemon...', bold=True))
+
+    reply = drifter.daemon.start(config.base_dir)
+    if not reply:
+        raise GenericException('Failed to start the daemon. See "{0}" for details.'.format(
+            os.path.join(config.get_state_dir(), drifter.daemon.LOG_FILE),
+        ))
+
+    logging.info('Daemon started (pid %s).', reply['pid'])
+
+
+@daemon_command.command()
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+def stop(config):
+    """Stop the daemon for this project."""
+    path = _get_socket_path(config)
+    reply = drifter.daemon.request(path, 'stop')
+    if not reply:
+        logging.info('Daemon is not running.')
+        return
+
+    logging.info(click.style('Stopping daemon...', bold=True))
+
+    # The socket is removed once the daemon has shut down
+    count = 0
+    while os.path.exists(path) and count < 50:
+        count += 1
+        sleep(0.1)
+
+    logging.info('Daemon stopped.')
+
+
+@daemon_command.command()
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+def status(config):
+    """Get the status of the daemon."""
+    reply = drifter.daemon.request(_get_socket_path(config), 'status')
+
+    output = [['Status:', 'Running' if reply else 'Stopped']]
+    if reply:
+        output += [
+            ['PID:', reply['pid']],
+            ['Uptime:', '{0}s'.format(reply['uptime'])],
+            ['Commands:', reply['requests']],
+        ]
+
+    click.echo('')
+
+    longest_output_key = max(len(x[0]) for x in output)
+    for entry in output:
+        click.echo('  {0:{1}}  {2}'.format(entry[0], longest_output_key, entry[1]))
+
+    click.echo('')
+
+
+@daemon_command.command()
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+def flush(config):
+    """Clear the data the daemon has cached."""
+    if not drifter.daemon.request(_get_socket_path(config), 'flush'):
+        logging.info('Daemon is not running.')
+        return
+
+    logging.info('Daemon cache cleared.')
+
+
+def _get_socket_path(config):
+    return os.path.join(config.get_state_dir(), drifter.daemon.SOCKET_FILE)
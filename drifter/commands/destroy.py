@@ -14,9 +14,10 @@ from drifter.providers import invoke_provider_context
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
 @drifter.commands.force_option
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def destroy(ctx, config, name, force):
+def destroy(ctx, config, name, force, parallel):
     """Destroy a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -25,9 +26,16 @@ def destroy(ctx, config, name, force):
         _destroy(ctx, config, name, force)
         return
 
-    # Destroy all machines
-    for machine in drifter.commands.list_machines(config):
-        _destroy(ctx, config, machine, force)
+    # Destroy all machines, asking about each one before any are destroyed
+    machines = [
+        machine for machine in drifter.commands.list_machines(config)
+        if force or drifter.commands.confirm_destroy(machine, False)
+    ]
+    drifter.commands.run_machines(
+        machines,
+        lambda machine: _destroy(ctx, config, machine, True),
+        parallel,
+    )
 
 
 def _destroy(ctx, config, name, force):
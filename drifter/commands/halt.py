@@ -13,9 +13,10 @@ from drifter.providers import invoke_provider_context
 })
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def halt(ctx, config, name):
+def halt(ctx, config, name, parallel):
     """Halt a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -25,8 +26,11 @@ def halt(ctx, config, name):
         return
 
     # Halt all machines
-    for machine in drifter.commands.list_machines(config):
-        _halt(ctx, config, machine)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config),
+        lambda machine: _halt(ctx, config, machine),
+        parallel,
+    )
 
 
 def _halt(ctx, config, name):
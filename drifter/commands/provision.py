@@ -18,9 +18,10 @@ from drifter.provisioners import get_provisioners
 @drifter.commands.name_argument
 @drifter.commands.provision_with_option
 @drifter.commands.verbosity_options
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def provision(ctx, config, name, provision_with):
+def provision(ctx, config, name, provision_with, parallel):
     """Provision a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -30,8 +31,11 @@ def provision(ctx, config, name, provision_with):
         return
 
     # Provision all machines
-    for machine in drifter.commands.list_machines(config):
-        _provision(ctx, config, machine, provision_with)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config),
+        lambda machine: _provision(ctx, config, machine, provision_with),
+        parallel,
+    )
 
 
 def _provision(ctx, config, name, provision_with):
@@ -0,0 +1,39 @@
+"""Resume a suspended machine."""
+from __future__ import absolute_import, division, print_function
+
+import click
+
+import drifter.commands
+from drifter.providers import invoke_provider_context
+
+
+@click.command(context_settings={
+    'ignore_unknown_options': True,
+    'allow_extra_args': True,
+})
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.parallel_option
+@drifter.commands.pass_config
+@click.pass_context
+def resume(ctx, config, name, parallel):
+    """Resume a suspended machine."""
+    name = drifter.commands.validate_name(ctx, name)
+
+    # Resume the named machine only
+    if name:
+        _resume(ctx, config, name)
+        return
+
+    # Resume all suspended machines
+    drifter.commands.run_machines(
+        [machine for machine in drifter.commands.list_machines(config)
+         if config.get_machine(machine).get('suspended', False)],
+        lambda machine: _resume(ctx, config, machine),
+        parallel,
+    )
+
+
+def _resume(ctx, config, name):
+    provider = config.get_provider(name)
+    invoke_provider_context(ctx, provider, [name] + ctx.args)
@@ -19,9 +19,10 @@ from drifter.utils import get_cli
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
 @drifter.commands.command_option
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def rsync(ctx, config, name, command):
+def rsync(ctx, config, name, command, parallel):
     """Rsync files to a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -31,8 +32,11 @@ def rsync(ctx, config, name, command):
         return
 
     # Rsync to all machines
-    for machine in drifter.commands.list_machines(config):
-        _rsync(ctx, config, machine, command)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config),
+        lambda machine: _rsync(ctx, config, machine, command),
+        parallel,
+    )
 
 
 def _rsync(ctx, config, name, command):
@@ -0,0 +1,74 @@
+"""Manage snapshots of machines."""
+from __future__ import absolute_import, division, print_function
+
+import click
+
+import drifter.commands
+from drifter.providers import invoke_provider_context
+
+CONTEXT_SETTINGS = {
+    'ignore_unknown_options': True,
+    'allow_extra_args': True,
+}
+
+
+@click.group(name='snapshot', invoke_without_command=True)
+@click.pass_context
+def snapshot_command(ctx):
+    """Manage snapshots of machines."""
+    if not ctx.invoked_subcommand:
+        click.echo(ctx.get_help())
+
+
+@snapshot_command.command(name='list', context_settings=CONTEXT_SETTINGS)
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@click.pass_context
+def list_command(ctx, config, name):
+    """List the snapshots of a machine."""
+    _snapshot(ctx, config, name, [])
+
+
+@snapshot_command.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('snapshot')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@click.pass_context
+def save(ctx, config, snapshot, name):
+    """Take a snapshot of a machine."""
+    _snapshot(ctx, config, name, [snapshot])
+
+
+@snapshot_command.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('snapshot')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@click.pass_context
+def restore(ctx, config, snapshot, name):
+    """Return a machine to a snapshot."""
+    _snapshot(ctx, config, name, [snapshot])
+
+
+@snapshot_command.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('snapshot')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@click.pass_context
+def delete(ctx, config, snapshot, name):
+    """Delete a snapshot of a machine."""
+    _snapshot(ctx, config, name, [snapshot])
+
+
+def _snapshot(ctx, config, name, args):
+    name = drifter.commands.validate_name(ctx, name)
+
+    # Use the first machine if none is given
+    if not name:
+        name = drifter.commands.list_machines(config).pop()
+
+    provider = config.get_provider(name)
+    invoke_provider_context(ctx.parent, provider, [ctx.info_name] + args + [name] + ctx.args)
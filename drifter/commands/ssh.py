@@ -17,9 +17,10 @@ from drifter.utils import get_cli
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
 @drifter.commands.command_option
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def ssh(ctx, config, name, command):
+def ssh(ctx, config, name, command, parallel):
     """Open a Secure Shell to a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -33,8 +34,11 @@ def ssh(ctx, config, name, command):
         return
 
     # Run an SSH command on all machines
-    for machine in drifter.commands.list_machines(config):
-        _ssh(ctx, config, machine, command)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config),
+        lambda machine: _ssh(ctx, config, machine, command),
+        parallel,
+    )
 
 
 def _ssh(ctx, config, name, command):
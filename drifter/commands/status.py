@@ -13,9 +13,10 @@ from drifter.providers import invoke_provider_context
 })
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def status(ctx, config, name):
+def status(ctx, config, name, parallel):
     """Get the status of a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -24,9 +25,15 @@ def status(ctx, config, name):
         _status(ctx, config, name)
         return
 
-    # Get the status of all machines
+    # Get the status of all machines; each provider lists its own, in order
+    providers = []
     for machine in drifter.commands.list_machines(config):
-        _status(ctx, config, machine)
+        provider = config.get_provider(machine)
+        if provider not in providers:
+            providers.append(provider)
+
+    for provider in providers:
+        invoke_provider_context(ctx, provider, ['--parallel', str(parallel)] + ctx.args)
 
 
 def _status(ctx, config, name):
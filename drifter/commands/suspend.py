@@ -0,0 +1,38 @@
+"""Suspend a machine, saving its state."""
+from __future__ import absolute_import, division, print_function
+
+import click
+
+import drifter.commands
+from drifter.providers import invoke_provider_context
+
+
+@click.command(context_settings={
+    'ignore_unknown_options': True,
+    'allow_extra_args': True,
+})
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.parallel_option
+@drifter.commands.pass_config
+@click.pass_context
+def suspend(ctx, config, name, parallel):
+    """Suspend a machine, saving its state."""
+    name = drifter.commands.validate_name(ctx, name)
+
+    # Suspend the named machine only
+    if name:
+        _suspend(ctx, config, name)
+        return
+
+    # Suspend all machines
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config),
+        lambda machine: _suspend(ctx, config, machine),
+        parallel,
+    )
+
+
+def _suspend(ctx, config, name):
+    provider = config.get_provider(name)
+    invoke_provider_context(ctx, provider, [name] + ctx.args)
@@ -17,9 +17,10 @@ from drifter.exceptions import GenericException
 @drifter.commands.provider_option
 @drifter.commands.provision_option
 @drifter.commands.provision_with_option
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @click.pass_context
-def up_command(ctx, config, name, provider, provision, provision_with):
+def up_command(ctx, config, name, provider, provision, provision_with, parallel):
     """Bring up a machine."""
     name = drifter.commands.validate_name(ctx, name)
 
@@ -29,7 +30,7 @@ def up_command(ctx, config, name, provider, provision, provision_with):
         return
 
     # Check for multi-machine setup
-    machines = config.get_default('machines', {}).keys()
+    machines = list(config.get_default('machines', {}).keys())
     if not machines:
         # Check for single machine setup
         name = config.get_default('name')
@@ -43,12 +44,18 @@ def up_command(ctx, config, name, provider, provision, provision_with):
         if machine not in machines:
             machines.append(machine)
 
-    for machine in machines:
-        if not config.get_machine_default(machine, 'autostart', True):
-            continue
-        if provider and provider != config.get_machine_default(machine, 'provider', provider):
-            continue
-        _up_command(ctx, config, machine, provider, provision, provision_with, True)
+    machines = [
+        machine for machine in machines
+        if config.get_machine_default(machine, 'autostart', True)
+        and (not provider or provider == config.get_machine_default(machine, 'provider', provider))
+    ]
+
+    drifter.commands.up_machines(
+        config,
+        machines,
+        lambda machine: _up_command(ctx, config, machine, provider, provision, provision_with, True),
+        parallel,
+    )
 
 
 def _up_command(ctx, config, name, provider, provision, provision_with, detect_provider=False):
@@ -0,0 +1,229 @@
+"""Answer shell completion requests quickly.
+
+Completions come from a manifest of every command, provider, and plugin along
+with their options. It is built once and cached, so answering a request only
+reads the manifest and the state file; no commands or providers are loaded.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import os
+import shlex
+
+from drifter import cache
+from drifter.config import Config
+from drifter.registry import COMMANDS_DIR, CommandRegistry, describe_command, get_distributions_key
+
+
+ENV_VAR = '_DRIFTER_COMPLETE'
+
+# Modes answered from the manifest. Anything else, like printing the
+# completion script, is handled by click.
+MODES = ['complete', 'bash_complete', 'zsh_complete']
+
+# Options of the main drifter command
+GROUP_OPTIONS = ['--profile', '--version', '-h', '--help']
+
+# Parameters that take the name of a machine
+MACHINE_PARAMS = ['name', 'select']
+
+
+def is_requested():
+    """Check if the shell is asking for completions we can answer."""
+    return os.environ.get(ENV_VAR, None) in MODES
+
+
+def complete():
+    """Print completions for the words given by the shell."""
+    mode = os.environ.get(ENV_VAR)
+    words = _split(os.environ.get('COMP_WORDS', ''))
+    try:
+        cword = int(os.environ.get('COMP_CWORD', len(words)))
+    except ValueError:
+        cword = len(words)
+
+    args = words[1:cword]
+    incomplete = words[cword] if cword < len(words) else ''
+
+    for value, help_text in get_choices(load_manifest(), args, incomplete):
+        if mode == 'bash_complete':
+            print('plain,{0}'.format(value))
+        elif mode == 'zsh_complete':
+            print('plain\n{0}\n{1}'.format(value, help_text or '_'))
+        else:
+            print(value)
+
+
+def get_choices(manifest, args, incomplete):
+    """Get possible (value, help) pairs for the incomplete word."""
+    if '--' in args:
+        return []
+
+    spec = {'commands': manifest['commands'], 'params': [], 'main': True}
+    while 'commands' in spec:
+        position = _find_argument(spec, args)
+        if position is None:
+            if not incomplete.startswith('-'):
+                return _match(_get_commands(spec), incomplete)
+            if spec.get('main', False):
+                return _match([(option, None) for option in GROUP_OPTIONS], incomplete)
+
+            return _match(_get_options(spec), incomplete)
+
+        spec = spec['commands'].get(args[position], None)
+        if spec is None:
+            return []
+        args = args[position + 1:]
+
+    return _complete_params(spec, args, incomplete)
+
+
+def load_manifest():
+    """Load the manifest, building it if it is missing or stale."""
+    key = '{0}\n{1}'.format(CommandRegistry(COMMANDS_DIR).key(), get_distributions_key())
+    path = cache.get_cache_path('completion.json')
+
+    manifest = cache.load_json(path, key)
+    if manifest is None:
+        logging.debug('Rebuilding completion manifest...')
+        manifest = build_manifest()
+        cache.save_json(path, key, manifest)
+
+    return manifest
+
+
+def build_manifest():
+    """Describe every command, provider, and plugin.
+
+    This loads all of them, so it is only done when something changed.
+    """
+    # pylint: disable=import-outside-toplevel
+    import drifter.commands
+    from drifter.providers import get_providers
+
+    commands = {}
+    for name in drifter.commands.get_commands():
+        commands[name] = drifter.commands.REGISTRY.describe(name)
+
+    # Same precedence as the command loader: commands, providers, then plugins
+    for entry_points in [get_providers(), drifter.commands.get_plugins()]:
+        for name, entry_point in entry_points.items():
+            if name in commands:
+                continue
+            try:
+                commands[name] = describe_command(entry_point.load())
+            # Third-party code can fail in any way; completion just goes without it
+            except Exception as e:  # noqa: B902 pylint: disable=broad-except
+                logging.debug('Unable to describe "%s": %s', name, e)
+
+    return {'commands': commands}
+
+
+def get_machines():
+    """Get the names of the machines in the current project."""
+    config = Config()
+    project_dir = config.find_project_dir()
+    if not project_dir:
+        return []
+
+    try:
+        with io.open(config.get_state_path(project_dir), 'r', encoding='utf-8') as handle:
+            state = json.load(handle)
+    except (IOError, OSError, ValueError):
+        return []
+
+    return sorted(state.get('machines', None) or {})
+
+
+def _complete_params(spec, args, incomplete):
+    options = {}
+    for param in spec['params']:
+        if param['type'] == 'option':
+            for option in param['opts']:
+                options[option] = param
+
+    # The value of an option
+    if args and not incomplete.startswith('-'):
+        param = options.get(args[-1], None)
+        if param and not param['is_flag']:
+            return _complete_value(param, incomplete)
+
+    if incomplete.startswith('-'):
+        return _match(_get_options(spec), incomplete)
+
+    for param in spec['params']:
+        if param['type'] == 'argument' and param['name'] in MACHINE_PARAMS:
+            return _match([(machine, None) for machine in get_machines()], incomplete)
+
+    return []
+
+
+def _complete_value(param, incomplete):
+    if param.get('choices', None):
+        return _match([(choice, None) for choice in param['choices']], incomplete)
+
+    if param['name'] in MACHINE_PARAMS:
+        return _match([(machine, None) for machine in get_machines()], incomplete)
+
+    return []
+
+
+def _find_argument(spec, args):
+    """Find the position of the first argument that isn't an option."""
+    takes_value = set()
+    for param in spec['params']:
+        if param['type'] == 'option' and not param['is_flag']:
+            takes_value.update(param['opts'])
+
+    position = 0
+    while position < len(args):
+        if not args[position].startswith('-'):
+            return position
+        if args[position] in takes_value:
+            position += 1
+        position += 1
+
+    return None
+
+
+def _get_commands(spec):
+    choices = []
+    for name, command in sorted(spec['commands'].items()):
+        if command.get('hidden', False):
+            continue
+        choices.append((name, _get_help(command)))
+
+    return choices
+
+
+def _get_options(spec):
+    choices = []
+    for param in spec['params']:
+        if param['type'] != 'option':
+            continue
+        for option in param['opts']:
+            choices.append((option, param.get('help', None)))
+
+    choices.append(('--help', 'Show this message and exit.'))
+
+    return choices
+
+
+def _get_help(command):
+    text = command.get('short_help', None) or command.get('help', None) or ''
+
+    return text.strip().split('\n')[0]
+
+
+def _match(choices, incomplete):
+    return [choice for choice in choices if choice[0].startswith(incomplete)]
+
+
+def _split(words):
+    try:
+        return shlex.split(words)
+    except ValueError:
+        # Unfinished quotes
+        return words.split()
@@ -4,17 +4,25 @@ from __future__ import absolute_import, division, print_function
 import io
 import json
 import logging
+import marshal
 import os
 import sys
+from contextlib import contextmanager
 from time import gmtime, strftime
 
-import click
-
 import six
 
-import yaml
-
 from drifter.exceptions import GenericException, InvalidArgumentException
+from drifter.lazy import lazy_import
+from drifter.utils import file_lock, write_atomic
+from drifter.version import __version__
+
+
+# pylint: disable=invalid-name
+click = lazy_import('click')
+yaml = lazy_import('yaml')
+
+PROJECT_DIR_ENV_VAR = 'DRIFTER_PROJECT_DIR'
 
 
 class Config(object):
@@ -26,9 +34,19 @@ class Config(object):
         self.base_dir = folder or os.getcwd()
         self.state_dir = '.drifter'
         self.state_file = 'state.json'
+        self.lock_file = 'state.lock'
+        # The state as last read from or written to disk, to find what changed
+        self.state_data = None
+        self.state_base = {}
+        self.state_changed = False
+        self.transaction_depth = 0
         self.defaults = {}
         self.defaults_file = 'drifter.yaml'
         self.defaults_loaded = False
+        # Every setting by its dotted name, and the same per machine with
+        # the machine's own settings merged over the global ones
+        self.defaults_index = {}
+        self.machine_defaults = {}
 
     def get_state_path(self, path=None):
         """Get the path to the state file."""
@@ -41,6 +59,10 @@ class Config(object):
         """Get the path to the state file directory."""
         return os.path.join(self.base_dir, self.state_dir)
 
+    def get_lock_path(self):
+        """Get the path to the file locked while the state is saved."""
+        return os.path.join(self.base_dir, self.state_dir, self.lock_file)
+
     def load_state(self, path=None):
         """Load the state file."""
         if not path:
@@ -52,7 +74,10 @@ class Config(object):
 
         try:
             with io.open(path, 'r', encoding='utf-8') as handle:
-                self.state = json.load(handle)
+                data = handle.read()
+            self.state = json.loads(data)
+            self.state_data = data
+            self.state_base = json.loads(data)
         except IOError:
             logging.error(
                 click.style(
@@ -79,14 +104,56 @@ class Config(object):
                 sys.exit(1)
 
     def save_state(self):
-        """Save the state file."""
-        filename = self.get_state_path()
-        with io.open(filename, 'w', encoding='utf-8') as handle:
-            data = json.dumps(self.state, sort_keys=True, indent=4, separators=(',', ': '))
-            if six.PY2:
-                handle.write(unicode(data))
-            else:
-                handle.write(data)
+        """Save the state file.
+
+        Inside a transaction, the state is saved when the transaction ends.
+        """
+        self.state_changed = True
+        if not self.transaction_depth:
+            self._write_state()
+
+    @contextmanager
+    def transaction(self):
+        """Save all changes made to the state at once, at the end.
+
+        Transactions can be nested; the state is saved when the outermost one
+        ends. It is saved even if the transaction ends with an error, since
+        the changes usually describe machines that were already changed.
+        """
+        self.transaction_depth += 1
+        try:
+            yield self
+        finally:
+            self.transaction_depth -= 1
+            if not self.transaction_depth and self.state_changed:
+                self._write_state()
+
+    def _write_state(self):
+        self.state_changed = False
+
+        if _dump_state(self.state) == self.state_data:
+            return
+
+        # Other drifter processes may have saved the state since it was loaded,
+        # so merge in their changes while no one else can write
+        path = self.get_state_path()
+        with file_lock(self.get_lock_path()):
+            current_data = None
+            try:
+                with io.open(path, 'r', encoding='utf-8') as handle:
+                    current_data = handle.read()
+                _merge_state(self.state_base, self.state, json.loads(current_data))
+            except (IOError, OSError, ValueError):
+                # Missing or broken; ours replaces it
+                pass
+
+            data = _dump_state(self.state)
+            if data != current_data:
+                # Written to a temporary file first so a crash can't leave it half written
+                write_atomic(path, data.encode('utf-8'), sync=True)
+
+        self.state_data = data
+        self.state_base = json.loads(data)
 
     def get_unique_name(self, name):
         """Get the real name of the machine."""
@@ -161,73 +228,147 @@ class Config(object):
 
     def get_machine_default(self, machine_name, setting_name, default=None):
         """Get a machine-specific default, with fallback to the global default."""
-        # Get machine-specific setting
-        setting = self.get_default('machines.{0}.{1}'.format(machine_name, setting_name))
-        if setting is not None:
-            return setting
+        self._require_string(setting_name)
 
-        # Get global setting
-        return self.get_default(setting_name, default)
+        settings = self.machine_defaults.get(machine_name, None)
+        if settings is None:
+            settings = self._merge_machine_defaults(machine_name)
+            self.machine_defaults[machine_name] = settings
+
+        return settings.get(setting_name, default)
 
     def get_default(self, name, default=None):
         """Get the default value to use for a setting.
 
-        Use dots to traverse nested dictionary values.
+        Use dots to traverse nested dictionary values. Values are shared
+        between lookups, so they must not be modified.
         """
-        if not self.defaults_loaded:
-            self._load_defaults()
-            self.defaults_loaded = True
+        self._require_string(name)
+
+        return self._get_defaults_index().get(name, default)
 
-        if not isinstance(name, str) and not isinstance(name, unicode):
+    def _require_string(self, name):
+        if not isinstance(name, six.string_types):
             raise InvalidArgumentException(
                 'Failed to load default value. Name must be a string.',
             )
 
-        parts = name.split('.')
-        data = self.defaults
-        for part in parts:
-            if not isinstance(data, dict) or part not in data:
-                return default
+    def _get_defaults_index(self):
+        if not self.defaults_loaded:
+            self._load_defaults()
+            self.defaults_loaded = True
+
+        return self.defaults_index
 
-            data = data[part]
+    def _merge_machine_defaults(self, machine_name):
+        index = self._get_defaults_index()
+        prefix = 'machines.{0}.'.format(machine_name)
 
-        return data
+        settings = dict(index)
+        for name, value in six.iteritems(index):
+            # Machine-specific settings win, unless they are empty
+            if name.startswith(prefix) and value is not None:
+                settings[name[len(prefix):]] = value
+
+        return settings
 
     def _load_defaults(self):
         self.defaults = {}
+        self.defaults_index = {}
+        self.machine_defaults = {}
 
         path = os.path.join(self.base_dir, self.defaults_file)
         if not os.path.isfile(path):
             return
 
+        stat = os.stat(path)
+        header = (__version__, stat.st_mtime, stat.st_size)
+        cache_path = os.path.join(
+            self.get_state_dir(),
+            'defaults.py{0}{1}.cache'.format(*sys.version_info[:2]),
+        )
+
+        defaults = self._load_cached_defaults(cache_path, header)
+        if defaults is None:
+            defaults = self._parse_defaults(path)
+            self._save_cached_defaults(cache_path, header, defaults)
+
+        if isinstance(defaults, dict):
+            self.defaults = defaults
+            _flatten(defaults, '', self.defaults_index)
+
+    def _parse_defaults(self, path):
+        # The C loader is much faster, but is only available if PyYAML was built with libyaml
+        loader = getattr(yaml, 'CSafeLoader', None) or yaml.SafeLoader
+
         try:
             with io.open(path, 'r', encoding='utf-8') as handle:
-                self.defaults = yaml.safe_load(handle)
+                return yaml.load(handle, Loader=loader)
         except IOError:
             raise GenericException(
                 'State file "{0}" is not readable. Check your file permissions.'.format(path),
             )
 
-    def _find_state_dir(self, path=None):
-        """Find the state file.
+    def _load_cached_defaults(self, path, header):
+        try:
+            with open(path, 'rb') as handle:
+                data = marshal.loads(handle.read())
+            if data[:3] == header:
+                return data[3]
+        except (IOError, OSError, EOFError, ValueError, TypeError, IndexError):
+            pass
 
-        Recursively looks in parent directories until the directory is located.
+        return None
+
+    def _save_cached_defaults(self, path, header, defaults):
+        if not os.path.isdir(os.path.dirname(path)):
+            return
+
+        try:
+            write_atomic(path, marshal.dumps(header + (defaults,)))
+        except (IOError, OSError, ValueError) as e:
+            # Not every YAML type can be cached, e.g. dates
+            logging.debug('Unable to cache defaults from "%s": %s', self.defaults_file, e)
+
+    def find_project_dir(self, path=None):
+        """Find the project directory, i.e. the one containing the state file.
+
+        Uses DRIFTER_PROJECT_DIR if set. Otherwise, looks in parent directories
+        until the state file is located. Returns None if there is no state file.
         """
-        if not path:
-            path = self.base_dir
+        override = os.environ.get(PROJECT_DIR_ENV_VAR, None)
+        if override:
+            override = os.path.abspath(override)
+            if os.path.exists(self.get_state_path(override)):
+                return override
 
-        filename = self.get_state_path(path)
-        if os.path.exists(filename):
-            self.base_dir = path
+            return None
 
-            return
+        path = os.path.abspath(path or self.base_dir)
+        while True:
+            if os.path.exists(self.get_state_path(path)):
+                return path
 
-        parent = os.path.dirname(path)
-        if parent and parent != path:
-            self._find_state_dir(parent)
+            parent = os.path.dirname(path)
+            if not parent or parent == path:
+                return None
+
+            path = parent
+
+    def _find_state_dir(self, path=None):
+        """Find the state file, creating one if it doesn't exist."""
+        project_dir = self.find_project_dir(path)
+        if project_dir:
+            self.base_dir = project_dir
 
             return
 
+        override = os.environ.get(PROJECT_DIR_ENV_VAR, None)
+        if override:
+            if not os.path.isdir(override):
+                raise GenericException('Project directory "{0}" does not exist.'.format(override))
+            self.base_dir = os.path.abspath(override)
+
         self._init_state()
 
     def _init_state(self):
@@ -247,3 +388,46 @@ class Config(object):
             'selected': None,
             'machines': {},
         }
+
+
+def _dump_state(state):
+    return json.dumps(state, sort_keys=True, indent=4, separators=(',', ': '))
+
+
+def _merge_state(base, ours, theirs):
+    """Merge changes saved by another process into our state.
+
+    The state is merged one setting at a time, down into each machine's
+    settings. Whatever this process changed wins; anything only the other
+    process changed is taken from theirs.
+    """
+    missing = object()
+    for key in set(base) | set(ours) | set(theirs):
+        original = base.get(key, missing)
+        mine = ours.get(key, missing)
+        value = theirs.get(key, missing)
+        if value in [original, mine]:
+            # Only changed here, or not changed by them
+            continue
+
+        if mine == original:
+            # Only changed by them
+            if value is missing:
+                del ours[key]
+            else:
+                ours[key] = value
+        elif all(isinstance(item, dict) for item in [original, mine, value]):
+            # Both changed, e.g. different settings of the same machine
+            _merge_state(original, mine, value)
+
+
+def _flatten(data, prefix, index):
+    """Index every value in nested dictionaries by its dotted name."""
+    for key, value in six.iteritems(data):
+        if not isinstance(key, six.string_types):
+            continue
+
+        name = prefix + key
+        index[name] = value
+        if isinstance(value, dict):
+            _flatten(value, name + '.', index)
@@ -0,0 +1,538 @@
+"""Keep drifter running in the background for a project.
+
+The daemon listens on a Unix socket in the project's .drifter directory and
+runs commands on behalf of the drifter CLI. Since it stays running, the
+configuration, the providers, and the data they cache from VirtualBox are
+already loaded when a command comes in.
+
+The client passes its stdin, stdout, and stderr along with the command, so
+output, colors, prompts, and programs like rsync behave the same as when the
+command runs locally. Each command runs in a child process forked from the
+daemon, so a long one, like bringing up a machine, doesn't hold up the rest.
+Children share what the providers cache through the cache files, so changes
+they make are seen by the daemon and later commands.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import logging
+import os
+import signal
+import struct
+import sys
+import time
+
+from drifter.config import Config
+from drifter.lazy import lazy_import
+
+
+# pylint: disable=invalid-name
+array = lazy_import('array')
+socket = lazy_import('socket')
+subprocess = lazy_import('subprocess')
+
+
+SOCKET_FILE = 'daemon.sock'
+LOG_FILE = 'daemon.log'
+
+# Set to skip the daemon and always run commands locally
+DISABLE_ENV_VAR = 'DRIFTER_NO_DAEMON'
+
+HEADER = struct.Struct('!I')
+STDIO = [0, 1, 2]
+
+# Commands that need to own the terminal always run locally
+LOCAL_COMMANDS = ['daemon', 'rsync-auto', 'rsync_auto']
+
+
+def get_socket_path(folder=None):
+    """Get the daemon socket for the project containing the given folder."""
+    config = Config(folder)
+    project_dir = config.find_project_dir()
+    if not project_dir:
+        return None
+
+    return os.path.join(project_dir, config.state_dir, SOCKET_FILE)
+
+
+def is_supported():
+    """Check if the platform can pass file descriptors over a socket."""
+    return hasattr(socket, 'AF_UNIX') and hasattr(socket.socket, 'sendmsg')
+
+
+def should_forward(args):
+    """Check if a command can be sent to the daemon."""
+    if os.environ.get(DISABLE_ENV_VAR):
+        return False
+
+    words = []
+    has_command = False
+    for arg in args:
+        if arg == '--':
+            break
+        if arg.startswith('--command') or (arg.startswith('-c') and not arg.startswith('--')):
+            has_command = True
+        elif not arg.startswith('-'):
+            words.append(arg)
+
+    if not words:
+        return False
+
+    # The command may be given to a provider, e.g. "drifter virtualbox ssh"
+    for word in words[:2]:
+        if word in LOCAL_COMMANDS:
+            return False
+        # Without a command, ssh replaces the process with an interactive shell
+        if word == 'ssh' and not has_command:
+            return False
+
+    return True
+
+
+def forward(args):
+    """Run a command through the daemon, if one is running.
+
+    Returns the exit code of the command, or None if it wasn't forwarded.
+    """
+    if not should_forward(args):
+        return None
+
+    path = get_socket_path()
+    if not path or not os.path.exists(path) or not is_supported():
+        return None
+
+    conn = _connect(path)
+    if conn is None:
+        return None
+
+    try:
+        _send(conn, {
+            'action': 'run',
+            'argv': args,
+            'prog_name': os.path.basename(sys.argv[0]) if sys.argv else 'drifter',
+            'cwd': os.getcwd(),
+            'env': dict(os.environ),
+        }, STDIO)
+
+        return _wait_for_exit(conn)
+    finally:
+        conn.close()
+
+
+def request(path, action):
+    """Send a control request to the daemon and return its reply.
+
+    Returns None if the daemon isn't running.
+    """
+    if not is_supported():
+        return None
+
+    conn = _connect(path)
+    if conn is None:
+        return None
+
+    try:
+        _send(conn, {'action': action})
+        return _read_messages(conn.makefile('rb'))[-1]
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    finally:
+        conn.close()
+
+
+def start(project_dir, timeout=10):
+    """Start the daemon in the background and wait until it is listening."""
+    state_dir = Config(project_dir).get_state_dir()
+    path = os.path.join(state_dir, SOCKET_FILE)
+
+    with open(os.path.join(state_dir, LOG_FILE), 'ab') as log:
+        with open(os.devnull, 'rb') as devnull:
+            # pylint: disable=subprocess-popen-preexec-fn
+            subprocess.Popen(
+                [sys.executable, '-m', 'drifter.daemon', project_dir],
+                cwd=project_dir,
+                stdin=devnull,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                close_fds=True,
+                preexec_fn=os.setsid,
+            )
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        reply = request(path, 'status')
+        if reply is not None:
+            return reply
+        time.sleep(0.05)
+
+    return None
+
+
+class Server(object):
+    """Run drifter commands sent over the socket."""
+
+    def __init__(self, project_dir):
+        """Set up the server for a project."""
+        self.config = Config(project_dir)
+        self.project_dir = project_dir
+        self.path = os.path.join(self.config.get_state_dir(), SOCKET_FILE)
+        self.started = time.time()
+        self.requests = 0
+        self.running = False
+        self.listener = None
+        # Process IDs of the children running commands
+        self.children = set()
+        self.defaults_stat = None
+
+    def serve(self):
+        """Listen for requests until told to stop."""
+        if request(self.path, 'status') is not None:
+            logging.error('A daemon is already running for "%s".', self.project_dir)
+            return
+
+        if os.path.exists(self.path):
+            # Left over from a daemon that didn't shut down cleanly
+            os.remove(self.path)
+
+        self.preload()
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            listener.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        listener.listen(16)
+        self.listener = listener
+
+        # Ctrl+C is passed on to the child running the command, not the daemon
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, self._terminate)
+        signal.signal(signal.SIGCHLD, self._reap)
+
+        logging.info('Daemon %s listening on "%s".', os.getpid(), self.path)
+
+        self.running = True
+        try:
+            while self.running:
+                self._accept(listener)
+        finally:
+            listener.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            logging.info('Daemon %s stopped.', os.getpid())
+
+    def _accept(self, listener):
+        """Wait for a request and handle it."""
+        try:
+            conn = listener.accept()[0]
+        except (IOError, OSError) as e:
+            if self.running:
+                logging.debug('Failed to accept connection: %s', e)
+            return
+
+        try:
+            self.handle(conn)
+        # One failed request mustn't take the daemon down with it
+        except Exception as e:  # noqa: B902 pylint: disable=broad-except
+            logging.error('Request failed: %s', e)
+        finally:
+            conn.close()
+
+    def handle(self, conn):
+        """Handle a single request."""
+        data, fds = _receive(conn)
+        try:
+            action = data.get('action', None)
+            if action == 'run':
+                self.requests += 1
+                self.fork(conn, data, fds)
+            elif action == 'status':
+                _reply(conn, self.status())
+            elif action == 'flush':
+                self.flush()
+                _reply(conn, self.status())
+            elif action == 'stop':
+                self.running = False
+                _reply(conn, self.status())
+            else:
+                _reply(conn, {'error': 'Unknown action "{0}".'.format(action)})
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+    def fork(self, conn, data, fds):
+        """Run a command in a child process and reply with its exit code."""
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            # It may have finished before it was added
+            self._reap(None, None)
+            return
+
+        code = 1
+        try:
+            self.listener.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # Stops the command, e.g. on Ctrl+C in the client or when the daemon stops
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+            _reply(conn, {'pid': os.getpid()})
+            code = self.run(data, fds)
+            _reply(conn, {'code': code})
+        # Whatever happens, the child mustn't return to the daemon's loop
+        except BaseException as e:  # noqa: B902 pylint: disable=broad-except
+            logging.error('Command failed: %s', e)
+        finally:
+            os._exit(code if isinstance(code, int) else 1)  # pylint: disable=protected-access
+
+    def run(self, data, fds):
+        """Run a command using the client's environment and terminal."""
+        # pylint: disable=import-outside-toplevel
+        from drifter import cli
+
+        with _Environment(data.get('cwd', self.project_dir), data.get('env', {}), fds):
+            try:
+                self._refresh_config()
+
+                return cli.execute(
+                    data.get('argv', []),
+                    config=self.config,
+                    prog_name=data.get('prog_name', None),
+                )
+            except SystemExit as e:
+                # Loading a broken state file can exit
+                return e.code if isinstance(e.code, int) else 1
+
+    def preload(self):
+        """Load the commands and providers, so the children running commands start with them loaded."""
+        # pylint: disable=import-outside-toplevel
+        from drifter.providers import get_provider, get_providers
+
+        # Providers load the shared commands as well
+        for name in get_providers():
+            get_provider(name)
+
+    def flush(self):
+        """Forget everything the providers have cached."""
+        # pylint: disable=import-outside-toplevel
+        from drifter.providers import clear_caches
+
+        clear_caches()
+
+    def status(self):
+        """Describe the running daemon."""
+        return {
+            'pid': os.getpid(),
+            'project': self.project_dir,
+            'uptime': int(time.time() - self.started),
+            'requests': self.requests,
+        }
+
+    def _refresh_config(self):
+        # The state can be changed by commands run locally, so always reload it
+        self.config.state = {}
+        self.config.load_state(self.config.get_state_path())
+
+        path = os.path.join(self.project_dir, self.config.defaults_file)
+        try:
+            stat = os.stat(path)
+            defaults_stat = (stat.st_mtime, stat.st_size)
+        except (IOError, OSError):
+            defaults_stat = None
+
+        if defaults_stat != self.defaults_stat:
+            self.config.defaults_loaded = False
+            self.defaults_stat = defaults_stat
+
+    def _reap(self, unused_signum, unused_frame):
+        for pid in list(self.children):
+            try:
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self.children.discard(pid)
+            except OSError:
+                self.children.discard(pid)
+
+    def _terminate(self, unused_signum, unused_frame):
+        self.running = False
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        raise SystemExit(0)
+
+
+class _Environment(object):
+    """Temporarily take on the working directory, environment, and stdio of a client."""
+
+    def __init__(self, cwd, env, fds):
+        """Set up the environment to switch to."""
+        self.cwd = cwd
+        self.env = env
+        self.fds = fds
+        self.saved = None
+
+    def __enter__(self):
+        """Switch to the client's environment."""
+        cwd = os.getcwd()
+        os.chdir(self.cwd)
+
+        self.saved = {
+            'cwd': cwd,
+            'env': dict(os.environ),
+            'fds': [os.dup(fd) for fd in STDIO],
+            'streams': (sys.stdin, sys.stdout, sys.stderr),
+            'handlers': [(handler, handler.stream) for handler in _stream_handlers()],
+        }
+
+        _flush_streams()
+        for fd, client_fd in zip(STDIO, self.fds):
+            os.dup2(client_fd, fd)
+
+        # Line buffered so output shows up as it's written
+        sys.stdin = io.open(0, 'r', closefd=False)
+        sys.stdout = io.open(1, 'w', buffering=1, closefd=False)
+        sys.stderr = io.open(2, 'w', buffering=1, closefd=False)
+        for handler, _ in self.saved['handlers']:
+            handler.stream = sys.stderr
+
+        os.environ.clear()
+        os.environ.update(self.env)
+
+        logging.getLogger().setLevel(logging.INFO)
+
+        return self
+
+    def __exit__(self, *args):
+        """Switch back to the daemon's environment."""
+        _flush_streams()
+
+        os.chdir(self.saved['cwd'])
+        os.environ.clear()
+        os.environ.update(self.saved['env'])
+
+        for handler, stream in self.saved['handlers']:
+            handler.stream = stream
+        sys.stdin, sys.stdout, sys.stderr = self.saved['streams']
+
+        for fd, saved_fd in zip(STDIO, self.saved['fds']):
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+
+
+def _stream_handlers():
+    return [handler for handler in logging.getLogger().handlers
+            if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler)]
+
+
+def _flush_streams():
+    for stream in [sys.stdout, sys.stderr]:
+        try:
+            stream.flush()
+        except (IOError, OSError, ValueError):
+            pass
+
+
+def _connect(path):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+    except (IOError, OSError):
+        conn.close()
+        return None
+
+    return conn
+
+
+def _send(conn, data, fds=None):
+    payload = json.dumps(data).encode('utf-8')
+    message = HEADER.pack(len(payload)) + payload
+
+    ancillary = []
+    if fds:
+        ancillary = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds).tobytes())]
+
+    sent = conn.sendmsg([message], ancillary)
+    if sent < len(message):
+        conn.sendall(message[sent:])
+
+
+def _receive(conn):
+    fd_size = array.array('i').itemsize
+    message, ancillary, _, _ = conn.recvmsg(65536, socket.CMSG_SPACE(len(STDIO) * fd_size))
+
+    fds = array.array('i')
+    for level, kind, data in ancillary:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fd_size)])
+
+    while len(message) < HEADER.size:
+        message += _recv_chunk(conn)
+
+    size = HEADER.unpack(message[:HEADER.size])[0]
+    while len(message) < HEADER.size + size:
+        message += _recv_chunk(conn)
+
+    data = json.loads(message[HEADER.size:HEADER.size + size].decode('utf-8'))
+
+    return data, list(fds)
+
+
+def _recv_chunk(conn):
+    chunk = conn.recv(65536)
+    if not chunk:
+        raise IOError('Connection closed before the request was received.')
+
+    return chunk
+
+
+def _reply(conn, data):
+    conn.sendall(json.dumps(data).encode('utf-8') + b'\n')
+
+
+def _read_messages(handle):
+    messages = []
+    for line in handle:
+        messages.append(json.loads(line.decode('utf-8')))
+
+    return messages
+
+
+def _wait_for_exit(conn):
+    handle = conn.makefile('rb')
+    pid = None
+    while True:
+        try:
+            line = handle.readline()
+        except KeyboardInterrupt:
+            # Pass Ctrl+C on to the command running in the daemon
+            if pid:
+                os.kill(pid, signal.SIGINT)
+            continue
+
+        if not line:
+            # The daemon went away in the middle of the command
+            return 1
+
+        message = json.loads(line.decode('utf-8'))
+        if 'pid' in message:
+            pid = message['pid']
+        if 'code' in message:
+            return message['code']
+
+
+def main():
+    """Run the daemon for the project given on the command line."""
+    # Same format as the CLI, since command output is logged through it too
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+
+    project_dir = os.path.abspath(sys.argv[1] if len(sys.argv) > 1 else os.getcwd())
+
+    Server(project_dir).serve()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""Defer importing modules until they are used."""
+from __future__ import absolute_import, division, print_function
+
+import importlib
+
+
+class LazyModule(object):
+    """Stand-in for a module that is imported the first time it is used."""
+
+    def __init__(self, name):
+        """Set up the stand-in for the named module."""
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def __getattr__(self, attr):
+        """Import the module, if needed, and get an attribute from it."""
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+
+        return getattr(module, attr)
+
+    def __repr__(self):
+        """Describe the stand-in."""
+        return '<lazy module {0!r}>'.format(self.__dict__['_name'])
+
+
+def lazy_import(name):
+    """Get a module that won't be imported until one of its attributes is used."""
+    return LazyModule(name)
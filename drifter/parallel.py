@@ -0,0 +1,205 @@
+"""Run functions concurrently."""
+from __future__ import absolute_import, division, print_function
+
+import logging
+import sys
+import threading
+from contextlib import contextmanager
+
+import six
+
+
+DEFAULT_WORKERS = 8
+
+# Label of the item the current thread is working on
+_local = threading.local()  # pylint: disable=invalid-name
+
+
+def run(func, items, workers=DEFAULT_WORKERS):
+    """Call a function for each item using a bounded pool of threads.
+
+    Returns the results in the same order as the items. If any of the calls
+    raised an exception, the one for the earliest item is raised once every
+    call has finished.
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+
+    results = [None] * len(items)
+    errors = {}
+    queue = six.moves.queue.Queue()
+    for index, item in enumerate(items):
+        queue.put((index, item))
+
+    def _work():
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except six.moves.queue.Empty:
+                return
+
+            try:
+                results[index] = func(item)
+            # Anything raised is raised again once every thread is done
+            except BaseException:  # noqa: B902 pylint: disable=broad-except
+                errors[index] = sys.exc_info()
+
+    _run_threads(_work, min(workers, len(items)))
+
+    if errors:
+        six.reraise(*errors[min(errors)])
+
+    return results
+
+
+def run_ordered(func, items, dependencies, workers=DEFAULT_WORKERS, label=None):
+    """Call a function for each item, once the items it depends on are done.
+
+    Dependencies map an item to the items that have to finish first; any that
+    aren't in the list of items are ignored. Items are skipped if an item they
+    depend on failed or was skipped. Returns the results and the exceptions,
+    as returned by sys.exc_info(), by item. Skipped items are in neither.
+    Exceptions that aren't errors, like SystemExit or KeyboardInterrupt, are
+    raised once every call has finished instead.
+
+    If a label function is given, log messages are prefixed with the label of
+    the item being worked on while labelled_logs() is active.
+    """
+    items = list(items)
+    waiting_for = {}
+    for item in items:
+        waiting_for[item] = set(dependency for dependency in dependencies.get(item, None) or []
+                                if dependency in items and dependency != item)
+    _check_cycles(items, waiting_for)
+
+    ordered = _OrderedRun(func, items, waiting_for, label)
+    _run_threads(ordered.work, max(1, min(workers, len(items))))
+
+    for item in items:
+        if item in ordered.errors and not issubclass(ordered.errors[item][0], Exception):
+            six.reraise(*ordered.errors[item])
+
+    return ordered.results, ordered.errors
+
+
+class _OrderedRun(object):
+    """Hand out items to threads once the items they wait for are done."""
+
+    def __init__(self, func, items, waiting_for, label):
+        self.func = func
+        self.waiting_for = waiting_for
+        self.label = label
+        self.pending = list(items)
+        self.results = {}
+        self.errors = {}
+        self.failed = set()
+        self.condition = threading.Condition()
+
+    def work(self):
+        """Call the function for items until none are left."""
+        while True:
+            item = self._next()
+            if item is None:
+                return
+
+            _local.label = self.label(item) if self.label else None
+            try:
+                result = self.func(item)
+            # Returned to the caller, so the items depending on this one can be skipped
+            except BaseException:  # noqa: B902 pylint: disable=broad-except
+                self._finish(item, error=sys.exc_info())
+            else:
+                self._finish(item, result=result)
+            finally:
+                _local.label = None
+
+    def _next(self):
+        """Take the next item that's ready, or None once nothing is left."""
+        with self.condition:
+            while self.pending:
+                for item in list(self.pending):
+                    if self.waiting_for[item] & self.failed:
+                        self.pending.remove(item)
+                        self.failed.add(item)
+
+                for item in self.pending:
+                    if self.waiting_for[item] <= set(self.results):
+                        self.pending.remove(item)
+                        return item
+
+                if self.pending:
+                    self.condition.wait(0.1)
+
+            return None
+
+    def _finish(self, item, result=None, error=None):
+        with self.condition:
+            if error:
+                self.errors[item] = error
+                self.failed.add(item)
+            else:
+                self.results[item] = result
+            self.condition.notify_all()
+
+
+def get_label():
+    """Get the label of the item the current thread is working on, if any."""
+    return getattr(_local, 'label', None)
+
+
+@contextmanager
+def labelled_logs():
+    """Prefix log messages with the label of the item being worked on."""
+    log_filter = _LabelFilter()
+    handlers = logging.getLogger().handlers
+    for handler in handlers:
+        handler.addFilter(log_filter)
+    try:
+        yield
+    finally:
+        for handler in handlers:
+            handler.removeFilter(log_filter)
+
+
+class _LabelFilter(logging.Filter):
+    def filter(self, record):
+        label = get_label()
+        # Records are shared by every handler, so only prefix them once
+        if label and not getattr(record, 'drifter_label', None):
+            record.drifter_label = label
+            prefix = '[{0}] '.format(label)
+            if record.args:
+                prefix = prefix.replace('%', '%%')
+            record.msg = prefix + six.text_type(record.msg)
+
+        return True
+
+
+def _run_threads(target, count):
+    """Run a function in several threads and wait for all of them."""
+    threads = []
+    for _ in six.moves.range(count):
+        thread = threading.Thread(target=target)
+        # Don't keep drifter running after Ctrl+C
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        # Join with a timeout so Ctrl+C isn't blocked on Python 2
+        while thread.is_alive():
+            thread.join(0.1)
+
+
+def _check_cycles(items, waiting_for):
+    """Raise a ValueError if any items depend on each other."""
+    done = set()
+    remaining = list(items)
+    while remaining:
+        ready = [item for item in remaining if not waiting_for[item] - done]
+        if not ready:
+            raise ValueError('Circular dependency between: {0}'.format(', '.join(str(item) for item in remaining)))
+
+        done.update(ready)
+        remaining = [item for item in remaining if item not in done]
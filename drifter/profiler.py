@@ -0,0 +1,150 @@
+"""Profile a single drifter invocation.
+
+Profiling is enabled with the DRIFTER_PROFILE environment variable, which is
+set to the path prefix for the output files (or "1" to use the default). It
+is checked as soon as the drifter package is imported so the profile covers
+the imports, not just the command.
+"""
+from __future__ import absolute_import, division, print_function
+
+import cProfile
+import importlib
+import io
+import logging
+import os
+import sys
+import time
+
+import six
+
+
+ENV_VAR = 'DRIFTER_PROFILE'
+DEFAULT_PREFIX = 'drifter-profile'
+
+_session = None
+
+
+class ImportTimer(object):
+    """Record a tree of imports and how long each one took."""
+
+    def __init__(self):
+        """Set up the timer."""
+        self.tree = []
+        self.stack = [self.tree]
+        self.original_import = six.moves.builtins.__import__
+        self.original_import_module = importlib.import_module
+
+    def start(self):
+        """Start timing imports."""
+        six.moves.builtins.__import__ = self._import
+        importlib.import_module = self._import_module
+
+    def stop(self):
+        """Stop timing imports."""
+        six.moves.builtins.__import__ = self.original_import
+        importlib.import_module = self.original_import_module
+
+    def format(self):
+        """Format the import tree as text, slowest imports first."""
+        lines = ['{0:>10}  {1}'.format('cumulative', 'module')]
+        self._format_nodes(self.tree, 0, lines)
+
+        return '\n'.join(lines) + '\n'
+
+    def _format_nodes(self, nodes, depth, lines):
+        for name, elapsed, children in sorted(nodes, key=lambda node: -node[1]):
+            lines.append('{0:>7.1f} ms  {1}{2}'.format(elapsed * 1000, '  ' * depth, name))
+            self._format_nodes(children, depth + 1, lines)
+
+    def _import(self, name, *args, **kwargs):
+        globals_ = args[0] if args else kwargs.get('globals', None)
+        fromlist = args[2] if len(args) > 2 else kwargs.get('fromlist', None)
+        level = args[3] if len(args) > 3 else kwargs.get('level', 0)
+
+        label = name
+        if level and globals_:
+            # Resolve relative imports to their full module name
+            package = globals_.get('__package__') or globals_.get('__name__', '')
+            package = package.rsplit('.', level - 1)[0] if level > 1 else package
+            label = '.'.join(part for part in [package, name] if part)
+        if fromlist:
+            label += ' ({0})'.format(', '.join(str(item) for item in fromlist))
+
+        return self._timed(label, self.original_import, name, *args, **kwargs)
+
+    def _import_module(self, name, package=None):
+        return self._timed(name, self.original_import_module, name, package)
+
+    def _timed(self, label, func, *args, **kwargs):
+        node = [label, 0, []]
+        parent = self.stack[-1]
+        self.stack.append(node[2])
+        count = len(sys.modules)
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            node[1] = time.time() - start
+            self.stack.pop()
+            # Only keep imports that actually loaded something
+            if len(sys.modules) != count:
+                parent.append(node)
+
+
+class Session(object):
+    """Profile data collected for one invocation."""
+
+    def __init__(self, prefix):
+        """Set up the session."""
+        self.prefix = prefix
+        self.profile = cProfile.Profile()
+        self.imports = ImportTimer()
+
+    def start(self):
+        """Start profiling."""
+        self.imports.start()
+        self.profile.enable()
+
+    def finish(self):
+        """Stop profiling and write out the results."""
+        self.profile.disable()
+        self.imports.stop()
+
+        stats_path = self.prefix + '.pstats'
+        imports_path = self.prefix + '.imports'
+
+        self.profile.dump_stats(stats_path)
+        with io.open(imports_path, 'w', encoding='utf-8') as handle:
+            handle.write(six.text_type(self.imports.format()))
+
+        logging.info('Profile written to "%s" and "%s".', stats_path, imports_path)
+
+
+def is_active():
+    """Check if this invocation is being profiled."""
+    return _session is not None
+
+
+def start():
+    """Start profiling, if requested by the environment."""
+    global _session  # pylint: disable=global-statement
+
+    value = os.environ.get(ENV_VAR, '')
+    if not value or _session is not None:
+        return
+
+    prefix = DEFAULT_PREFIX if value.lower() in ['1', 'true', 'yes', 'on'] else value
+    _session = Session(os.path.abspath(prefix))
+    _session.start()
+
+
+def finish():
+    """Stop profiling and write out the results, if profiling."""
+    global _session  # pylint: disable=global-statement
+
+    if _session is None:
+        return
+
+    session = _session
+    _session = None
+    session.finish()
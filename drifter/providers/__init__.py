@@ -6,13 +6,15 @@ from functools import update_wrapper
 
 import click
 
-from pkg_resources import iter_entry_points
-
 from drifter.exceptions import ProviderException
+from drifter.registry import get_entry_points
 
 
 DEFAULT_PROVIDER = 'virtualbox'
 
+# Functions that clear what each provider caches, by provider name
+_cache_clearers = {}
+
 
 def get_default_provider():
     """Get the default provider to use."""
@@ -29,13 +31,33 @@ def pass_provider(func):
     return update_wrapper(new_func, func)
 
 
+def get_instance(ctx, name, factory):
+    """Get the object a provider uses to manage its machines.
+
+    Objects are kept in the context so every command run in the same
+    context shares them and whatever they cached.
+    """
+    instances = ctx.obj.setdefault('instances', {})
+    if name not in instances:
+        instances[name] = factory()
+
+    return instances[name]
+
+
+def register_cache_clearer(name, func):
+    """Register a function that forgets everything a provider has cached."""
+    _cache_clearers[name] = func
+
+
+def clear_caches():
+    """Forget everything the loaded providers have cached."""
+    for func in _cache_clearers.values():
+        func()
+
+
 def get_providers():
     """Get a list of available providers."""
-    providers = {}
-    for entry_point in iter_entry_points('drifter.providers'):
-        providers[entry_point.name] = entry_point
-
-    return providers
+    return get_entry_points('drifter.providers')
 
 
 def get_provider(provider):
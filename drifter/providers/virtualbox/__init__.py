@@ -3,29 +3,47 @@ from __future__ import absolute_import, division, print_function
 
 import logging
 import os
-from time import sleep
 
 import click
 
 import drifter.commands
 import drifter.commands.provision as base_provision
 import drifter.commands.rsync as base_rsync
-import drifter.commands.rsync_auto as base_rsync_auto
 import drifter.commands.ssh as base_ssh
 import drifter.providers
-from drifter.exceptions import ProviderException
-from drifter.providers.virtualbox.provider import Provider, VirtualBoxException
+from drifter import readiness, scheduler
+from drifter.bases import BaseStore
+from drifter.exceptions import GenericException, ProviderException
+from drifter.lazy import lazy_import
+from drifter.providers.virtualbox.provider import (
+    DEFAULT_HALT_STRATEGY, DEFAULT_HALT_TIMEOUT, DEFAULT_MEMORY, HALT_STRATEGIES, Provider, VirtualBoxException,
+)
+
+
+# Only rsync-auto needs watchdog
+base_rsync_auto = lazy_import('drifter.commands.rsync_auto')  # pylint: disable=invalid-name
 
 
 PROVIDER_NAME = 'virtualbox'
 
+# Snapshot taken after a machine is provisioned, to get back to with `up --from-snapshot`
+PROVISION_SNAPSHOT = 'post-provision'
+
+
+def _clear_cache():
+    # The cache is shared by every drifter process, so any provider object can clear it
+    Provider().clear_cache()
+
+
+drifter.providers.register_cache_clearer(PROVIDER_NAME, _clear_cache)
+
 
 @click.group(invoke_without_command=True)
 @click.pass_context
 def virtualbox(ctx):
     """Manage VirtualBox machines."""
     if 'provider' not in ctx.obj:
-        ctx.obj['provider'] = Provider()
+        ctx.obj['provider'] = drifter.providers.get_instance(ctx, PROVIDER_NAME, Provider)
 
     if not ctx.invoked_subcommand:
         click.echo(ctx.get_help())
@@ -36,22 +54,25 @@ def virtualbox(ctx):
 @drifter.commands.verbosity_options
 @drifter.commands.provision_option
 @drifter.commands.provision_with_option
-@click.option('--base', help='Machine to use as the base.', type=click.Path(
-    exists=True, file_okay=False, dir_okay=True, writable=False,
-    readable=True, resolve_path=True, allow_dash=False))
+@click.option('--base', help='Machine to use as the base, or the ID of a stored base.')
 @click.option('--memory', help='Amount of memory to use.', type=click.INT)
 @click.option('--mac', help='MAC address to use.')
 @click.option('--ports', help='Ports to forward.')
 @click.option('--head/--no-head', help='Whether or not to run the VM with a head.', is_flag=True, default=None)
+@click.option('--linked-clone/--no-linked-clone', is_flag=True, default=None,
+              help='Whether or not to link a new machine to a shared copy of the base.')
+@click.option('--from-snapshot', metavar='SNAPSHOT',
+              help='Snapshot to return the machine to first, e.g. "{0}".'.format(PROVISION_SNAPSHOT))
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @drifter.providers.pass_provider
 def up_command(provider, config, name, provision, provision_with, base, memory,
-               head, mac, ports):
+               head, mac, ports, linked_clone, from_snapshot, parallel):
     """Bring up a VirtualBox machine."""
     # Start the named machine only
     if name:
         _up_command(provider, config, name, provision, provision_with, base,
-                    memory, head, mac, ports)
+                    memory, head, mac, ports, linked_clone, from_snapshot)
         return
 
     # 1. Find machines defined in state file
@@ -61,7 +82,7 @@ def up_command(provider, config, name, provision, provision_with, base, memory,
     provider_machines = config.list_machines(PROVIDER_NAME)
 
     # Check for multi-machine setup
-    machines = config.get_default('machines', {}).keys()
+    machines = list(config.get_default('machines', {}).keys())
     if not machines:
         # Check for single machine setup
         name = config.get_default('name')
@@ -77,22 +98,28 @@ def up_command(provider, config, name, provision, provision_with, base, memory,
     if not provider_machines:
         drifter.commands.no_machine_warning()
 
-    for machine in provider_machines:
-        if not config.get_machine_default(machine, 'autostart', True):
-            continue
-        _up_command(provider, config, machine, provision, provision_with, base,
-                    memory, head, mac, ports)
+    drifter.commands.up_machines(
+        config,
+        [machine for machine in provider_machines if config.get_machine_default(machine, 'autostart', True)],
+        lambda machine: _up_command(provider, config, machine, provision, provision_with, base,
+                                    memory, head, mac, ports, linked_clone, from_snapshot),
+        parallel,
+    )
 
 
 def _up_command(provider, config, name, provision, provision_with, base, memory,
-                head, mac, ports):
+                head, mac, ports, linked_clone=None, from_snapshot=None):
     base, _head, _memory, _mac, _ports = _resolve_up_args(config, name, base,
                                                           memory, head, mac, ports)
+    if linked_clone is None:
+        linked_clone = config.get_machine_default(name, 'linked_clone', False)
+    if from_snapshot and not config.has_machine(name):
+        raise VirtualBoxException('Machine "{0}" does not exist yet, so it has no snapshots.'.format(name))
 
     logging.info(click.style('Bringing up machine "%s"...', bold=True), name)
 
     try:
-        _ensure_machine_exists(provider, config, name, base, _head, _memory, _mac, _ports)
+        _ensure_machine_exists(provider, config, name, base, _head, _memory, _mac, _ports, linked_clone)
     except ProviderException as e:
         _destroy(provider, config, name, True, False)
         raise e
@@ -110,9 +137,17 @@ def _up_command(provider, config, name, provision, provision_with, base, memory,
     mac = mac or settings.get('network', {}).get('nat', {}).get('mac', _mac)
     ports = ports or settings.get('network', {}).get('nat', {}).get('ports', _ports)
 
-    logging.info('==> Starting machine...')
     real_name = config.get_unique_name(name)
-    provider.start(real_name, head, memory, mac, ports)
+    if from_snapshot:
+        _restore_snapshot(provider, config, name, from_snapshot)
+
+    if provider.is_running(real_name):
+        logging.info('==> Machine is already running.')
+    else:
+        # Saved machines need their memory back as well
+        with scheduler.boot_slot(name, memory or DEFAULT_MEMORY):
+            _boot(provider, real_name, head, memory, mac, ports)
+    _set_suspended(config, name, False)
 
     _do_up_provision(provider, config, name, provision, provision_with)
 
@@ -132,18 +167,51 @@ def _do_up_provision(provider, config, name, provision, provision_with):
 
     # Do provision
     real_name = config.get_unique_name(name)
+    _wait_for_ssh(provider, config, name, real_name)
+
+    _provision(provider, config, name, provision_with)
+
+
+def _boot(provider, real_name, head, memory, mac, ports):
+    if provider.is_saved(real_name):
+        # Continue where it left off; settings changed since then apply after the next halt
+        logging.info('==> Resuming machine...')
+        provider.resume(real_name, head)
+    else:
+        logging.info('==> Starting machine...')
+        provider.start(real_name, head, memory, mac, ports)
+
+
+def _wait_for_ssh(provider, config, name, real_name):
     server = provider.get_server_data(real_name)
-    while True:
-        logging.info('==> Checking if SSH connection is alive...')
+    checks = []
+
+    # Guest additions can tell when the guest is really up, e.g. "/VirtualBox/GuestInfo/Net/0/Status=Up"
+    ready_property = config.get_machine_default(name, 'ssh.ready_property', None)
+    if ready_property:
+        key, _, expected = ready_property.partition('=')
+
+        def _check_property():
+            value = provider.get_guest_property(real_name, key)
+            return value is not None and (not expected or value == expected)
+
+        checks.append(_check_property)
+
+    def _confirm():
         res = base_ssh.do_ssh(config, [server], command='cd .', verbose=False)
-        if res and res[0][1] == 0:
-            break
-        sleep(10)
+        return bool(res) and res[0][1] == 0
 
-    _provision(provider, config, name, provision_with)
+    logging.info('==> Waiting for SSH to be ready...')
+    readiness.wait_for_ssh(
+        server['ssh_host'],
+        server['ssh_port'],
+        _confirm,
+        config.get_machine_default(name, 'ssh.ready_timeout', readiness.DEFAULT_TIMEOUT),
+        checks,
+    )
 
 
-def _ensure_machine_exists(provider, config, name, base, head, memory, mac, ports):
+def _ensure_machine_exists(provider, config, name, base, head, memory, mac, ports, linked_clone=False):
     """Create a machine, if it doesn't already exist."""
     real_name = config.get_unique_name(name)
     if provider.load_machine(real_name, True):
@@ -152,14 +220,18 @@ def _ensure_machine_exists(provider, config, name, base, head, memory, mac, port
     # Create it if it doesn't exist
     logging.info('==> Importing base machine "%s"...', base)
 
-    metadata = provider.get_base_metadata(base)
-    data = provider.create(real_name, metadata['os'])
+    metadata = _get_base_metadata(provider, base)
+    if linked_clone:
+        data = provider.create_linked_clone(real_name, base, metadata)
+    else:
+        data = provider.create(real_name, metadata['os'])
 
     config.add_machine(name, {
         'name': real_name,
         'provider': PROVIDER_NAME,
         'id': data.get('uuid', None),
         'headless': not head,
+        'linked_clone': bool(linked_clone),
         'memory': memory,
         'network': {
             'nat': {
@@ -170,7 +242,29 @@ def _ensure_machine_exists(provider, config, name, base, head, memory, mac, port
     })
     config.save_state()
 
-    provider.clone_from(real_name, metadata['media'])
+    if not linked_clone:
+        provider.clone_from(real_name, metadata['media'])
+
+
+def _get_base_metadata(provider, base):
+    """Get the metadata of a base, reusing it if the base is stored."""
+    store = BaseStore()
+    base_id = store.find(base)
+    if not base_id:
+        return provider.get_base_metadata(base)
+
+    store.touch(base_id)
+
+    metadata = store.get_metadata(base_id, PROVIDER_NAME)
+    if metadata is None:
+        metadata = provider.get_base_metadata(base)
+        # Relative, in case the store is moved
+        store.set_metadata(base_id, PROVIDER_NAME, dict(metadata, media=[
+            os.path.relpath(path, base) for path in metadata['media']
+        ]))
+        return metadata
+
+    return dict(metadata, media=[os.path.join(base, path) for path in metadata['media']])
 
 
 def _resolve_up_args(config, name, base, head, memory, mac, ports):
@@ -181,10 +275,19 @@ def _resolve_up_args(config, name, base, head, memory, mac, ports):
                 'Machine "{0}" does not have a base specified.'.format(name),
             )
 
-    if not os.path.exists(base) or not os.path.isdir(base):
-        raise VirtualBoxException(
-            'Base directory "{0}" does not exist.'.format(base),
-        )
+    store = BaseStore()
+    if os.path.isdir(base):
+        base = os.path.realpath(base)
+        if config.get_machine_default(name, 'base_store', False):
+            base = store.get_path(store.add(base))
+    else:
+        # Stored bases can be given by ID
+        base_id = store.resolve(base)
+        if not base_id:
+            raise VirtualBoxException(
+                'Base directory "{0}" does not exist.'.format(base),
+            )
+        base = store.get_path(base_id)
 
     # Precedence: CLI override, machine-specific default, general default
     _head, _memory, _mac, _ports = head, memory, mac, ports
@@ -204,16 +307,20 @@ def _resolve_up_args(config, name, base, head, memory, mac, ports):
 @drifter.commands.name_argument
 @drifter.commands.provision_with_option
 @drifter.commands.verbosity_options
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @drifter.providers.pass_provider
-def provision_command(provider, config, name, provision_with):
+def provision_command(provider, config, name, provision_with, parallel):
     """Provision a VirtualBox machine."""
     if name:
         _provision(provider, config, name, provision_with)
         return
 
-    for machine in drifter.commands.list_machines(config, PROVIDER_NAME):
-        _provision(provider, config, machine, provision_with)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config, PROVIDER_NAME),
+        lambda machine: _provision(provider, config, machine, provision_with),
+        parallel,
+    )
 
 
 def _provision(provider, config, name, provision_with=None):
@@ -234,21 +341,33 @@ def _provision(provider, config, name, provision_with=None):
     config.get_machine(name)['provisioned'] = True
     config.save_state()
 
+    if config.get_machine_default(name, 'provision_snapshot', True):
+        logging.info('==> Taking "%s" snapshot...', PROVISION_SNAPSHOT)
+        provider.take_snapshot(real_name, PROVISION_SNAPSHOT)
+
 
 @virtualbox.command()
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
 @drifter.commands.force_option
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @drifter.providers.pass_provider
-def destroy(provider, config, name, force):
+def destroy(provider, config, name, force, parallel):
     """Destroy a VirtualBox machine."""
     if name:
         _destroy(provider, config, name, force)
         return
 
-    for machine in drifter.commands.list_machines(config, PROVIDER_NAME):
-        _destroy(provider, config, machine, force)
+    machines = [
+        machine for machine in drifter.commands.list_machines(config, PROVIDER_NAME)
+        if force or drifter.commands.confirm_destroy(machine, False)
+    ]
+    drifter.commands.run_machines(
+        machines,
+        lambda machine: _destroy(provider, config, machine, True),
+        parallel,
+    )
 
 
 def _destroy(provider, config, name, force, require=True):
@@ -275,41 +394,135 @@ def _destroy(provider, config, name, force, require=True):
 @virtualbox.command()
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
+@click.option('--strategy', type=click.Choice(HALT_STRATEGIES), default=None,
+              help='How to halt the machine: shut it down, save its state, or turn it off.')
+@click.option('--timeout', type=click.FloatRange(0), default=None,
+              help='Seconds to wait for the machine to shut down before turning it off.')
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @drifter.providers.pass_provider
-def halt(provider, config, name):
+def halt(provider, config, name, strategy, timeout, parallel):
     """Halt a VirtualBox machine."""
     if name:
-        _halt(provider, config, name)
+        _halt(provider, config, name, strategy, timeout)
         return
 
-    for machine in drifter.commands.list_machines(config, PROVIDER_NAME):
-        _halt(provider, config, machine)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config, PROVIDER_NAME),
+        lambda machine: _halt(provider, config, machine, strategy, timeout),
+        parallel,
+    )
 
 
-def _halt(provider, config, name):
+def _halt(provider, config, name, strategy=None, timeout=None):
     _require_machine(config, name)
 
+    # Precedence: CLI override, machine-specific default, general default
+    if strategy is None:
+        strategy = config.get_machine_default(name, 'halt.strategy', DEFAULT_HALT_STRATEGY)
+    if timeout is None:
+        timeout = config.get_machine_default(name, 'halt.timeout', DEFAULT_HALT_TIMEOUT)
+
     logging.info(click.style('Halting machine "%s"...', bold=True), name)
 
     real_name = config.get_unique_name(name)
     provider.load_machine(real_name)
-    provider.stop(real_name)
+    provider.stop(real_name, strategy, float(timeout))
+    _set_suspended(config, name, provider.is_saved(real_name))
 
 
 @virtualbox.command()
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @drifter.providers.pass_provider
-def status(provider, config, name):
+def suspend(provider, config, name, parallel):
+    """Suspend a VirtualBox machine."""
+    if name:
+        _suspend(provider, config, name)
+        return
+
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config, PROVIDER_NAME),
+        lambda machine: _suspend(provider, config, machine),
+        parallel,
+    )
+
+
+def _suspend(provider, config, name):
+    _require_machine(config, name)
+
+    real_name = config.get_unique_name(name)
+    provider.load_machine(real_name)
+    if not provider.is_running(real_name):
+        logging.info('==> Machine "%s" is not running.', name)
+        return
+
+    logging.info(click.style('Suspending machine "%s"...', bold=True), name)
+
+    provider.suspend(real_name)
+    _set_suspended(config, name, True)
+
+
+@virtualbox.command()
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.parallel_option
+@drifter.commands.pass_config
+@drifter.providers.pass_provider
+def resume(provider, config, name, parallel):
+    """Resume a suspended VirtualBox machine."""
+    if name:
+        _resume(provider, config, name)
+        return
+
+    drifter.commands.run_machines(
+        [machine for machine in drifter.commands.list_machines(config, PROVIDER_NAME)
+         if config.get_machine(machine).get('suspended', False)],
+        lambda machine: _resume(provider, config, machine),
+        parallel,
+    )
+
+
+def _resume(provider, config, name):
+    settings = config.get_machine(name)
+    real_name = config.get_unique_name(name)
+    provider.load_machine(real_name)
+    if not provider.is_saved(real_name):
+        _set_suspended(config, name, False)
+        raise VirtualBoxException('Machine "{0}" is not suspended. Run `drifter up` to start it.'.format(name))
+
+    logging.info(click.style('Resuming machine "%s"...', bold=True), name)
+
+    provider.resume(real_name, not settings.get('headless', True))
+    _set_suspended(config, name, False)
+
+
+def _set_suspended(config, name, suspended):
+    settings = config.get_machine(name)
+    if settings.get('suspended', False) != suspended:
+        settings['suspended'] = suspended
+        config.save_state()
+
+
+@virtualbox.command()
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.parallel_option
+@drifter.commands.pass_config
+@drifter.providers.pass_provider
+def status(provider, config, name, parallel):
     """Get the status of a VirtualBox machine."""
     if name:
-        _status(provider, config, name)
+        click.echo(_status(provider, config, name))
         return
 
-    for machine in drifter.commands.list_machines(config, PROVIDER_NAME):
-        _status(provider, config, machine)
+    drifter.commands.echo_machines(
+        drifter.commands.list_machines(config, PROVIDER_NAME),
+        lambda machine: _status(provider, config, machine),
+        parallel,
+    )
 
 
 def _status(provider, config, name):
@@ -319,20 +532,17 @@ def _status(provider, config, name):
 
     output = [
         ['Name:', '{0} ({1})'.format(name, settings.get('provider', 'unknown'))],
-        ['Status:', 'Running' if provider.is_running(real_name) else 'Halted'],
+        ['Status:', _get_status(provider, real_name)],
     ]
 
     server = provider.get_server_data(real_name)
     for forward in server['redirects']:
         output.append(['Ports:', '{0} (host) -> {1} (guest)'.format(forward['host_port'], forward['guest_port'])])
 
-    click.echo('')
-
     longest_output_key = max(len(x[0]) for x in output)
-    for entry in output:
-        click.echo('  {0:{1}}  {2}'.format(entry[0], longest_output_key, entry[1]))
+    lines = ['  {0:{1}}  {2}'.format(entry[0], longest_output_key, entry[1]) for entry in output]
 
-    click.echo('')
+    return '\n{0}\n'.format('\n'.join(lines))
 
 
 @virtualbox.command()
@@ -357,25 +567,33 @@ def ssh(ctx, provider, config, name, command):
     if ctx.obj['verbosity'] < 0:
         verbose = False
 
-    base_ssh.do_ssh(config, [server], command=command, verbose=verbose,
-                    additional_args=ctx.obj['extra'])
+    responses = base_ssh.do_ssh(config, [server], command=command, verbose=verbose,
+                                additional_args=ctx.obj['extra'])
+
+    # Fail if the command did, so running it on every machine can tell
+    if responses and responses[0][1] != 0:
+        raise GenericException('Command failed with exit code {0}.'.format(responses[0][1]))
 
 
 @virtualbox.command()
 @drifter.commands.name_argument
 @drifter.commands.verbosity_options
 @drifter.commands.command_option
+@drifter.commands.parallel_option
 @drifter.commands.pass_config
 @drifter.providers.pass_provider
 @click.pass_context
-def rsync(ctx, provider, config, name, command):
+def rsync(ctx, provider, config, name, command, parallel):
     """Rsync files to a VirtualBox machine."""
     if name:
         _rsync(ctx, provider, config, name, command)
         return
 
-    for machine in drifter.commands.list_machines(config, PROVIDER_NAME):
-        _rsync(ctx, provider, config, machine, command)
+    drifter.commands.run_machines(
+        drifter.commands.list_machines(config, PROVIDER_NAME),
+        lambda machine: _rsync(ctx, provider, config, machine, command),
+        parallel,
+    )
 
 
 def _rsync(ctx, provider, config, name, command):
@@ -424,6 +642,115 @@ def rsync_auto(ctx, provider, config, name, command, run_once, burst_limit):
                                   verbose=verbose)
 
 
+def _get_status(provider, real_name):
+    if provider.is_running(real_name):
+        return 'Running'
+    if provider.is_saved(real_name):
+        return 'Suspended'
+
+    return 'Halted'
+
+
+@virtualbox.group(name='snapshot', invoke_without_command=True)
+@click.pass_context
+def snapshot_command(ctx):
+    """Manage snapshots of VirtualBox machines."""
+    if not ctx.invoked_subcommand:
+        click.echo(ctx.get_help())
+
+
+@snapshot_command.command(name='list')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@drifter.providers.pass_provider
+def snapshot_list(provider, config, name):
+    """List the snapshots of a VirtualBox machine."""
+    name = _get_snapshot_machine(config, name)
+
+    real_name = config.get_unique_name(name)
+    provider.load_machine(real_name)
+
+    snapshots = provider.get_snapshots(real_name)
+    if not snapshots:
+        logging.info('Machine "%s" has no snapshots.', name)
+        return
+
+    current = provider.get_current_snapshot(real_name)
+
+    click.echo('')
+    for snapshot in snapshots:
+        click.echo('  {0} {1}'.format('*' if snapshot == current else ' ', snapshot))
+    click.echo('')
+
+
+@snapshot_command.command(name='save')
+@click.argument('snapshot')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@drifter.providers.pass_provider
+def snapshot_save(provider, config, snapshot, name):
+    """Take a snapshot of a VirtualBox machine."""
+    name = _get_snapshot_machine(config, name)
+
+    logging.info(click.style('Taking snapshot "%s" of machine "%s"...', bold=True), snapshot, name)
+
+    real_name = config.get_unique_name(name)
+    provider.load_machine(real_name)
+    provider.take_snapshot(real_name, snapshot)
+
+
+@snapshot_command.command(name='restore')
+@click.argument('snapshot')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@drifter.providers.pass_provider
+def snapshot_restore(provider, config, snapshot, name):
+    """Return a VirtualBox machine to a snapshot."""
+    name = _get_snapshot_machine(config, name)
+
+    _restore_snapshot(provider, config, name, snapshot)
+
+    logging.info('==> Run `drifter up` to start the machine.')
+
+
+@snapshot_command.command(name='delete')
+@click.argument('snapshot')
+@drifter.commands.name_argument
+@drifter.commands.verbosity_options
+@drifter.commands.pass_config
+@drifter.providers.pass_provider
+def snapshot_delete(provider, config, snapshot, name):
+    """Delete a snapshot of a VirtualBox machine."""
+    name = _get_snapshot_machine(config, name)
+
+    logging.info(click.style('Deleting snapshot "%s" of machine "%s"...', bold=True), snapshot, name)
+
+    real_name = config.get_unique_name(name)
+    provider.load_machine(real_name)
+    provider.delete_snapshot(real_name, snapshot)
+
+
+def _get_snapshot_machine(config, name):
+    if not name:
+        name = drifter.commands.list_machines(config, PROVIDER_NAME).pop()
+
+    _require_machine(config, name)
+
+    return name
+
+
+def _restore_snapshot(provider, config, name, snapshot):
+    logging.info(click.style('Restoring snapshot "%s" of machine "%s"...', bold=True), snapshot, name)
+
+    real_name = config.get_unique_name(name)
+    provider.load_machine(real_name)
+    provider.restore_snapshot(real_name, snapshot)
+    _set_suspended(config, name, provider.is_saved(real_name))
+
+
 def _require_machine(config, name):
     config.get_machine(name)
 
@@ -0,0 +1,141 @@
+"""Keep track of the master machines linked clones are made from.
+
+A master is a machine holding a full copy of a base's disks and a snapshot
+to clone from. Masters are shared by every project on the host, so the
+clones depending on each one are recorded in a file in the drifter home
+directory rather than in a project's state.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import json
+import os
+import re
+from contextlib import contextmanager
+
+from drifter import cache
+from drifter.lazy import lazy_import
+from drifter.utils import file_lock, write_atomic
+
+
+hashlib = lazy_import('hashlib')  # pylint: disable=invalid-name
+
+MASTERS_FILE = 'virtualbox-masters.json'
+
+# Name of the snapshot clones are made from
+SNAPSHOT = 'drifter-master'
+
+
+def get_masters_path():
+    """Get the path to the file tracking masters."""
+    return os.path.join(cache.get_home_dir(), MASTERS_FILE)
+
+
+def get_master_name(base):
+    """Get the name of the master machine for a base directory."""
+    base = os.path.realpath(base)
+    digest = hashlib.sha1(base.encode('utf-8')).hexdigest()[:10]
+    label = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(base.rstrip(os.sep))) or 'base'
+
+    return 'drifter_master_{0}_{1}'.format(label, digest)
+
+
+class Masters(object):
+    """Record which linked clones depend on which masters."""
+
+    def __init__(self, path=None):
+        """Set up the record stored in the given file."""
+        self.path = path or get_masters_path()
+        self.lock_path = self.path + '.lock'
+
+    @contextmanager
+    def creating(self, name):
+        """Keep other processes from creating the same master at once."""
+        with file_lock('{0}.{1}.lock'.format(self.path, name)):
+            yield
+
+    def get(self, name):
+        """Get the record of a master, or None if it isn't known."""
+        return self._read().get(self._get_key(name), None)
+
+    def get_clones(self, name):
+        """Get the names of the clones depending on a master."""
+        master = self.get(name)
+        if not master:
+            return []
+
+        return list(master['clones'])
+
+    def add(self, name, base):
+        """Record a new master for a base directory."""
+        def _update(data):
+            key = self._get_key(name)
+            if key in data:
+                return False
+
+            data[key] = {
+                'name': name,
+                'base': os.path.realpath(base),
+                'snapshot': SNAPSHOT,
+                'clones': [],
+            }
+            return True
+
+        self._update(_update)
+
+    def acquire(self, name, clone):
+        """Record that a clone depends on a master."""
+        def _update(data):
+            clones = data[self._get_key(name)]['clones']
+            if clone in clones:
+                return False
+
+            clones.append(clone)
+            return True
+
+        self._update(_update)
+
+    def release(self, clone):
+        """Record that a clone no longer depends on its master."""
+        def _update(data):
+            changed = False
+            for master in data.values():
+                if clone in master['clones']:
+                    master['clones'].remove(clone)
+                    changed = True
+            return changed
+
+        self._update(_update)
+
+    def forget(self, name):
+        """Forget a machine that was destroyed, whether a master or a clone."""
+        def _update(data):
+            changed = data.pop(self._get_key(name), None) is not None
+            for master in data.values():
+                if name in master['clones']:
+                    master['clones'].remove(name)
+                    changed = True
+            return changed
+
+        # Most machines aren't masters or clones, so don't lock for nothing
+        if self._read():
+            self._update(_update)
+
+    def _get_key(self, name):
+        # Masters are machines, so they're only shared within a VirtualBox home
+        return '{0}|{1}'.format(os.environ.get('VBOX_USER_HOME', ''), name)
+
+    def _read(self):
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as handle:
+                data = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return {}
+
+        return data if isinstance(data, dict) else {}
+
+    def _update(self, func):
+        with file_lock(self.lock_path):
+            data = self._read()
+            if func(data):
+                write_atomic(self.path, json.dumps(data, sort_keys=True, indent=4).encode('utf-8'), sync=True)
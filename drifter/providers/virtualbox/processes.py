@@ -0,0 +1,60 @@
+"""Find the processes VirtualBox runs machines in.
+
+Every running machine has a process of its own, like VBoxHeadless, started
+with the machine's UUID. Watching that process is much cheaper than asking
+vboxmanage whether the machine is still running, but processes can only be
+found where /proc is available. Every function returns None when it can't
+tell, so callers can fall back to vboxmanage.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import os
+
+
+PROC_DIR = '/proc'
+
+
+def find_machine_process(uuid, name=None):
+    """Get the ID of the process running a machine, or None if none is found."""
+    try:
+        pids = [int(entry) for entry in os.listdir(PROC_DIR) if entry.isdigit()]
+    except (IOError, OSError):
+        return None
+
+    targets = set([uuid, '{{{0}}}'.format(uuid)])
+    if name:
+        targets.add(name)
+
+    for pid in pids:
+        args = _read_args(pid)
+        if '--startvm' not in args:
+            continue
+
+        index = args.index('--startvm') + 1
+        if index < len(args) and args[index] in targets:
+            return pid
+
+    return None
+
+
+def is_alive(pid):
+    """Check if a process is still running."""
+    try:
+        with io.open(os.path.join(PROC_DIR, str(pid), 'stat'), 'r', encoding='utf-8', errors='replace') as handle:
+            stat = handle.read()
+    except (IOError, OSError):
+        return False
+
+    # The state follows the command name, which may itself contain spaces
+    return stat[stat.rfind(')') + 2:][:1] not in ('Z', 'X', '')
+
+
+def _read_args(pid):
+    try:
+        with io.open(os.path.join(PROC_DIR, str(pid), 'cmdline'), 'rb') as handle:
+            data = handle.read()
+    except (IOError, OSError):
+        return []
+
+    return data.decode('utf-8', 'replace').split('\0')
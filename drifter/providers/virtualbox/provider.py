@@ -4,29 +4,98 @@ from __future__ import absolute_import, division, print_function
 import logging
 import os
 import re
-from configparser import ConfigParser
-from time import sleep
-
-from defusedxml import minidom
+import threading
+from time import sleep, time
 
 import six
 
+from drifter import cache, parallel
 from drifter.exceptions import InvalidArgumentException, ProviderException
+from drifter.lazy import lazy_import
+from drifter.providers.virtualbox import masters, processes, settings
 from drifter.utils import get_cli
 
 
+# pylint: disable=invalid-name
+configparser = lazy_import('configparser')
+minidom = lazy_import('defusedxml.minidom')
+
+
+# Seconds VirtualBox data is cached for. Changes made through drifter clear it
+# right away; these only matter for changes made outside of drifter.
+VMS_TTL = 60
+RUNNING_VMS_TTL = 5
+MACHINE_INFO_TTL = 60
+
+# Most vboxmanage commands to run at once
+MAX_WORKERS = 8
+
+# Most disks to clone at once; cloning is mostly disk I/O
+MAX_CLONE_WORKERS = 4
+
+# Ways of halting a machine; see Provider.stop()
+HALT_STRATEGIES = ['acpi', 'savestate', 'poweroff']
+DEFAULT_HALT_STRATEGY = 'acpi'
+
+# Seconds to wait for a guest to shut down before forcing it off
+DEFAULT_HALT_TIMEOUT = 30
+
+# Megabytes of memory machines get unless told otherwise
+DEFAULT_MEMORY = 512
+
+# Seconds between checks of whether a machine stopped, doubling from the
+# shortest to the longest
+STOP_POLL_MIN = 0.1
+STOP_POLL_MAX = 2
+
+# Machines started at once must not pick the same free ports
+_ports_lock = threading.Lock()  # pylint: disable=invalid-name
+
+
 class VirtualBoxException(ProviderException):
     """Exception to represent a VirtualBox error."""
 
     pass
 
 
+class PortAllocator(object):
+    """Hand out host ports that aren't already in use."""
+
+    def __init__(self):
+        """Set up the allocator with no ports in use."""
+        self.used = set()
+
+    def reserve(self, port):
+        """Mark a port as in use."""
+        self.used.add(port)
+
+    def allocate(self, port):
+        """Get the first port from the given one up that isn't in use, and reserve it."""
+        start = port
+        while port in self.used:
+            logging.debug('Port %s is in use. Trying %s...', port, port + 1)
+            port += 1
+
+        if port > 65535:
+            raise InvalidArgumentException('No free port found from {0} up.'.format(start))
+
+        self.reserve(port)
+
+        return port
+
+
 class Provider(object):
     """Provide interaction with the VirtualBox SDK."""
 
     def __init__(self):
         """Set up the VirtualBox connection."""
-        self.cache = {}
+        # Shared with other drifter processes
+        self.cache = cache.SharedCache(cache.get_cache_path('virtualbox.json'))
+        self.masters = masters.Masters()
+
+    def clear_cache(self):
+        """Forget everything cached from VirtualBox."""
+        self.cache.invalidate()
 
     def load_machine(self, name, silent=False):
         """Load a machine for usage and make sure it's accessible."""
@@ -63,35 +132,87 @@ class Provider(object):
         logging.debug('Machine is not running.')
         return False
 
+    def is_saved(self, name):
+        """Check if a machine's state was saved, e.g. by suspending it."""
+        return self._get_machine_info(name).get('vmstate', None) == 'saved'
+
+    def get_guest_property(self, name, key):
+        """Get a property the guest additions set, or None if it isn't set."""
+        res, code = get_cli(['vboxmanage', 'guestproperty', 'get', name, key])
+        if code != 0 or not res or not res.startswith('Value:'):
+            return None
+
+        return res[len('Value:'):].strip()
+
     def create(self, name, os_type):
         """Create a machine and register it with VirtualBox."""
         logging.debug('Creating machine "%s"...', name)
 
         res, code = get_cli(['vboxmanage', 'createvm', '--name', name, '--ostype', os_type, '--register'])
+        self._clear_vms()
+        self._clear_machine_info(name)
         if code != 0:
             logging.debug('Create failed. Aborting...')
             self._raise_exception('Failed to create machine', res)
 
         logging.debug('Machine created.')
 
-        self._clear_vms()
+        return self._get_machine_info(name)
+
+    def create_linked_clone(self, name, base, metadata):
+        """Create a machine with disks linked to a master copy of the base.
+
+        The master is created the first time a base is used and shared by
+        every linked clone of it, so each clone only stores its own changes.
+        """
+        master = masters.get_master_name(base)
+        with self.masters.creating(master):
+            self._ensure_master(master, base, metadata)
+            self.masters.acquire(master, name)
+
+            logging.debug('Creating linked clone of "%s"...', master)
+
+            res, code = get_cli(['vboxmanage', 'clonevm', master, '--snapshot', masters.SNAPSHOT,
+                                 '--options', 'link', '--name', name, '--register'])
+            self._clear_vms()
+            self._clear_machine_info(name)
+            if code != 0:
+                self.masters.release(name)
+                self._raise_exception('Failed to create linked clone', res)
+
+        logging.debug('Linked clone created.')
 
         return self._get_machine_info(name)
 
     def clone_from(self, name, disks):
         """Clone a list of disks into the machine.
 
-        Disks should be a list of paths to valid VirtualBox disk files.
+        Disks should be a list of paths to valid VirtualBox disk files. They
+        are cloned at the same time, then attached in order.
         """
         logging.debug('Cloning disks...')
 
         port_count = len(disks)
         self._create_storage(name, port_count)
 
-        port = 0
-        for disk in disks:
-            self._create_disk_clone(name, disk, port)
-            port += 1
+        machine_dir = self._get_machine_dir(name)
+        media = [os.path.join(machine_dir, os.path.basename(disk)) for disk in disks]
+
+        results = parallel.run(lambda paths: self._clone_disk(*paths), zip(disks, media), MAX_CLONE_WORKERS)
+        failures = [res for res, code in results if code != 0]
+        if failures:
+            for medium_path in media:
+                self._remove_medium(medium_path)
+            self._raise_exception('Failed to clone source medium', failures[0])
+
+        for port, medium_path in enumerate(media):
+            try:
+                self._attach_disk(name, medium_path, port)
+            except VirtualBoxException:
+                # Attached disks are removed along with the machine
+                for unattached in media[port:]:
+                    self._remove_medium(unattached)
+                raise
 
         logging.debug('Cloning complete.')
 
@@ -99,14 +220,23 @@ class Provider(object):
         """Destroy a machine."""
         logging.debug('Destroying machine...')
 
-        self.stop(name)
+        clones = [clone for clone in self.masters.get_clones(name) if clone in self._list_vms()]
+        if clones:
+            raise VirtualBoxException('Machine "{0}" can\'t be destroyed; linked clones depend on it: {1}'.format(
+                name, ', '.join(sorted(clones)),
+            ))
+
+        # Its disks are about to be deleted, so there's no need to shut it down cleanly
+        self.stop(name, 'poweroff')
 
         res, code = get_cli(['vboxmanage', 'unregistervm', name, '--delete'])
+        self._clear_vms()
+        self._clear_running_vms()
+        self._clear_machine_info(name)
         if code != 0:
             self._raise_exception('Failed to destroy machine', res)
 
-        self._clear_vms()
-        self._clear_running_vms()
+        self.masters.forget(name)
 
         logging.debug('Machine destroyed.')
 
@@ -116,58 +246,177 @@ class Provider(object):
         if self.is_running(name):
             return True
 
-        self._set_boot(name, memory)
-        self._configure_networks(name, mac)
-        self._forward_ports(name, ports)
+        with _ports_lock:
+            self._configure(name, memory, mac, ports)
+
+        self._launch(name, head)
+
+        return True
+
+    def suspend(self, name):
+        """Save the state of a running machine to disk and stop it."""
+        return self.stop(name, 'savestate')
+
+    def resume(self, name, head=False):
+        """Start a suspended machine from where it left off.
+
+        Saved machines can't be changed, so they're started as they are.
+        """
+        logging.debug('Resuming machine...')
+        if self.is_running(name):
+            return True
+
+        self._launch(name, head)
+
+        return True
 
+    def _launch(self, name, head):
         logging.debug('Launching machine...')
 
         res, code = get_cli(['vboxmanage', 'startvm', name, '--type', 'gui' if head else 'headless'])
+        self._clear_running_vms()
+        self._clear_machine_info(name)
         if code != 0:
             self._raise_exception('Failed to start machine', res)
 
-        self._clear_running_vms()
-
         logging.debug('Machine started.')
 
-        return True
+    def stop(self, name, strategy=DEFAULT_HALT_STRATEGY, timeout=DEFAULT_HALT_TIMEOUT):
+        """Stop a machine.
 
-    def stop(self, name):
-        """Stop a machine."""
+        The acpi strategy asks the guest to shut down and forces the machine
+        off if it's still running after the timeout, in seconds. The
+        savestate strategy saves the machine's state to disk, and poweroff
+        turns it off right away.
+        """
         logging.debug('Stopping machine...')
+        if strategy not in HALT_STRATEGIES:
+            raise InvalidArgumentException('Halt strategy "{0}" is invalid; must be one of ["{1}"]'.format(
+                strategy, '", "'.join(HALT_STRATEGIES),
+            ))
+
         if not self.is_running(name):
             return True
 
-        # Attempt graceful shutdown
-        logging.debug('Attempting graceful shutdown...')
-        res, code = get_cli(['vboxmanage', 'controlvm', name, 'acpipowerbutton'])
-        if code != 0:
-            # Force shutdown
+        # Found before the machine is told to stop, so it's known to be the right one
+        pid = processes.find_machine_process(self._list_vms().get(name, ''), name)
+
+        if strategy == 'acpi':
+            logging.debug('Attempting graceful shutdown...')
+            res, code = get_cli(['vboxmanage', 'controlvm', name, 'acpipowerbutton'])
+            if code == 0 and self._wait_until_stopped(name, pid, timeout):
+                logging.debug('Machine stopped.')
+                return True
+
             logging.debug('Graceful shutdown failed. Forcing power off...')
-            res, code = get_cli(['vboxmanage', 'controlvm', name, 'poweroff'])
-            if code != 0:
-                self._raise_exception('Failed to shutdown machine', res)
+            strategy = 'poweroff'
 
-        count = 0
+        # Both wait for the machine to be stopped before returning
+        res, code = get_cli(['vboxmanage', 'controlvm', name, strategy])
         self._clear_running_vms()
-        while self.is_running(name):
-            count += 1
-            if count >= 30:
-                count = 0
-                # Assume if the machine is still running after 30 secs, something went wrong.
-                # Force a shutdown just to be safe.
-                logging.debug('Forcing power off...')
-                res, code = get_cli(['vboxmanage', 'controlvm', name, 'poweroff'])
-                if code != 0:
-                    self._raise_exception('Failed to shutdown machine', res)
+        self._clear_machine_info(name)
+        if code != 0:
+            self._raise_exception('Failed to shutdown machine', res)
+
+        logging.debug('Machine stopped.')
+
+        return True
+
+    def _wait_until_stopped(self, name, pid, timeout):
+        """Wait for a machine to stop, for up to the timeout, in seconds.
+
+        Checks start often and back off, so a machine stopping quickly is
+        noticed right away without asking VirtualBox over and over. If the
+        machine's process is known, it's watched instead of asking at all.
+        """
+        deadline = time() + timeout
+        delay = STOP_POLL_MIN
+
+        def _is_running():
+            if pid and processes.is_alive(pid):
+                return True
 
             self._clear_running_vms()
-            sleep(1)
+            self._clear_machine_info(name)
+            return self.is_running(name)
 
-        logging.debug('Machine stopped.')
+        while _is_running():
+            remaining = deadline - time()
+            if remaining <= 0:
+                return False
+
+            sleep(min(delay, remaining))
+            delay = min(delay * 2, STOP_POLL_MAX)
 
         return True
 
+    def get_snapshots(self, name):
+        """Get the names of a machine's snapshots, parents before their children."""
+        info = self._get_machine_info(name)
+        keys = [key for key in info if re.match(r'^snapshotname(-\d+)*$', key)]
+
+        return [info[key] for key in sorted(keys, key=lambda key: [int(part) for part in key.split('-')[1:]])]
+
+    def get_current_snapshot(self, name):
+        """Get the name of the snapshot a machine was last at, if any."""
+        return self._get_machine_info(name).get('currentsnapshotname', None)
+
+    def take_snapshot(self, name, snapshot):
+        """Take a snapshot of a machine, replacing any with the same name.
+
+        Snapshots of running machines include their memory, so restoring one
+        continues the machine from that moment instead of booting it.
+        """
+        logging.debug('Taking snapshot "%s"...', snapshot)
+
+        # VirtualBox allows several snapshots with one name, but only the first can be restored by name
+        while snapshot in self.get_snapshots(name):
+            self.delete_snapshot(name, snapshot)
+
+        command = ['vboxmanage', 'snapshot', name, 'take', snapshot]
+        if self.is_running(name):
+            # Keep the machine running while its memory is saved
+            command.append('--live')
+
+        res, code = get_cli(command)
+        self._clear_machine_info(name)
+        if code != 0:
+            self._raise_exception('Failed to take snapshot', res)
+
+        logging.debug('Snapshot taken.')
+
+    def restore_snapshot(self, name, snapshot):
+        """Return a machine to a snapshot, losing any changes since.
+
+        Running machines are powered off first.
+        """
+        logging.debug('Restoring snapshot "%s"...', snapshot)
+        self._require_snapshot(name, snapshot)
+        self.stop(name, 'poweroff')
+
+        res, code = get_cli(['vboxmanage', 'snapshot', name, 'restore', snapshot])
+        self._clear_machine_info(name)
+        if code != 0:
+            self._raise_exception('Failed to restore snapshot', res)
+
+        logging.debug('Snapshot restored.')
+
+    def delete_snapshot(self, name, snapshot):
+        """Delete a snapshot, keeping the machine as it is."""
+        logging.debug('Deleting snapshot "%s"...', snapshot)
+        self._require_snapshot(name, snapshot)
+
+        res, code = get_cli(['vboxmanage', 'snapshot', name, 'delete', snapshot])
+        self._clear_machine_info(name)
+        if code != 0:
+            self._raise_exception('Failed to delete snapshot', res)
+
+        logging.debug('Snapshot deleted.')
+
+    def _require_snapshot(self, name, snapshot):
+        if snapshot not in self.get_snapshots(name):
+            raise VirtualBoxException('Machine has no snapshot named "{0}".'.format(snapshot))
+
     def get_server_data(self, name, require_ssh=True):
         """Get machine metadata and connection information."""
         logging.debug('Getting machine data for "%s"...', name)
@@ -213,7 +462,9 @@ class Provider(object):
                 continue
 
             if filename.endswith('.vbox'):
-                xml = minidom.parse(filename)
+                # Python 2's parser only takes byte string paths, so pass a file instead
+                with open(filename, 'rb') as handle:
+                    xml = minidom.parse(handle)
                 machines = xml.getElementsByTagName('Machine')
                 if machines:
                     machine = machines[0]
@@ -246,123 +497,137 @@ class Provider(object):
             'media': media,
         }
 
+    def _ensure_master(self, name, base, metadata):
+        if self.load_machine(name, True):
+            # Also adopts a master that's no longer recorded
+            self.masters.add(name, base)
+            return
+
+        logging.debug('Creating master "%s"...', name)
+
+        try:
+            self.create(name, metadata['os'])
+            self.clone_from(name, metadata['media'])
+
+            res, code = get_cli(['vboxmanage', 'snapshot', name, 'take', masters.SNAPSHOT])
+            self._clear_machine_info(name)
+            if code != 0:
+                self._raise_exception('Failed to take snapshot of master', res)
+        except ProviderException:
+            if self.load_machine(name, True):
+                self.destroy(name)
+            raise
+
+        self.masters.add(name, base)
+
+        logging.debug('Master created.')
+
     def _create_storage(self, name, port_count):
         logging.debug('Creating storage for %s disks...', port_count)
 
         res, code = get_cli(['vboxmanage', 'storagectl', name, '--name', 'SATAController',
                              '--add', 'sata', '--portcount', port_count, '--hostiocache', 'on'])
+        self._clear_machine_info(name)
         if code != 0:
             self._raise_exception('Failed to create machine storage', res)
 
         logging.debug('Storage created.')
 
-    def _create_disk_clone(self, name, filename, port):
-        basename = os.path.basename(filename)
-        logging.debug('Cloning disk "%s"...', basename)
-
+    def _get_machine_dir(self, name):
         data = self._get_machine_info(name)
         settings_file = data.get('cfgfile', None)
         if not settings_file:
-            for key in data:
-                print('%s=%s', (key, data[key]))
             raise VirtualBoxException('Unable to locate settings for machine.')
 
-        machine_dir = os.path.dirname(settings_file)
-        medium_path = os.path.join(machine_dir, basename)
+        return os.path.dirname(settings_file)
 
-        def _cleanup(medium_path):
-            if not os.path.exists(medium_path):
-                return
-            logging.debug('Removing medium "%s"...', medium_path)
-            get_cli(['vboxmanage', 'closemedium', 'disk', medium_path, '--delete'])
-            if os.path.exists(medium_path):
-                os.remove(medium_path)
+    def _clone_disk(self, filename, medium_path):
+        logging.debug('Cloning disk "%s"...', os.path.basename(filename))
 
-        logging.debug('Cloning source to destination...')
-        res, code = get_cli(['vboxmanage', 'clonemedium', 'disk', filename, medium_path])
-        if code != 0:
-            _cleanup(medium_path)
-            self._raise_exception('Failed to clone source medium', res)
+        return get_cli(['vboxmanage', 'clonemedium', 'disk', filename, medium_path])
+
+    def _attach_disk(self, name, medium_path, port):
+        logging.debug('Attaching disk "%s"...', os.path.basename(medium_path))
 
-        logging.debug('Attaching device...')
         res, code = get_cli(['vboxmanage', 'storageattach', name, '--storagectl',
                              'SATAController', '--port', port, '--type', 'hdd',
                              '--device', 0, '--medium', medium_path])
-        if code != 0:
-            _cleanup(medium_path)
-            self._raise_exception('Failed to attach device', res)
-
         # clear any cached data
         self._clear_machine_info(name)
-
-        logging.debug('Disk cloned.')
-
-    def _set_boot(self, name, memory):
-        if not memory:
-            memory = 512
-
-        logging.debug('Setting memory to %s...', memory)
-        res, code = get_cli(['vboxmanage', 'modifyvm', name, '--memory', memory,
-                             '--boot1', 'disk', '--boot2', 'none', '--boot3', 'none', '--boot4', 'none'])
         if code != 0:
-            self._raise_exception('Failed to update machine settings', res)
-
-        logging.debug('Settings saved.')
-
-    def _configure_networks(self, name, nat_mac):
-        logging.debug('Configuring network(s)...')
+            self._raise_exception('Failed to attach device', res)
 
-        logging.debug('Creating NAT...')
-        res, code = get_cli(['vboxmanage', 'modifyvm', name, '--nic1', 'nat',
-                             '--macaddress1', nat_mac if nat_mac else 'auto'])
-        if code != 0:
-            self._raise_exception('Failed to create NAT network', res)
+    def _remove_medium(self, medium_path):
+        if not os.path.exists(medium_path):
+            return
 
-        logging.debug('NAT created.')
-        logging.debug('Network(s) configured.')
+        logging.debug('Removing medium "%s"...', medium_path)
+        get_cli(['vboxmanage', 'closemedium', 'disk', medium_path, '--delete'])
+        if os.path.exists(medium_path):
+            os.remove(medium_path)
 
-    def _forward_ports(self, name, port_string):
-        orig_list = self._parse_ports(port_string)
-        port_list = self._get_collision_free_ports(name, orig_list)
+    def _configure(self, name, memory, mac, ports):
+        """Bring the machine's settings in line with the given ones.
 
-        logging.debug('Forwarding ports...')
+        Only settings that differ from the machine's current ones are changed,
+        all in a single call, so a machine that's already set up is started
+        without changing anything.
+        """
+        logging.debug('Configuring machine...')
+        info = self._get_machine_info(name)
 
         command = []
-        data = self._get_machine_info(name)
-        for key, value in six.iteritems(data):
-            if not key.startswith('forwarding('):
-                continue
+        for key, value in self._get_desired_settings(info, memory, mac):
+            if info.get(key, None) != value:
+                command += ['--{0}'.format(key), value]
+
+        current = [value for key, value in sorted(six.iteritems(info)) if key.startswith('forwarding(')]
+        desired = self._get_desired_forwards(name, ports)
+        for rule in current:
+            if rule not in desired:
+                command += ['--natpf1', 'delete', rule.split(',', 1)[0]]
+        for rule in desired:
+            if rule not in current:
+                logging.debug('Forwarding port %s (host) to %s (guest)...', rule.split(',')[3], rule.split(',')[5])
+                command += ['--natpf1', rule]
+
+        if not command:
+            logging.debug('Machine is already configured.')
+            return
+
+        res, code = get_cli(['vboxmanage', 'modifyvm', name] + command)
+        self._clear_machine_info(name)
+        if code != 0:
+            self._raise_exception('Failed to update machine settings', res)
 
-            parts = value.split(',', 2)
-            command += ['--natpf1', 'delete', parts[0]]
+        logging.debug('Machine configured.')
 
-        if command:
-            res, code = get_cli(['vboxmanage', 'modifyvm', name] + command)
-            if code != 0:
-                self._raise_exception('Failed to remove existing forwarded ports', res)
+    def _get_desired_settings(self, info, memory, mac):
+        """Get the settings a machine should have, as (modifyvm option, value) pairs."""
+        desired = [
+            ('memory', str(memory or DEFAULT_MEMORY)),
+            ('boot1', 'disk'),
+            ('boot2', 'none'),
+            ('boot3', 'none'),
+            ('boot4', 'none'),
+            ('nic1', 'nat'),
+        ]
 
-        command = []
-        count = 1
-        for ports in port_list:
-            logging.debug('Forwarding port %s (host) to %s (guest)...', ports['host'], ports['guest'])
-            pf_name = '{0}:{1}:{2}'.format(
-                ports['host'],
-                ports['guest'],
-                ports['protocol'],
-            )
-            command += ['--natpf{:d}'.format(count), '{0},{1},{2},{3},,{4}'.format(
-                pf_name, ports['protocol'], '127.0.0.1', ports['host'], ports['guest'],
-            )]
+        # Keep the MAC address the NAT already has unless a specific one is wanted
+        if mac:
+            desired.append(('macaddress1', mac.replace(':', '').upper()))
+        elif info.get('nic1', None) != 'nat' or not info.get('macaddress1', None):
+            desired.append(('macaddress1', 'auto'))
 
-        if command:
-            res, code = get_cli(['vboxmanage', 'modifyvm', name] + command)
-            if code != 0:
-                self._raise_exception('Failed to forward ports', res)
+        return desired
 
-        # clear any cached data
-        self._clear_machine_info(name)
+    def _get_desired_forwards(self, name, ports):
+        """Get the port forwarding rules a machine should have, as shown by showvminfo."""
+        rules = []
+        for port in self._get_collision_free_ports(name, self._parse_ports(ports)):
+            rules.append('{0}:{1}:{2},{2},127.0.0.1,{0},,{1}'.format(port['host'], port['guest'], port['protocol']))
 
-        logging.debug('Ports forwarded.')
+        return rules
 
     def _merge_ports(self, ports):
         return ','.join(
@@ -450,110 +715,116 @@ class Provider(object):
         """Ensure all ports won't conflict with other machines."""
         logging.debug('Detecting collision free ports...')
 
-        used_ports = []
-        for machine in six.iterkeys(self._list_vms()):
-            if name == machine:
-                # Ignore self
-                continue
+        # Ignore self
+        machines = [machine for machine in self._list_vms() if machine != name]
+        self._load_machine_info(machines)
 
+        allocator = PortAllocator()
+        for machine in machines:
             data = self.get_server_data(machine, False)
             for redirect in data.get('redirects', []):
                 try:
-                    used_ports.append(int(redirect['host_port']))
+                    allocator.reserve(int(redirect['host_port']))
                 except Exception:
                     pass
 
         for port in port_list:
-            port['host'] = self._get_collision_free_port(port['host'], used_ports)
+            port['host'] = allocator.allocate(port['host'])
 
         return port_list
 
-    def _get_collision_free_port(self, port, used_ports):
-        """Get a port number that won't conflict with other machines."""
-        while port in used_ports:
-            logging.debug('Port %s is in use. Trying %s...', port, port + 1)
-            port += 1
-
-        return port
-
     def _clear_vms(self):
-        if 'vms' in self.cache:
-            del self.cache['vms']
+        self._clear_cached('vms')
 
     def _list_vms(self):
-        cached_vms = self.cache.get('vms', None)
-        if cached_vms:
-            return cached_vms
-
-        res, code = get_cli(['vboxmanage', 'list', 'vms'])
-        if code != 0:
-            raise VirtualBoxException('No machines available.')
-
-        cached_vms = {}
-
-        if res:
-            matches = re.findall(r'\"([^\"]+)\" \{([^\}]+)\}', res)
-            for item in matches:
-                # name => uuid
-                cached_vms[item[0]] = item[1]
+        vms = settings.list_machines()
+        if vms is not None:
+            return vms
 
-        self.cache.setdefault('vms', cached_vms)
-
-        return cached_vms
+        return self._get_cached('vms', VMS_TTL, lambda: self._fetch_vms('vms'))
 
     def _clear_running_vms(self):
-        if 'runningvms' in self.cache:
-            del self.cache['runningvms']
+        self._clear_cached('runningvms')
 
     def _list_running_vms(self):
-        cached_vms = self.cache.get('runningvms', None)
-        if cached_vms:
-            return cached_vms
+        return self._get_cached('runningvms', RUNNING_VMS_TTL, lambda: self._fetch_vms('runningvms'))
 
-        res, code = get_cli(['vboxmanage', 'list', 'runningvms'])
+    def _fetch_vms(self, kind):
+        res, code = get_cli(['vboxmanage', 'list', kind])
         if code != 0:
             raise VirtualBoxException('No machines available.')
 
-        cached_vms = {}
+        vms = {}
 
         if res:
             matches = re.findall(r'\"([^\"]+)\" \{([^\}]+)\}', res)
             for item in matches:
                 # name => uuid
-                cached_vms[item[0]] = item[1]
-
-        self.cache.setdefault('runningvms', cached_vms)
+                vms[item[0]] = item[1]
 
-        return cached_vms
+        return vms
 
     def _clear_machine_info(self, name):
-        info = self.cache.get('info', None)
-        if info is None:
+        self._clear_cached('info:{0}'.format(name))
+
+    def _get_machine_info(self, name):
+        # Only settings are used, so read them from the settings file if possible
+        info = settings.get_machine_info(name)
+        if info is not None:
+            return info
+
+        return self._get_cached('info:{0}'.format(name), MACHINE_INFO_TTL, lambda: self._fetch_machine_info(name))
+
+    def _load_machine_info(self, names):
+        """Fetch the info of many machines at once and cache it."""
+        keys = dict((name, self._get_cache_key('info:{0}'.format(name))) for name in names)
+        missing = [name for name in names if self.cache.get(keys[name], MACHINE_INFO_TTL) is None
+                   and settings.get_machine_info(name) is None]
+        if not missing:
             return
 
-        if name in info:
-            del info[name]
+        logging.debug('Loading info for %s machines...', len(missing))
 
-    def _get_machine_info(self, name):
-        cached_info = self.cache.get('info', {}).get(name, None)
-        if cached_info:
-            return cached_info
+        generations = dict((keys[name], self.cache.get_generation(keys[name])) for name in missing)
+        infos = parallel.run(self._fetch_machine_info, missing, MAX_WORKERS)
+        self.cache.set_many(dict((keys[name], info) for name, info in zip(missing, infos)), generations)
 
+    def _fetch_machine_info(self, name):
         res, code = get_cli(['vboxmanage', 'showvminfo', name, '--machinereadable'])
         if code != 0:
             raise VirtualBoxException('Machine not found.')
 
-        parser = ConfigParser()
+        parser = configparser.ConfigParser()
         parser.read_string('[DEFAULT]\n' + res)
 
-        cached_info = {}
+        info = {}
         for item in parser.items('DEFAULT'):
-            cached_info[item[0].strip('"')] = item[1].strip('"')
+            info[item[0].strip('"')] = item[1].strip('"')
+
+        return info
+
+    def _get_cached(self, key, ttl, fetch):
+        """Get data from the cache, fetching it from VirtualBox if needed.
+
+        The cache is shared with other drifter processes, keyed by the
+        VirtualBox home so different users of VirtualBox don't mix.
+        """
+        key = self._get_cache_key(key)
+        value = self.cache.get(key, ttl)
+        if value is not None:
+            return value
+
+        generation = self.cache.get_generation(key)
+        value = fetch()
+        self.cache.set(key, value, generation)
+
+        return value
 
-        self.cache.setdefault('info', {})
-        self.cache['info'].setdefault(name, cached_info)
+    def _clear_cached(self, key):
+        self.cache.invalidate([self._get_cache_key(key)])
 
-        return cached_info
+    def _get_cache_key(self, key):
+        return '{0}|{1}'.format(os.environ.get('VBOX_USER_HOME', ''), key)
 
     def _raise_exception(self, message, res):
         errors = re.findall(r'VBoxManage: error: ([^\n]+)', res)
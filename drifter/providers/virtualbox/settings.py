@@ -0,0 +1,319 @@
+"""Read VirtualBox settings files directly.
+
+Static configuration, like which machines are registered and which ports
+they forward, is stored by VirtualBox in XML files that are much faster to
+read than asking vboxmanage. Runtime state, like whether a machine is
+running, still has to come from vboxmanage.
+
+Files are read with a streaming parser and the results are kept until the
+file changes. Every function returns None when the settings can't be read,
+so callers can fall back to vboxmanage.
+"""
+from __future__ import absolute_import, division, print_function
+
+import logging
+import os
+
+from drifter.lazy import lazy_import
+
+
+expat = lazy_import('xml.parsers.expat')  # pylint: disable=invalid-name
+
+
+GLOBAL_SETTINGS_FILE = 'VirtualBox.xml'
+
+# Protocol numbers used in settings files, as named by vboxmanage
+PROTOCOLS = {'0': 'udp', '1': 'tcp'}
+
+# Boot devices used in settings files, as named by vboxmanage
+BOOT_DEVICES = {'None': 'none', 'Floppy': 'floppy', 'DVD': 'dvd', 'HardDisk': 'disk', 'Network': 'net'}
+
+# Boot order VirtualBox leaves out of settings files
+DEFAULT_BOOT_ORDER = ['floppy', 'dvd', 'disk', 'none']
+
+# Parsed files and the (mtime, size) they were parsed at
+_files = {}
+
+
+class SettingsException(Exception):
+    """Exception to represent a settings file that couldn't be read."""
+
+    pass
+
+
+def get_home_dir():
+    """Get the directory holding the global VirtualBox settings."""
+    home = os.environ.get('VBOX_USER_HOME', None)
+    if home:
+        return home
+
+    user_home = os.path.expanduser('~')
+    for folder in [
+            os.path.join(user_home, '.config', 'VirtualBox'),
+            os.path.join(user_home, 'Library', 'VirtualBox'),
+            os.path.join(user_home, '.VirtualBox'),
+    ]:
+        if os.path.isfile(os.path.join(folder, GLOBAL_SETTINGS_FILE)):
+            return folder
+
+    return None
+
+
+def list_machines():
+    """Get the UUID of every registered machine, by name."""
+    entries = _get_registry()
+    if entries is None:
+        return None
+
+    machines = {}
+    for entry in entries:
+        machine = _read_file(entry['path'], _parse_machine)
+        if machine is None:
+            return None
+        machines[machine['name']] = machine['uuid']
+
+    return machines
+
+
+def get_machine_info(name):
+    """Get the static settings of a registered machine.
+
+    They are returned with the same names vboxmanage uses in the output of
+    `showvminfo --machinereadable`.
+    """
+    entries = _get_registry()
+    if entries is None:
+        return None
+
+    # Settings files are usually named after the machine, so check those first
+    expected = name + '.vbox'
+    entries = sorted(entries, key=lambda entry: os.path.basename(entry['path']) != expected)
+    for entry in entries:
+        machine = _read_file(entry['path'], _parse_machine)
+        if machine is None:
+            return None
+        if machine['name'] == name:
+            return machine['info']
+
+    return None
+
+
+def _get_registry():
+    home = get_home_dir()
+    if not home:
+        return None
+
+    return _read_file(os.path.join(home, GLOBAL_SETTINGS_FILE), _parse_registry)
+
+
+def _read_file(path, parse):
+    try:
+        stat = os.stat(path)
+    except (IOError, OSError):
+        return None
+
+    key = (stat.st_mtime, stat.st_size)
+    cached = _files.get(path, None)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
+    try:
+        with open(path, 'rb') as handle:
+            data = parse(path, handle)
+    except (IOError, OSError, SettingsException) as e:
+        logging.debug('Unable to read VirtualBox settings "%s": %s', path, e)
+        data = None
+    except expat.ExpatError as e:
+        logging.debug('Unable to parse VirtualBox settings "%s": %s', path, e)
+        data = None
+
+    _files[path] = (key, data)
+
+    return data
+
+
+def _parse(handle, start, end=None):
+    """Stream a file through the given element handlers."""
+    parser = expat.ParserCreate()
+
+    def _reject_entities(*unused_args):
+        # Entities are never used by VirtualBox; refusing them keeps entity
+        # expansion attacks out, like defusedxml does
+        raise SettingsException('Entity declarations are not allowed.')
+
+    parser.EntityDeclHandler = _reject_entities
+    parser.StartElementHandler = start
+    if end:
+        parser.EndElementHandler = end
+
+    parser.ParseFile(handle)
+
+
+def _parse_registry(path, handle):
+    folder = os.path.dirname(path)
+    entries = []
+
+    def _start(tag, attrs):
+        if tag == 'MachineEntry' and attrs.get('src', None):
+            entries.append({
+                'uuid': attrs.get('uuid', '').strip('{}'),
+                'path': os.path.join(folder, attrs['src']),
+            })
+
+    _parse(handle, _start)
+
+    return entries
+
+
+def _parse_machine(path, handle):
+    parser = _MachineParser(path)
+    _parse(handle, parser.start, parser.end)
+
+    return parser.get_machine()
+
+
+class _MachineParser(object):
+    """Collect a machine's settings under the names showvminfo uses."""
+
+    def __init__(self, path):
+        self.path = path
+        self.machine = {}
+        self.info = {'cfgfile': path}
+        self.stack = []
+        self.disks = {}
+        self.adapter = None
+        self.forwards = 0
+        self.controller = None
+        self.device = None
+        # Snapshots being read are kept as [key, number of children]
+        self.snapshots = []
+        self.current = None
+        self.handlers = {
+            'Machine': self._start_machine,
+            'Memory': self._start_memory,
+            'Order': self._start_order,
+            'HardDisk': self._start_disk,
+            'Adapter': self._start_adapter,
+            'NAT': self._start_nat,
+            'Forwarding': self._start_forward,
+            'StorageController': self._start_controller,
+            'AttachedDevice': self._start_device,
+            'Image': self._start_image,
+        }
+
+    def start(self, tag, attrs):
+        """Handle an opening tag."""
+        parent = self.stack[-1] if self.stack else None
+        self.stack.append(tag)
+
+        if tag == 'Snapshot':
+            self._start_snapshot(attrs)
+        if 'Snapshot' in self.stack:
+            # Settings the machine had when a snapshot was taken
+            return
+
+        handler = self.handlers.get(tag, None)
+        if handler:
+            handler(parent, attrs)
+
+    def end(self, tag):
+        """Handle a closing tag."""
+        self.stack.pop()
+        if tag == 'Snapshot':
+            self.snapshots.pop()
+
+    def get_machine(self):
+        """Get the machine's name, UUID and info."""
+        if not self.machine:
+            raise SettingsException('No machine found.')
+
+        for index, device in enumerate(DEFAULT_BOOT_ORDER):
+            self.info.setdefault('boot{0}'.format(index + 1), device)
+
+        self.machine['info'] = self.info
+
+        return self.machine
+
+    def _start_machine(self, unused_parent, attrs):
+        if self.machine:
+            return
+
+        self.machine['name'] = attrs.get('name', '')
+        self.machine['uuid'] = attrs.get('uuid', '').strip('{}')
+        self.info['name'] = self.machine['name']
+        self.info['uuid'] = self.machine['uuid']
+        self.info['ostype'] = attrs.get('OSType', '')
+        self.current = attrs.get('currentSnapshot', '').strip('{}')
+        # Of the runtime states, only a saved one is kept in settings
+        if attrs.get('stateFile', None):
+            self.info['vmstate'] = 'saved'
+
+    def _start_memory(self, parent, attrs):
+        if parent == 'Hardware':
+            self.info['memory'] = attrs.get('RAMSize', '')
+
+    def _start_order(self, parent, attrs):
+        if parent == 'Boot':
+            self.info['boot{0}'.format(attrs.get('position', ''))] = BOOT_DEVICES.get(attrs.get('device', ''), 'none')
+
+    def _start_disk(self, unused_parent, attrs):
+        self.disks[attrs.get('uuid', '')] = os.path.join(os.path.dirname(self.path), attrs.get('location', ''))
+
+    def _start_adapter(self, parent, attrs):
+        if parent != 'Network':
+            return
+
+        if attrs.get('enabled', 'false') != 'true':
+            self.adapter = None
+            return
+
+        self.adapter = int(attrs.get('slot', '0')) + 1
+        mac = attrs.get('MACAddress', None)
+        if mac:
+            self.info['macaddress{0}'.format(self.adapter)] = mac
+
+    def _start_nat(self, parent, unused_attrs):
+        if parent == 'Adapter' and self.adapter:
+            self.info['nic{0}'.format(self.adapter)] = 'nat'
+
+    def _start_forward(self, parent, attrs):
+        if parent != 'NAT' or self.stack[-3] != 'Adapter' or not self.adapter:
+            return
+
+        self.info['forwarding({0})'.format(self.forwards)] = ','.join([
+            attrs.get('name', ''),
+            PROTOCOLS.get(attrs.get('proto', '1'), 'tcp'),
+            attrs.get('hostip', ''),
+            attrs.get('hostport', ''),
+            attrs.get('guestip', ''),
+            attrs.get('guestport', ''),
+        ])
+        self.forwards += 1
+
+    def _start_controller(self, unused_parent, attrs):
+        self.controller = attrs.get('name', '')
+
+    def _start_device(self, unused_parent, attrs):
+        self.device = '{0}-{1}-{2}'.format(
+            self.controller, attrs.get('port', '0'), attrs.get('device', '0'),
+        ).lower()
+
+    def _start_image(self, parent, attrs):
+        if parent == 'AttachedDevice':
+            self.info[self.device] = self.disks.get(attrs.get('uuid', ''), attrs.get('uuid', ''))
+
+    def _start_snapshot(self, attrs):
+        """Add a snapshot under the same keys showvminfo uses, e.g. snapshotname-1-2."""
+        if self.snapshots:
+            self.snapshots[-1][1] += 1
+            key = '{0}-{1}'.format(self.snapshots[-1][0], self.snapshots[-1][1])
+        else:
+            key = 'snapshotname'
+        self.snapshots.append([key, 0])
+
+        snapshot_uuid = attrs.get('uuid', '').strip('{}')
+        self.info[key] = attrs.get('name', '')
+        self.info[key.replace('name', 'uuid', 1)] = snapshot_uuid
+        if snapshot_uuid == self.current:
+            self.info['currentsnapshotname'] = self.info[key]
+            self.info['currentsnapshotuuid'] = snapshot_uuid
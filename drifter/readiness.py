@@ -0,0 +1,85 @@
+"""Wait for machines to accept SSH connections.
+
+A forwarded SSH port usually accepts connections long before the guest's SSH
+server is up, since the provider is the one listening on it. So the port is
+polled for the server's banner first, which is cheap and fails fast, and a
+real SSH command, which takes a full handshake to fail, is only run once the
+banner shows up.
+"""
+from __future__ import absolute_import, division, print_function
+
+import logging
+import time
+
+from drifter.exceptions import GenericException
+from drifter.lazy import lazy_import
+
+# pylint: disable=invalid-name
+socket = lazy_import('socket')
+
+DEFAULT_TIMEOUT = 300
+
+# Delay between attempts, doubling from the minimum up to the maximum
+POLL_MIN = 0.05
+POLL_MAX = 1
+
+# Seconds to wait for a connection and the banner on each attempt
+CONNECT_TIMEOUT = 1
+
+# Servers may send other lines before the banner, but not many
+MAX_BANNER_BYTES = 4096
+
+
+def has_banner(host, port, timeout=CONNECT_TIMEOUT):
+    """Check if an SSH server answers on the given port."""
+    try:
+        conn = socket.create_connection((host, int(port)), timeout)
+    except (IOError, OSError, ValueError):
+        return False
+
+    data = b''
+    try:
+        conn.settimeout(timeout)
+        while len(data) < MAX_BANNER_BYTES:
+            chunk = conn.recv(1024)
+            if not chunk:
+                break
+            data += chunk
+            if any(line.startswith(b'SSH-') for line in data.split(b'\n')[:-1]):
+                return True
+    except (IOError, OSError):
+        pass
+    finally:
+        conn.close()
+
+    return False
+
+
+def wait_for_ssh(host, port, confirm, timeout=DEFAULT_TIMEOUT, checks=None):
+    """Wait until a machine accepts SSH connections.
+
+    Polls the port for an SSH banner, then runs the extra checks, if any, and
+    finally the confirm function, e.g. one that runs a command over SSH. The
+    checks and confirm function return whether the machine is ready. Raises
+    a GenericException if it isn't ready within the timeout.
+    """
+    deadline = time.time() + timeout
+    delay = POLL_MIN
+    attempts = 0
+    while True:
+        attempts += 1
+        remaining = deadline - time.time()
+        ready = has_banner(host, port, max(min(CONNECT_TIMEOUT, remaining), 0.01))
+        ready = ready and all(check() for check in checks or [])
+        if ready and confirm():
+            logging.debug('SSH is ready after %d attempts.', attempts)
+            return
+
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            raise GenericException('Timed out waiting for SSH on {0}:{1} after {2:g} seconds.'.format(
+                host, port, timeout,
+            ))
+
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, POLL_MAX)
@@ -0,0 +1,362 @@
+"""Index available commands and entry points without loading them."""
+from __future__ import absolute_import, division, print_function
+
+import importlib
+import logging
+import marshal
+import os
+import sys
+import zlib
+
+from drifter import cache
+from drifter.lazy import lazy_import
+from drifter.utils import write_atomic
+from drifter.version import __version__
+
+
+click = lazy_import('click')  # pylint: disable=invalid-name
+
+
+try:
+    from importlib.util import MAGIC_NUMBER
+except ImportError:
+    import imp
+    MAGIC_NUMBER = imp.get_magic()
+
+
+PYTHON_TAG = 'py{0}{1}'.format(*sys.version_info[:2])
+
+COMMANDS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'commands')
+
+ENTRY_POINT_GROUPS = ['drifter.plugins', 'drifter.providers', 'drifter.provisioners']
+
+_entry_points = None
+
+
+class CommandInfo(object):
+    """Indexed details about a command."""
+
+    def __init__(self, name, data):
+        """Set up the command details."""
+        self.name = name
+        self.help = data.get('help', None)
+        self.short_help = data.get('short_help', None)
+        self.hidden = data.get('hidden', False)
+        self.params = data.get('params', [])
+
+    def get_short_help_str(self, limit=45):
+        """Get the short help text, the same way click would."""
+        if self.short_help:
+            return self.short_help.strip()
+        if self.help:
+            return click.utils.make_default_short_help(self.help, limit).strip()
+
+        return ''
+
+
+class CommandRegistry(object):
+    """Index of the built-in commands.
+
+    The index holds the name, help text, and options of every command so
+    listing them doesn't require loading each one. It is stored in the cache
+    directory and rebuilt whenever a command file or the drifter version
+    changes. Compiled command code is cached as well. Each commands folder
+    gets its own cache, so installs of the same version don't share one.
+    """
+
+    def __init__(self, folder):
+        """Set up the registry for the given commands folder."""
+        self.folder = os.path.abspath(folder)
+        # Short and cheap to compute; only has to tell installs apart
+        self.cache_dir = '{0:08x}'.format(zlib.crc32(self.folder.encode('utf-8')) & 0xffffffff)
+        self.index = None
+
+    def names(self):
+        """Get the names of all indexed commands."""
+        return sorted(self._get_index().keys())
+
+    def get_info(self, name):
+        """Get the indexed details for a command."""
+        data = self.describe(name)
+        if data is None:
+            return None
+
+        return CommandInfo(name, data)
+
+    def describe(self, name):
+        """Get the raw indexed data for a command."""
+        return self._get_index().get(name, None)
+
+    def key(self):
+        """Get the key the index is cached under.
+
+        It changes whenever a command file or the drifter version changes.
+        """
+        return self._get_key(self._list_files())
+
+    def load(self, name):
+        """Load a command, compiling it only if the cached code is stale."""
+        cmd = name.replace('-', '_')
+        filename = os.path.join(self.folder, cmd + '.py')
+        if not os.path.isfile(filename):
+            return None
+
+        namespace = {}
+        # pylint: disable=eval-used
+        eval(self._get_code(filename), namespace, namespace)
+
+        if cmd in namespace:
+            return namespace[cmd]
+
+        cmd = cmd + '_command'
+        if cmd in namespace:
+            return namespace[cmd]
+
+        return None
+
+    def _get_index(self):
+        if self.index is not None:
+            return self.index
+
+        files = self._list_files()
+        key = self._get_key(files)
+        path = cache.get_cache_path('commands', self.cache_dir, 'index.json')
+
+        index = cache.load_json(path, key)
+        if index is None:
+            logging.debug('Rebuilding command index...')
+            index = self._build_index(files)
+            cache.save_json(path, key, index)
+
+        self.index = index
+
+        return index
+
+    def _build_index(self, files):
+        index = {}
+        for filename in files:
+            name = filename[:-3].replace('_', '-')
+            try:
+                command = self.load(name)
+            # A broken command, which could fail in any way, shouldn't hide the others
+            except Exception as e:  # noqa: B902 pylint: disable=broad-except
+                logging.debug('Unable to index command "%s": %s', name, e)
+                continue
+
+            if command is None:
+                continue
+
+            index[name] = describe_command(command)
+
+        return index
+
+    def _list_files(self):
+        files = []
+        for filename in os.listdir(self.folder):
+            if filename.endswith('.py') and not filename.startswith('__'):
+                files.append(filename)
+
+        files.sort()
+
+        return files
+
+    def _get_key(self, files):
+        parts = [__version__, PYTHON_TAG, self.folder]
+        for filename in files:
+            stat = os.stat(os.path.join(self.folder, filename))
+            parts.append('{0}:{1}:{2}'.format(filename, stat.st_mtime, stat.st_size))
+
+        return '\n'.join(parts)
+
+    def _get_code(self, filename):
+        stat = os.stat(filename)
+        header = (MAGIC_NUMBER, __version__, filename, stat.st_mtime, stat.st_size)
+        path = cache.get_cache_path(
+            'commands',
+            self.cache_dir,
+            '{0}.{1}.code'.format(os.path.basename(filename)[:-3], PYTHON_TAG),
+        )
+
+        try:
+            with open(path, 'rb') as handle:
+                data = marshal.loads(handle.read())
+            if data[:5] == header:
+                return data[5]
+        except (IOError, OSError, EOFError, ValueError, TypeError, IndexError):
+            pass
+
+        with open(filename) as handle:
+            code = compile(handle.read(), filename, 'exec')
+
+        try:
+            write_atomic(path, marshal.dumps(header + (code,)))
+        except (IOError, OSError) as e:
+            logging.debug('Unable to cache compiled command "%s": %s', filename, e)
+
+        return code
+
+
+def describe_command(command):
+    """Describe a command and its parameters so it can be indexed.
+
+    Sub-commands of a group are described as well.
+    """
+    data = {
+        'help': command.help,
+        'short_help': command.short_help,
+        'hidden': command.hidden,
+        'params': [_describe_param(param) for param in command.params],
+    }
+
+    subcommands = getattr(command, 'commands', None)
+    if isinstance(subcommands, dict):
+        data['commands'] = dict(
+            (name, describe_command(subcommand)) for name, subcommand in subcommands.items()
+        )
+
+    return data
+
+
+def _describe_param(param):
+    choices = getattr(param.type, 'choices', None)
+
+    return {
+        'name': param.name,
+        'type': param.param_type_name,
+        'opts': list(param.opts) + list(param.secondary_opts),
+        'is_flag': getattr(param, 'is_flag', False),
+        'help': getattr(param, 'help', None),
+        'choices': list(choices) if choices else None,
+    }
+
+
+class EntryPoint(object):
+    """An entry point that is only imported when loaded."""
+
+    def __init__(self, name, value):
+        """Set up the entry point, e.g. value of "package.module:attr"."""
+        self.name = name
+        self.value = value
+        self.loaded = None
+
+    def load(self):
+        """Import the entry point and return the object it refers to."""
+        if self.loaded is not None:
+            return self.loaded
+
+        module, _, attrs = self.value.split('[')[0].partition(':')
+        loaded = importlib.import_module(module.strip())
+        for attr in attrs.strip().split('.'):
+            if attr:
+                loaded = getattr(loaded, attr)
+
+        self.loaded = loaded
+
+        return loaded
+
+
+def get_entry_points(group):
+    """Get the entry points registered for a group.
+
+    Installed distributions are only scanned when they change; otherwise the
+    entry points come from the cache. Either way, they are only looked up once
+    per process.
+    """
+    global _entry_points  # pylint: disable=global-statement
+
+    if _entry_points is None:
+        key = get_distributions_key()
+        path = cache.get_cache_path('entry_points.json')
+
+        data = cache.load_json(path, key)
+        if data is None:
+            logging.debug('Scanning for entry points...')
+            data = _scan_entry_points()
+            cache.save_json(path, key, data)
+
+        _entry_points = {}
+        for name in ENTRY_POINT_GROUPS:
+            _entry_points[name] = dict(
+                (entry[0], EntryPoint(entry[0], entry[1])) for entry in data.get(name, [])
+            )
+
+    return dict(_entry_points.get(group, {}))
+
+
+def get_distributions_key():
+    """Fingerprint the set of installed distributions.
+
+    Installing, removing, or upgrading a package changes the metadata
+    directories found on the path, which changes the fingerprint. So does
+    rewriting a package's entry_points.txt in place, e.g. re-running egg_info
+    for an editable install, which leaves its directory untouched.
+    """
+    parts = [PYTHON_TAG]
+    for folder in sys.path:
+        folder = folder or os.curdir
+        try:
+            names = os.listdir(folder)
+        except (IOError, OSError):
+            continue
+
+        for name in sorted(names):
+            if not name.endswith(('.dist-info', '.egg-info', '.egg-link', '.pth')):
+                continue
+            path = os.path.join(os.path.abspath(folder), name)
+            try:
+                mtime = os.stat(path).st_mtime
+            except (IOError, OSError):
+                continue
+            parts.append('{0}:{1}'.format(path, mtime))
+            parts.append(_get_entry_points_stamp(path))
+
+    return '\n'.join(parts)
+
+
+def _get_entry_points_stamp(path):
+    """Get the mtime and size of a distribution's entry_points.txt, if it has one."""
+    try:
+        stat = os.stat(os.path.join(path, 'entry_points.txt'))
+    except (IOError, OSError):
+        return ''
+
+    return '{0}:{1}'.format(stat.st_mtime, stat.st_size)
+
+
+def _scan_entry_points():
+    data = {}
+    for group, name, value in _iter_entry_points():
+        if group not in ENTRY_POINT_GROUPS:
+            continue
+
+        entries = data.setdefault(group, [])
+        # The first distribution on the path wins, same as pkg_resources
+        if name not in [entry[0] for entry in entries]:
+            entries.append([name, value])
+
+    return data
+
+
+def _iter_entry_points():
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    if metadata is None:
+        from pkg_resources import iter_entry_points
+        for group in ENTRY_POINT_GROUPS:
+            for entry_point in iter_entry_points(group):
+                yield (group, entry_point.name, str(entry_point).split('=', 1)[1].strip())
+        return
+
+    entry_points = metadata.entry_points()
+    if isinstance(entry_points, dict):
+        # Python < 3.10 groups the entry points itself
+        for group in ENTRY_POINT_GROUPS:
+            for entry_point in entry_points.get(group, []):
+                yield (group, entry_point.name, entry_point.value)
+        return
+
+    for entry_point in entry_points:
+        yield (entry_point.group, entry_point.name, entry_point.value)
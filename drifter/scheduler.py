@@ -0,0 +1,188 @@
+"""Start machines only when the host has room for them.
+
+Booting machines all at once makes them fight over the host's memory and
+CPU, which slows every one of them down. While a scheduler is active,
+machines wait for a boot slot, which is given out once the host has enough
+free memory for the machine and isn't too busy. Waiting machines are let
+through by priority, then in the order they asked.
+
+Memory and load are read from /proc. Where it isn't available, slots are
+given out right away.
+"""
+from __future__ import absolute_import, division, print_function
+
+import io
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from drifter.lazy import lazy_import
+
+# pylint: disable=invalid-name
+multiprocessing = lazy_import('multiprocessing')
+
+MEMINFO_FILE = '/proc/meminfo'
+LOADAVG_FILE = '/proc/loadavg'
+
+# Megabytes of memory to leave free for the host
+DEFAULT_RESERVE_MEMORY = 512
+
+# Highest load average per CPU at which machines may start booting
+DEFAULT_MAX_LOAD = 1.0
+
+# Seconds a started machine's memory is still counted as taken, since the
+# guest only uses it gradually while booting
+DEFAULT_SETTLE_TIME = 15
+
+# Seconds between checks of the host's resources while machines wait
+POLL_INTERVAL = 1
+
+# Seconds between reports on the machines still waiting
+REPORT_INTERVAL = 10
+
+# The scheduler boot slots come from, if any
+_active = None
+
+
+def get_free_memory():
+    """Get the memory available to new processes, in megabytes, or None if unknown."""
+    values = {}
+    try:
+        with io.open(MEMINFO_FILE, 'r', encoding='utf-8') as handle:
+            for line in handle:
+                key, _, value = line.partition(':')
+                values[key] = value.split()
+    except (IOError, OSError):
+        return None
+
+    try:
+        if 'MemAvailable' in values:
+            return int(values['MemAvailable'][0]) // 1024
+
+        # Older kernels don't estimate it
+        return sum(int(values[key][0]) for key in ['MemFree', 'Buffers', 'Cached']) // 1024
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def get_load():
+    """Get the one minute load average per CPU, or None if unknown."""
+    try:
+        with io.open(LOADAVG_FILE, 'r', encoding='utf-8') as handle:
+            load = float(handle.read().split()[0])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+
+    try:
+        cpus = multiprocessing.cpu_count()
+    except NotImplementedError:
+        cpus = 1
+
+    return load / max(cpus, 1)
+
+
+class BootScheduler(object):
+    """Give out boot slots while the host has room for more machines."""
+
+    def __init__(self, priorities=None, reserve_memory=DEFAULT_RESERVE_MEMORY, max_load=DEFAULT_MAX_LOAD,
+                 settle_time=DEFAULT_SETTLE_TIME):
+        """Set up the scheduler, with the priority of each machine."""
+        self.priorities = priorities or {}
+        self.reserve_memory = int(reserve_memory)
+        self.max_load = float(max_load)
+        self.settle_time = settle_time
+        self.condition = threading.Condition()
+        # Waiting machines as [priority, order, name], and the memory of starting ones
+        self.queue = []
+        self.booting = {}
+        self.settling = []
+        self.counter = 0
+
+    @contextmanager
+    def slot(self, name, memory):
+        """Wait until a machine needing the given megabytes of memory may boot."""
+        self._acquire(name, int(memory))
+        try:
+            yield
+        finally:
+            self._release(name)
+
+    def _acquire(self, name, memory):
+        started = time.time()
+        reported = None
+        with self.condition:
+            self.counter += 1
+            entry = [-int(self.priorities.get(name, 0) or 0), self.counter, name]
+            self.queue.append(entry)
+            self.queue.sort()
+            try:
+                while True:
+                    reason = self._get_wait_reason(entry, memory)
+                    if not reason:
+                        break
+
+                    if reported is None or time.time() - reported >= REPORT_INTERVAL:
+                        logging.info('==> Waiting to boot (%s; %d of %d in queue)...',
+                                     reason, self.queue.index(entry) + 1, len(self.queue))
+                        reported = time.time()
+                    self.condition.wait(POLL_INTERVAL)
+            finally:
+                self.queue.remove(entry)
+                self.condition.notify_all()
+
+            self.booting[name] = memory
+
+        if reported is not None:
+            logging.info('==> Booting after waiting %d seconds.', time.time() - started)
+
+    def _release(self, name):
+        with self.condition:
+            memory = self.booting.pop(name, 0)
+            self.settling.append((time.time() + self.settle_time, memory))
+            self.condition.notify_all()
+
+    def _get_wait_reason(self, entry, memory):
+        """Get why a machine can't boot yet, or None if it can."""
+        if self.queue[0] is not entry:
+            return 'machines ahead in the queue go first'
+
+        now = time.time()
+        self.settling = [(until, size) for until, size in self.settling if until > now]
+        taken = sum(self.booting.values()) + sum(size for _, size in self.settling)
+        if not taken:
+            # Nothing else is using resources, so waiting won't free any up
+            return None
+
+        free = get_free_memory()
+        if free is not None and free - taken - memory < self.reserve_memory:
+            return '{0}MB of memory needed, {1}MB free'.format(memory, max(free - taken, 0))
+
+        load = get_load()
+        if load is not None and load >= self.max_load:
+            return 'host load is {0:.2f} per CPU'.format(load)
+
+        return None
+
+
+@contextmanager
+def scheduling(scheduler):
+    """Take boot slots from the given scheduler while active."""
+    global _active  # pylint: disable=global-statement
+    previous, _active = _active, scheduler
+    try:
+        yield scheduler
+    finally:
+        _active = previous
+
+
+@contextmanager
+def boot_slot(name, memory):
+    """Wait for a slot to boot a machine in, if a scheduler is active."""
+    scheduler = _active
+    if scheduler is None:
+        yield
+        return
+
+    with scheduler.slot(name, memory):
+        yield
@@ -1,11 +1,36 @@
 """Utility functions."""
 from __future__ import absolute_import, division, print_function
 
-import subprocess
+import errno
+import logging
+import os
+from contextlib import contextmanager
+
+from drifter import parallel
+from drifter.lazy import lazy_import
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# pylint: disable=invalid-name
+subprocess = lazy_import('subprocess')
+tempfile = lazy_import('tempfile')
 
 
 def get_cli(cmd, output=False):
     """Execute a command and return the response."""
+    # Commands run for several machines at once would mix their output, so
+    # it's logged a line at a time instead, prefixed by the machine's name
+    if output and parallel.get_label():
+        response, code = get_cli(cmd)
+        for line in (response or '').splitlines():
+            logging.info(line)
+
+        return (None, code)
+
     command = cmd
     if isinstance(cmd, list):
         command = map(str, command)
@@ -27,3 +52,60 @@ def get_cli(cmd, output=False):
         response = result[0].strip().decode('utf-8')
 
     return (response, int(process.returncode))
+
+
+def ensure_dir(path):
+    """Create a directory (and its parents) if it doesn't already exist."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def write_atomic(path, data, sync=False):
+    """Write bytes to a file so readers never see a partially written file.
+
+    The data is written to a temporary file in the same directory and then
+    renamed over the target. With ``sync`` the data is flushed to disk first.
+    """
+    folder = os.path.dirname(path) or os.curdir
+    ensure_dir(folder)
+
+    mode = 0o644
+    if os.path.exists(path):
+        mode = os.stat(path).st_mode & 0o777
+
+    handle, temp_path = tempfile.mkstemp(dir=folder, prefix='.{0}.'.format(os.path.basename(path)))
+    replaced = False
+    try:
+        with os.fdopen(handle, 'wb') as temp:
+            temp.write(data)
+            if sync:
+                temp.flush()
+                os.fsync(temp.fileno())
+        os.chmod(temp_path, mode)
+        getattr(os, 'replace', os.rename)(temp_path, path)
+        replaced = True
+    finally:
+        if not replaced and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a file for the duration of the block.
+
+    The lock is advisory, so it only keeps out other processes that use this
+    function. Where file locking isn't available, nothing is locked.
+    """
+    ensure_dir(os.path.dirname(path) or os.curdir)
+
+    with open(path, 'a') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
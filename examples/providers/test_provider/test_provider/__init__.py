@@ -13,10 +13,15 @@ import click
 import drifter.commands
 import drifter.commands.provision as base_provision
 import drifter.commands.rsync as base_rsync
-import drifter.commands.rsync_auto as base_rsync_auto
 import drifter.commands.ssh as base_ssh
 import drifter.providers
 from drifter.exceptions import ProviderException
+from drifter.lazy import lazy_import
+
+
+# Heavy modules should only be imported by the commands that need them.
+# Here, watchdog is only loaded when rsync-auto is actually used.
+base_rsync_auto = lazy_import('drifter.commands.rsync_auto')
 
 
 PROVIDER_NAME = 'my-provider'